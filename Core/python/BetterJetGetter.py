@@ -2,32 +2,70 @@ import BaseGetter
 import ROOT
 ROOT.gROOT.SetBatch(True)
 
-class JetEntry:
-    def __init__(self, jet):
-        self.jet = jet
-        self.cache = {}
+# Jet properties of a single event (and variation) kept as python lists,
+# one list per branch. Branches are read on first use only - e.g. genpt
+# is never touched when running on data
+class JetCollection(object):
+    __slots__ = ("chain", "branchPrefix", "variation", "columns", "size", "jets")
+
+    def __init__(self, chain, branchPrefix, variation):
+        self.chain = chain
+        self.branchPrefix = branchPrefix
+        self.variation = variation
+        self.columns = {}
+        self.size = len(self.column("pt"))
+        self.jets = [None]*self.size
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns[name] = list(getattr(self.chain, self.branchPrefix + name + self.variation))
+        return self.columns[name]
+
+    def __len__(self):
+        return self.size
+
+    # views are created once, so p4 build for a jet is reused by all users
+    def __getitem__(self, index):
+        jet = self.jets[index]
+        if jet == None:
+            jet = JetEntry(self, index)
+            self.jets[index] = jet
+        return jet
+
+    def __iter__(self):
+        index = 0
+        while index < self.size:
+            yield self[index]
+            index += 1
+
+# Lightweight view of a single jet from JetCollection. P4 is build on demand
+class JetEntry(object):
+    __slots__ = ("col", "index", "p4cache")
+
+    def __init__(self, col, index):
+        self.col = col
+        self.index = index
+        self.p4cache = None
 
     def pt(self):
-        return self.jet.pt
+        return self.col.column("pt")[self.index]
 
     def eta(self):
-        return self.jet.eta
+        return self.col.column("eta")[self.index]
 
     def phi(self):
-        return self.jet.phi
+        return self.col.column("phi")[self.index]
 
     def p4(self):
-        if "p4" in self.cache:
-            return self.cache["p4"]
-        ret = ROOT.reco.Candidate.PolarLorentzVector(self.jet.pt, self.jet.eta, self.jet.phi, 0)
-        self.cache["p4"] = ret
-        return ret
+        if self.p4cache == None:
+            self.p4cache = ROOT.reco.Candidate.PolarLorentzVector(self.pt(), self.eta(), self.phi(), 0)
+        return self.p4cache
 
     def jetid(self):
-        return self.jet.jetid
+        return self.col.column("jetid")[self.index]
 
     def genP4(self):
-        return self.jet.genpt
+        return self.col.column("genpt")[self.index]
 
     '''
     # FIXME: entries from two different events can be equal
@@ -54,16 +92,48 @@ class BetterJetGetter(BaseGetter.BaseGetter):
         #self.dphiHelper = ROOT.Math.VectorUtil.DeltaPhi
         #self.drHelper = ROOT.Math.VectorUtil.DeltaR
 
+    # collections (and filtered lists) are cached until the next newEvent call,
+    # so asking for the same variation several times per event reads branches once
+    def newEvent(self, chain):
+        BaseGetter.BaseGetter.newEvent(self, chain)
+        self.collections = {}
+        self.filtered = {}
+
     def getSize(self):
         return getattr(self.chain, self.srcBranch).size()
-    
+
+    # same variation naming as in BaseGetter.get
+    def getVariationSuffix(self, variation):
+        if variation not in self.knownVariations:   # variation of a different kind, e.g. from PU
+            return ""
+
+        if variation == "_central":
+            return ""
+
+        return variation
+
+    def getCollection(self, variation=""):
+        suffix = self.getVariationSuffix(variation)
+        if suffix not in self.collections:
+            self.collections[suffix] = JetCollection(self.chain, self.branchPrefix, suffix)
+        return self.collections[suffix]
+
+    # list of jets with pt > ptMin, |eta| < etaMax (and passing jet id). Returned
+    # list is shared between callers - do not modify it
+    def getFiltered(self, variation, ptMin, etaMax, requireId = True):
+        key = (self.getVariationSuffix(variation), ptMin, etaMax, requireId)
+        if key not in self.filtered:
+            col = self.getCollection(variation)
+            pt = col.column("pt")
+            eta = col.column("eta")
+            jetid = col.column("jetid") if requireId else None
+            self.filtered[key] = [col[i] for i in xrange(len(col)) \
+                                    if pt[i] > ptMin and abs(eta[i]) < etaMax and (not requireId or jetid[i])]
+        return self.filtered[key]
+
     def get(self, variation=""):
-        for j in BaseGetter.BaseGetter.get(self, variation):
-            je = JetEntry(j)
-            yield je
+        return iter(self.getCollection(variation))
 
 
     #def pt(self):
     #    return self.pt
-
-
@@ -0,0 +1,63 @@
+import fnmatch
+
+# Stands in for the tree seen by the analyzer (self.fChain) when branch pruning
+# is enabled in ExampleProofReader. All calls are forwarded to the real tree.
+#
+#  - recording phase: names of all branches accessed are remembered
+#  - pruning phase: only whitelisted branches are read by GetEntry. If a branch
+#    outside the whitelist is accessed (e.g. one that was not touched during
+#    recording) it is enabled and read for the current entry, so the analyzer
+#    never sees stale values
+class BranchAccessRecorder:
+    def __init__(self, getChain, whitelist = None, record = False):
+        self.getChain = getChain
+        self.patterns = whitelist or []
+        self.recording = record
+        self.requested = set()
+        self.enabled = set()
+        self.branchNames = None
+
+    def newTree(self):
+        self.branchNames = None
+
+    def getBranchNames(self, chain):
+        if self.branchNames == None:
+            self.branchNames = set(b.GetName() for b in chain.GetListOfBranches())
+        return self.branchNames
+
+    def __getattr__(self, name):
+        chain = self.getChain()
+        if name in self.getBranchNames(chain):
+            if self.recording:
+                self.requested.add(name)
+            elif name not in self.enabled:
+                self.enableLate(chain, name)
+        return getattr(chain, name)
+
+    def enableLate(self, chain, name):
+        print "BranchAccessRecorder: branch", name, "not on the whitelist. Enabling"
+        self.enabled.add(name)
+        chain.SetBranchStatus(name, 1)
+        tree = chain.GetTree()
+        tree.GetBranch(name).GetEntry(tree.GetReadEntry())
+
+    def stopRecording(self):
+        self.recording = False
+
+    def usedBranches(self):
+        return sorted(self.requested)
+
+    # Enables only branches requested so far (or matching the whitelist). Note:
+    # needs to be repeated each time a new tree is loaded
+    def apply(self):
+        if self.recording: return
+        chain = self.getChain()
+        names = self.getBranchNames(chain)
+        self.enabled = set(self.requested)
+        for p in self.patterns:
+            self.enabled.update(fnmatch.filter(names, p))
+
+        chain.SetBranchStatus("*", 0)
+        for b in self.enabled:
+            if b in names:
+                chain.SetBranchStatus(b, 1)
@@ -0,0 +1,93 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import numpy
+
+# Reads a range of entries of a tree into numpy arrays. Branches are evaluated
+# with TTree::Draw (ie in compiled code), so there is no python/PyROOT call
+# per event or per branch element.
+#
+# Returned dictionary (key - branch name):
+#   scalar branches (Float_t, Int_t, Double_t,...) - 1d array of length nEntries
+#   std::vector<float>/<int> branches (see EventViewBase::registerVecFloat/registerVecInt)
+#       - tuple (values, offsets). Values of entry i are values[offsets[i]:offsets[i+1]],
+#         offsets has nEntries+1 elements
+#
+# Note: P4 vector branches (registerVecP4) are not supported. Split them
+#       into pt/eta/phi float vectors, if you need them in batch mode
+class ColumnarReader:
+    scalarTypes = {"Float_t":numpy.float32, "Double_t":numpy.float64,
+                   "Int_t":numpy.int32, "UInt_t":numpy.uint32,
+                   "Long64_t":numpy.int64, "Bool_t":numpy.bool_}
+    vectorTypes = {"vector<float>":numpy.float32, "vector<double>":numpy.float64,
+                   "vector<int>":numpy.int32, "vector<unsigned int>":numpy.uint32}
+
+    def __init__(self, branches = None):
+        self.requestedBranches = branches
+        self.treeKey = None
+        self.branchTypes = None
+
+    def getBranchTypes(self, tree):
+        ret = {}
+        for b in tree.GetListOfBranches():
+            name = b.GetName()
+            if self.requestedBranches != None and name not in self.requestedBranches:
+                continue
+            typeName = b.GetClassName().replace(" ","")
+            if typeName in self.vectorTypes:
+                ret[name] = (True, self.vectorTypes[typeName])
+                continue
+            leaves = b.GetListOfLeaves()
+            if leaves.GetEntries() != 1: continue
+            typeName = leaves.At(0).GetTypeName()
+            if typeName in self.scalarTypes:
+                ret[name] = (False, self.scalarTypes[typeName])
+
+        if self.requestedBranches != None:
+            missing = set(self.requestedBranches)-set(ret.keys())
+            if missing:
+                raise Exception("ColumnarReader: branches not found or of unsupported type: "+", ".join(sorted(missing)))
+        return ret
+
+    def drawToArray(self, tree, expression, nEntries, firstEntry, selection = ""):
+        rows = tree.Draw(expression, selection, "goff", nEntries, firstEntry)
+        if rows < 0:
+            raise Exception("ColumnarReader: cannot evaluate "+expression)
+        rows = tree.GetSelectedRows()
+        if rows == 0:
+            return numpy.zeros(0), numpy.zeros(0)
+        v1 = numpy.frombuffer(tree.GetV1(), dtype=numpy.float64, count=rows).copy()
+        v2 = None
+        if tree.GetV2():
+            v2 = numpy.frombuffer(tree.GetV2(), dtype=numpy.float64, count=rows).copy()
+        return v1, v2
+
+    def read(self, tree, firstEntry, nEntries):
+        # branch types are determined once per tree (ie once per file)
+        treeKey = (tree.GetCurrentFile().GetName(), tree.GetName())
+        if treeKey != self.treeKey:
+            self.treeKey = treeKey
+            self.branchTypes = self.getBranchTypes(tree)
+
+        # enough space for every element of the vector branches
+        tree.SetEstimate(-1)
+
+        ret = {}
+        for name in self.branchTypes:
+            isVector, dtype = self.branchTypes[name]
+            if not isVector:
+                values, dummy = self.drawToArray(tree, name, nEntries, firstEntry)
+                if len(values) != nEntries:
+                    raise Exception("ColumnarReader: unexpected number of rows for "+name)
+                ret[name] = values.astype(dtype)
+            else:
+                values, entries = self.drawToArray(tree, name+":Entry$", nEntries, firstEntry)
+                counts = numpy.zeros(nEntries, dtype=numpy.int64)
+                if len(values) > 0:
+                    counts = numpy.bincount(entries.astype(numpy.int64)-firstEntry, minlength=nEntries)
+                offsets = numpy.zeros(nEntries+1, dtype=numpy.int64)
+                numpy.cumsum(counts, out=offsets[1:])
+                ret[name] = (values.astype(dtype), offsets)
+
+        ret["nEntries"] = nEntries
+        return ret
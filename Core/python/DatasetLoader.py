@@ -0,0 +1,196 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import os
+from CommonFSQFramework.Core.SelectionCache import SelectionCache
+from CommonFSQFramework.Core.ColumnarReader import ColumnarReader
+
+# Builds RooDataSets from trees stored in per-sample directories of a single
+# file (infile:/sampleName/data, as produced by the tree producers).
+#
+# Trees of all requested samples are read through a TChain - there is no
+# merged copy of the trees (TTree::MergeTrees + /tmp/dummy.root). Every
+# branch becomes a RooRealVar. Variables are created with infinite range, so
+# the input is read in a single pass; ranges (min/max with the same margins
+# as before) are then set from the minima/maxima over the full trees, also
+# when a cut is given (collected by fillDataset in the same pass, or taken from
+# the selection cache), i.e. they do not depend on the cut.
+#
+# The dataset (vector store) is filled by fillDataset from DatasetFiller.C.
+# The RooDataSet(TTree*) constructor would load the values into a temporary
+# RooTreeDataStore first (a second in-memory copy of the data) and convert it
+# to the vector store afterwards.
+#
+# Note: cut given to getDataset is evaluated with TTreeFormula, i.e. it should
+# be given in the TTree::Draw syntax.
+#
+# With cacheSelections=True the cut is evaluated with the help of
+# SelectionCache (entry lists stored in infile_selections.root). The entry
+# lists are attached to the chain, so only entries passing the cut are read
+# (no copy of the selected entries is made), on repeated runs the cut is not
+# evaluated again. Ranges of the full trees are cached as well.
+#
+# getArrays reads given branches of the same chain (and entry list) column-wise
+# into numpy arrays (TTree::Draw, see ColumnarReader), without building a
+# dataset - e.g. for repeated reweighing in a fit.
+#
+# Usage:
+#   loader = DatasetLoader("treeDiJetBalance.root")
+#   ds, vars = loader.getDataset("MC_jet15", loader.getSamples(), "weight")
+class DatasetLoader:
+    def __init__(self, infile, treeName = "data", cacheSelections = False):
+        self.infile = infile
+        self.treeName = treeName
+        self.entries = {}
+        if not hasattr(ROOT, "fillDataset"):
+            ROOT.gROOT.LoadMacro(os.path.dirname(os.path.realpath(__file__))+"/DatasetFiller.C+")
+        self.selectionCache = None
+        if cacheSelections:
+            self.selectionCache = SelectionCache(os.path.splitext(infile)[0] + "_selections.root")
+
+        f = ROOT.TFile(infile, "r")
+        if not f or f.IsZombie():
+            raise Exception("DatasetLoader: cannot open " + infile)
+        for l in f.GetListOfKeys():
+            currentDir = l.ReadObj()
+            if not currentDir:
+                print "Problem reading", l.GetName(), " - skipping"
+                continue
+            if type(currentDir) != ROOT.TDirectoryFile:
+                print "Expected TDirectoryFile,", type(currentDir), "found"
+                continue
+            tree = currentDir.Get(treeName)
+            if not tree:
+                print "No", treeName, "tree in", l.GetName(), " - skipping"
+                continue
+            self.entries[l.GetName()] = tree.GetEntries()
+        f.Close()
+
+    def getSamples(self):
+        return sorted(self.entries.keys())
+
+    def getEntries(self, sampleName):
+        return self.entries[sampleName]
+
+    def getChain(self, samples):
+        missing = [s for s in samples if s not in self.entries]
+        if missing:
+            raise Exception("DatasetLoader: samples not found in " + self.infile + ": " + " ".join(missing))
+        chain = ROOT.TChain(self.treeName)
+        for s in samples:
+            chain.Add(self.infile + "/" + s + "/" + self.treeName)
+        return chain
+
+    def getBranches(self, samples):
+        chain = self.getChain(samples)
+        if chain.LoadTree(0) < 0:
+            return []
+        return [b.GetName() for b in chain.GetListOfBranches()]
+
+    # Attaches entries of the samples passing the cut to the chain (entry list
+    # with one sub-list per sample tree, taken from the selection cache).
+    # Returns the entry list (to be kept alive as long as the chain is used)
+    # and ranges of the branches over the full trees (also cached)
+    def selectEntries(self, chain, samples, cut):
+        fingerprint = SelectionCache.getFingerprint([self.infile])
+        curPath = ROOT.gDirectory.GetPath()
+        ROOT.gROOT.cd()
+        elist = ROOT.TEntryList()
+        elist.SetDirectory(0)
+        ranges = {}
+        f = ROOT.TFile(self.infile, "r")
+        try:
+            for s in samples:
+                treePath = s + "/" + self.treeName
+                tree = f.Get(treePath)
+                sampleList = self.selectionCache.getEntryList(tree, treePath, fingerprint, cut)
+                print "  ", s, "entries passing the selection:", sampleList.GetN(), "/", tree.GetEntries()
+                elist.Add(sampleList)
+                for name, r in self.selectionCache.getRanges(tree, treePath, fingerprint).iteritems():
+                    if name in ranges:
+                        r = (min(r[0], ranges[name][0]), max(r[1], ranges[name][1]))
+                    ranges[name] = r
+        finally:
+            f.Close()
+            ROOT.gDirectory.cd(curPath)
+        chain.SetEntryList(elist)
+        return elist, ranges
+
+    # Returns (ds, vars), vars - dictionary branch name -> RooRealVar. Note:
+    # variables have to be kept alive as long as the dataset is used
+    def getDataset(self, name, samples, weight = None, cut = ""):
+        chain = self.getChain(samples)
+        if chain.LoadTree(0) < 0:
+            raise Exception("DatasetLoader: no entries for " + name)
+        ranges = None
+        if cut and self.selectionCache != None:
+            elist, ranges = self.selectEntries(chain, samples, cut)
+            cut = ""
+
+        vars = {}
+        names = []
+        observables = ROOT.RooArgSet()
+        inf = ROOT.RooNumber.infinity()
+        for b in chain.GetListOfBranches():
+            branchName = b.GetName()
+            vars[branchName] = ROOT.RooRealVar(branchName, branchName, -inf, inf, "")
+            observables.add(vars[branchName])
+            names.append(branchName)
+
+        # vector store, filled directly (see DatasetFiller.C)
+        curPath = ROOT.gDirectory.GetPath()
+        storageType = ROOT.RooAbsData.getDefaultStorageType()
+        ROOT.RooAbsData.setDefaultStorageType(ROOT.RooAbsData.Vector)
+        ROOT.gROOT.cd()
+        try:
+            if weight == None:
+                ds = ROOT.RooDataSet(name, name, observables)
+            else:
+                ds = ROOT.RooDataSet(name, name, observables, ROOT.RooFit.WeightVar(weight))
+        finally:
+            ROOT.RooAbsData.setDefaultStorageType(storageType)
+            ROOT.gDirectory.cd(curPath)
+        minima, maxima = ROOT.std.vector('double')(), ROOT.std.vector('double')()
+        if ROOT.fillDataset(ds, chain, observables, cut, weight or "", minima, maxima) < 0:
+            raise Exception("DatasetLoader: cannot evaluate cut/weight for " + name + ": " + cut + " " + str(weight))
+        chain.SetEntryList(0)
+
+        # ranges over the full trees: from the selection cache (entry list
+        # attached, only selected entries read) or collected by fillDataset
+        # (all entries read, also those failing the cut)
+        if ranges == None:
+            ranges = dict(zip(names, zip(minima, maxima)))
+        for branchName, v in vars.iteritems():
+            self.setRange(v, ranges[branchName][0], ranges[branchName][1])
+        return ds, vars
+
+    # Returns dictionary branch name -> numpy array with values of the given
+    # (scalar) branches for entries of the samples passing the cut
+    def getArrays(self, samples, names, cut = ""):
+        import numpy
+        chain = self.getChain(samples)
+        if chain.LoadTree(0) < 0:
+            return dict((n, numpy.zeros(0)) for n in names)
+        if cut and self.selectionCache != None:
+            elist, ranges = self.selectEntries(chain, samples, cut)
+            cut = ""
+
+        reader = ColumnarReader()
+        chain.SetEstimate(-1)
+        ret = {}
+        try:
+            for n in names:
+                ret[n] = reader.drawToArray(chain, n, chain.GetEntries(), 0, cut)[0]
+        finally:
+            chain.SetEntryList(0)
+        if len(set(len(a) for a in ret.values())) > 1:
+            raise Exception("DatasetLoader: not a scalar branch in " + " ".join(names))
+        return ret
+
+    @staticmethod
+    def setRange(v, rmin, rmax):
+        if rmin > rmax:
+            return # no entries
+        rmin = rmin-abs(rmin/100.)
+        rmax = rmax+abs(rmin/100.)
+        v.setRange(rmin, rmax)
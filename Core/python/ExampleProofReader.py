@@ -43,7 +43,7 @@
 #
 ###############################################################################
 
-import sys, os, time, traceback
+import sys, os, time, traceback, hashlib
 sys.path.append(os.path.dirname(__file__))
 import ROOT
 ROOT.gROOT.SetBatch(True)
@@ -52,6 +52,9 @@ from array import *
 
 from CommonFSQFramework.Core.GetDatasetInfo import getTreeFilesAndNormalizations
 import CommonFSQFramework.Core.Util
+from CommonFSQFramework.Core.ColumnarReader import ColumnarReader
+from CommonFSQFramework.Core.BranchAccessRecorder import BranchAccessRecorder
+from CommonFSQFramework.Core.Executors import ProofExecutor
 
 
 # please note that python selector class name (here: ExampleProofReader) 
@@ -74,13 +77,35 @@ class ExampleProofReader( ROOT.TPySelector ):
             raise Exception(err)
         return spl[0]
 
+    # Parameters are shipped to workers as TNamed objects in the input list
+    # (see TProof::SetParameter), values encoded as "value;;;type"
+    @classmethod
+    def encodeSlaveParameters(cls, slaveParameters):
+        supportedTypes = set(["int", "str", "float", "bool"])
+        ret = {}
+        for p in slaveParameters:
+            # Check if parameter is supported. Adding another type is easy - see
+            #       getVariables method
+            paramType = slaveParameters[p].__class__.__name__
+            if paramType not in supportedTypes:
+                raise Exception("Parameter of type "+paramType \
+                      + " is not of currently supported types: " + ", ".join(supportedTypes) )
+            ret[cls.encodeEnvString(p)] = str(slaveParameters[p])+";;;"+paramType
+        ret[cls.encodeEnvString("VariablesToFetch")] = ",".join(slaveParameters.keys())
+        return ret
+
+    def getParameter(self, name):
+        obj = self.GetInputList().FindObject(self.encodeEnvString(name))
+        if not obj:
+            raise Exception("Parameter not found in the input list: "+name)
+        return obj.GetTitle()
+
     def getVariables(self):
-        #self.dsName = ROOT.gSystem.Getenv("TMFDatasetName")
-        variablesToFetch = ROOT.gSystem.Getenv(self.encodeEnvString("VariablesToFetch") )
+        variablesToFetch = self.getParameter("VariablesToFetch")
         #print variablesToFetch
         split = variablesToFetch.split(",")
         for s in split:
-            attrRaw = ROOT.gSystem.Getenv(self.encodeEnvString(s))
+            attrRaw = self.getParameter(s)
             #print s, attr
             attrSpl = attrRaw.split(";;;")
             print s, attrSpl
@@ -105,6 +130,47 @@ class ExampleProofReader( ROOT.TPySelector ):
             
         #print "XXX1", self.YODA, self.LUKE, self.VADER, self.LEIA, self.LEIA2
 
+    # With branch pruning enabled the analyzer sees the tree through 
+    # BranchAccessRecorder (see setupBranchPruning)
+    def getRealChain(self):
+        return ROOT.TPySelector.fChain.__get__(self, ROOT.TPySelector)
+
+    def getChainForAnalyzer(self):
+        recorder = self.__dict__.get("branchRecorder", None)
+        if recorder != None:
+            return recorder
+        return self.getRealChain()
+
+    fChain = property(getChainForAnalyzer)
+
+    # Branch pruning is controlled by two slave parameters:
+    #   branchWhitelist - comma separated list of branches (wildcards allowed) to be read
+    #   autoBranchPruning - number of events, during which branches accessed by
+    #                       the analyzer are recorded (all branches are read).
+    #                       Afterwards only those (and whitelisted) are read
+    def setupBranchPruning(self):
+        self.branchRecorder = None
+        whitelist = [b.strip() for b in getattr(self, "branchWhitelist", "").split(",") if b.strip()]
+        self.recordEventsLeft = getattr(self, "autoBranchPruning", 0)
+        if not whitelist and self.recordEventsLeft <= 0:
+            return
+        self.branchRecorder = BranchAccessRecorder(self.getRealChain, whitelist, self.recordEventsLeft > 0)
+
+    def recordBranchAccess(self):
+        self.recordEventsLeft -= 1
+        if self.recordEventsLeft > 0: return
+        self.branchRecorder.stopRecording()
+        print "Branches used by analyzer (you may pass them as branchWhitelist):"
+        print ",".join(self.branchRecorder.usedBranches())
+        self.branchRecorder.apply()
+
+    # called by proof each time a new tree (file) is loaded
+    def Notify(self):
+        recorder = self.__dict__.get("branchRecorder", None)
+        if recorder != None:
+            recorder.newTree()
+            recorder.apply()
+        return 1
 
 
     def Begin( self ):
@@ -123,15 +189,31 @@ class ExampleProofReader( ROOT.TPySelector ):
         if self.useProofOFile:
             self.newStyleOutputList = []
             curPath = ROOT.gDirectory.GetPath()
-            bigFileName = self.outFile.replace(".root","")+"_"+ self.datasetName+".root"
-            self.proofFile=ROOT.TProofOutputFile(bigFileName,"M")
-            self.oFileViaPOF = self.proofFile.OpenFile("RECREATE") 
+            if getattr(self, "localOutFile", ""): # set when running without proof, see Executors
+                self.proofFile = None
+                self.oFileViaPOF = ROOT.TFile(self.localOutFile, "RECREATE")
+            else:
+                bigFileName = self.getSampleOutFile(self.outFile, self.datasetName)
+                self.proofFile=ROOT.TProofOutputFile(bigFileName,"M")
+                self.oFileViaPOF = self.proofFile.OpenFile("RECREATE") 
             self.outDirViaPOF = self.oFileViaPOF.mkdir(self.datasetName)
 
             ROOT.gDirectory.cd(curPath)
         else:
             self.oFileViaPOF = None
 
+        # batch (columnar) mode: set batchSize slave parameter to a positive
+        # value and implement analyzeBatch in your derived class
+        self.batchMode = getattr(self, "batchSize", 0) > 0
+        if self.batchMode:
+            self.columnarReader = ColumnarReader(getattr(self, "batchBranches", None))
+            self.batchFile = None
+            self.batchTreePath = None
+            self.batchFirst = 0
+            self.batchCnt = 0
+
+        self.setupBranchPruning()
+
         try:
             self.init() 
         except:
@@ -164,6 +246,9 @@ class ExampleProofReader( ROOT.TPySelector ):
     # protect from returning None or other nonsense by 
     # putting analysis stuff in separate function
     def Process( self, entry ):
+        if self.batchMode:
+            return self.processBatchEntry(entry)
+
         if self.fChain.GetEntry( entry ) <= 0:
            return 0
 
@@ -174,8 +259,63 @@ class ExampleProofReader( ROOT.TPySelector ):
             traceback.print_exc(file=sys.stdout)
             sys.stdout.flush()
             raise Exception("Whooopps!")
+
+        if self.branchRecorder != None and self.branchRecorder.recording:
+            self.recordBranchAccess()
         return 1
 
+    # In batch mode entries are only collected here. Contiguous entries from
+    # a single file are read at once (see ColumnarReader) and passed to analyzeBatch
+    def processBatchEntry(self, entry):
+        localEntry = self.fChain.LoadTree(entry)
+        if localEntry < 0:
+            return 0
+        tree = self.fChain.GetTree()
+        fname = tree.GetCurrentFile().GetName()
+        if self.batchCnt > 0 and (fname != self.batchFile or localEntry != self.batchFirst+self.batchCnt):
+            self.flushBatch()
+
+        if self.batchCnt == 0:
+            self.batchFile = fname
+            dirPath = tree.GetDirectory().GetPath().split(":")[-1].strip("/")
+            self.batchTreePath = tree.GetName()
+            if dirPath: self.batchTreePath = dirPath + "/" + tree.GetName()
+            self.batchFirst = localEntry
+
+        self.batchCnt += 1
+        if self.batchCnt >= self.batchSize:
+            self.flushBatch()
+        return 1
+
+    def flushBatch(self):
+        if self.batchCnt == 0: return
+        tree = self.fChain.GetTree()
+        rootFile = None
+        if tree.GetCurrentFile().GetName() != self.batchFile:
+            # tree was switched to the next file in the meantime
+            curPath = ROOT.gDirectory.GetPath()
+            rootFile = ROOT.TFile.Open(self.batchFile, "r")
+            tree = rootFile.Get(self.batchTreePath)
+            ROOT.gDirectory.cd(curPath)
+
+        try:
+            arrays = self.columnarReader.read(tree, self.batchFirst, self.batchCnt)
+            self.analyzeBatch(arrays)
+        except:
+            print "Exception catched from analyzeBatch function. Traceback:"
+            traceback.print_exc(file=sys.stdout)
+            sys.stdout.flush()
+            raise Exception("Whooopps!")
+        finally:
+            self.batchCnt = 0
+            if rootFile:
+                rootFile.Close()
+
+    # this method will be overridden in derived class (batch mode only)
+    #   arrays - dictionary with numpy arrays, see ColumnarReader for the format
+    def analyzeBatch(self, arrays):
+        raise Exception("Batch mode enabled (batchSize>0). Please implement analyzeBatch method in your derived class")
+
     # this method will be overridden in derived class
     def analyze(self):
         #event = self.fChain.event
@@ -209,6 +349,9 @@ class ExampleProofReader( ROOT.TPySelector ):
 
     def SlaveTerminate( self ):
         print 'py: slave terminating'
+        if self.batchMode:
+            self.flushBatch()
+
         try:
             self.finalize()
         except:
@@ -230,7 +373,10 @@ class ExampleProofReader( ROOT.TPySelector ):
                 o.Write()
             self.oFileViaPOF.cd()
             self.oFileViaPOF.Write()
-            self.GetOutputList().Add(self.proofFile)
+            if self.proofFile:
+                self.GetOutputList().Add(self.proofFile)
+            else:
+                self.oFileViaPOF.Close()
             ROOT.gDirectory.cd(curPath)
 
 
@@ -311,11 +457,92 @@ class ExampleProofReader( ROOT.TPySelector ):
                 o.Write()
             of.Close()
 
+    @classmethod
+    def getSampleOutFile(cls, outFile, sampleName):
+        return outFile.replace(".root","")+"_"+sampleName+".root"
+
+    # Write norm value and other info
+    @classmethod
+    def saveNormalization(cls, outFile, sampleName, norm, useProofOFile):
+        curPath = ROOT.gDirectory.GetPath()
+
+        if useProofOFile:
+            of = ROOT.TFile(cls.getSampleOutFile(outFile, sampleName),"UPDATE")
+        else:
+            of = ROOT.TFile(outFile,"UPDATE")
+
+        saveDir = of.Get(sampleName)
+        if not saveDir:
+            print "Cannot get directory from plot file"
+            of.Close()
+            ROOT.gDirectory.cd(curPath)
+            return False
+        saveDir.cd()
+
+        hist = ROOT.TH1D("norm", "norm", 1,0,1)
+        hist.SetBinContent(1, norm)
+        #saveDir.WriteObject(hist, hist.GetName())
+        hist.Write(hist.GetName())
+
+        of.Close()
+        ROOT.gDirectory.cd(curPath)
+        return True
+
+    # Completion markers (resume mode of runAll). A marker holds a fingerprint
+    # of the file list and parameters, so a sample is processed again if 
+    # any of these has changed
+    @classmethod
+    def getSampleFingerprint(cls, files, slaveParameters):
+        return hashlib.md5(repr(sorted(files))+repr(sorted(slaveParameters.items()))).hexdigest()
+
+    @classmethod
+    def getSampleMarker(cls, outFile, sampleName):
+        return os.path.expanduser(cls.getSampleOutFile(outFile, sampleName)).replace(".root", ".done")
+
+    @classmethod
+    def isSampleDone(cls, outFile, sampleName, fingerprint, useProofOFile):
+        marker = cls.getSampleMarker(outFile, sampleName)
+        if not os.path.isfile(marker): return False
+        if open(marker).read().strip() != fingerprint: return False
+        if useProofOFile:
+            return os.path.isfile(os.path.expanduser(cls.getSampleOutFile(outFile, sampleName)))
+
+        of = ROOT.TFile(outFile, "READ")
+        ret = bool(of.Get(sampleName))
+        of.Close()
+        return ret
+
+    @classmethod
+    def markSample(cls, outFile, sampleName, fingerprint = None):
+        marker = cls.getSampleMarker(outFile, sampleName)
+        if fingerprint == None:
+            if os.path.isfile(marker):
+                os.remove(marker)
+            return
+        markerFile = open(marker, "w")
+        markerFile.write(fingerprint+"\n")
+        markerFile.close()
+
+    # removes output of previous (possibly crashed) run for this sample
+    @classmethod
+    def removeSampleDir(cls, outFile, sampleName):
+        of = ROOT.TFile(outFile, "UPDATE")
+        if of.Get(sampleName):
+            of.Delete(sampleName+";*")
+        of.Close()
+
     @classmethod
     def runAll(cls, treeName, outFile, sampleList = None, \
                 maxFilesMC=None, maxFilesData=None, \
-                slaveParameters = None, nWorkers=None, usePickle=False, useProofOFile = False):
+                slaveParameters = None, nWorkers=None, usePickle=False, useProofOFile = False,
+                executor = None, resume = False):
 
+        # executor - object processing a single sample, see Executors.py. By 
+        #            default ProofExecutor (proof-lite with nWorkers workers) is used
+        # resume - skip samples completed in a previous call with same files
+        #          and parameters (and file chunks, if supported by executor)
+        if executor == None:
+            executor = ProofExecutor(nWorkers)
 
         if slaveParameters == None: # When default param is used reset contents on every call to runAll
             slaveParameters = {}
@@ -332,7 +559,7 @@ class ExampleProofReader( ROOT.TPySelector ):
         slaveParameters["useProofOFile"] = useProofOFile
 
 
-        if not useProofOFile:
+        if not useProofOFile and not (resume and os.path.isfile(os.path.expanduser(outFile))):
             of = ROOT.TFile(outFile,"RECREATE")
             if not of:
                 print "Cannot create outfile:", outFile
@@ -346,6 +573,7 @@ class ExampleProofReader( ROOT.TPySelector ):
         skipped = []
 
         sampleListFullInfo = CommonFSQFramework.Core.Util.getAnaDefinition("sam")
+
         sampleCnt = 0
         for t in todo:
             sampleCnt += 1
@@ -357,97 +585,21 @@ class ExampleProofReader( ROOT.TPySelector ):
                 skipped.append(t)
                 continue
 
-            dataset = ROOT.TDSet( 'TTree', 'data', treeName) # the last name is the directory name inside the root file
-            for file in treeFilesAndNormalizations[t]["files"]:
-                dataset.Add(file)
-            
             slaveParameters["datasetName"] = t
             slaveParameters["isData"] = sampleListFullInfo[t]["isData"]
             slaveParameters["normalizationFactor"] =  treeFilesAndNormalizations[t]["normFactor"]
 
-            ROOT.TProof.AddEnvVar("PATH2",ROOT.gSystem.Getenv("PYTHONPATH")+":"+os.getcwd())
-
-            #ROOT.gSystem.Setenv("TMFDatasetName", t)
-
-            supportedTypes = set(["int", "str", "float", "bool"])
-            variablesToFetch = ""
-            coma = ""
-
-            variablesToSetInProof = {}
-            for p in slaveParameters:
-                encodedName = cls.encodeEnvString(p)
-
-                # Check if parameter is supported. Adding another type is easy - see
-                #       getVariables method
-                paramType = slaveParameters[p].__class__.__name__
-                if paramType not in supportedTypes:
-                    raise Exception("Parameter of type "+paramType \
-                          + " is not of currently supported types: " + ", ".join(supportedTypes) )
-                ROOT.gSystem.Setenv(encodedName, str(slaveParameters[p])+";;;"+paramType)
-                variablesToSetInProof[encodedName] =  str(slaveParameters[p])+";;;"+paramType
-                variablesToFetch += coma + p
-                coma = ","
-            ROOT.gSystem.Setenv(cls.encodeEnvString("VariablesToFetch"), variablesToFetch)
-            variablesToSetInProof[cls.encodeEnvString("VariablesToFetch")] = variablesToFetch
-
-            proofConnectionString = None
-            if "proofConnectionString" in os.environ:
-                proofConnectionString = os.environ["proofConnectionString"]
-                print "Found proof environment. Will try to connect to", proofConnectionString
-
-            if not proofConnectionString:
-                if nWorkers == None:
-                    proof = ROOT.TProof.Open('')
-                else:
-                    proof = ROOT.TProof.Open('workers='+str(nWorkers))
-            else:
-                proof = ROOT.TProof.Open(proofConnectionString)
-
-            
-            proof.Exec( 'gSystem->Setenv("PYTHONPATH",gSystem->Getenv("PATH2"));') # for some reason cannot use method below for python path
-            proof.Exec( 'gSystem->Setenv("PATH", "'+ROOT.gSystem.Getenv("PATH") + '");')
-            for v in variablesToSetInProof:  
-                # if you get better implemenation (GetParameter?) mail me
-                proof.Exec('gSystem->Setenv("'+v+'","'+variablesToSetInProof[v]+'");')
-            print dataset.Process( 'TPySelector',  cls.__name__)
-
-            try:
-                print "Logs saved to:"
-                logs = proof.GetManager().GetSessionLogs().GetListOfLogs()
-                for l in logs:
-                    print l.GetTitle()
-            except:
-                print "Cannot get lognames"
-
-            curPath = ROOT.gDirectory.GetPath()
-
-            if useProofOFile:
-                bigFileName = outFile.replace(".root","")+"_"+t+".root"
-                of = ROOT.TFile(bigFileName,"UPDATE")
-            else:
-                of = ROOT.TFile(outFile,"UPDATE")
-
-            # Write norm value and other info
-            saveDir = of.Get(t)
-            if not saveDir:
-                print "Cannot get directory from plot file"
+            fingerprint = cls.getSampleFingerprint(treeFilesAndNormalizations[t]["files"], slaveParameters)
+            if resume and cls.isSampleDone(outFile, t, fingerprint, useProofOFile):
+                print "Sample allready processed (resume mode), skipping:", t
                 continue
-            saveDir.cd()
-
-            norm = treeFilesAndNormalizations[t]["normFactor"]
-            hist = ROOT.TH1D("norm", "norm", 1,0,1)
-            hist.SetBinContent(1, norm)
-            #saveDir.WriteObject(hist, hist.GetName())
-            hist.Write(hist.GetName())
-
-            of.Close()
-            ROOT.gDirectory.cd(curPath)
 
-            # clean environment
-            for v in variablesToSetInProof:  
-                #command = 'gSystem->Unsetenv("'+v+'");'
-                #print command
-                proof.Exec('gSystem->Unsetenv("'+v+'");')
+            cls.markSample(outFile, t, None)
+            if not useProofOFile:
+                cls.removeSampleDir(outFile, t)
+            executor.process(cls, t, treeFilesAndNormalizations[t]["files"], treeName, slaveParameters, resume)
+            if cls.saveNormalization(outFile, t, treeFilesAndNormalizations[t]["normFactor"], useProofOFile):
+                cls.markSample(outFile, t, fingerprint)
 
         if len(skipped)>0:
             print "Note: following samples were skipped:"
@@ -472,7 +624,7 @@ class ExampleProofReader( ROOT.TPySelector ):
             merger  = ROOT.TFileMerger( False, False);
             merger.OutputFile(outFile, True, 1)
             for t in done:
-                merger.AddFile(outFile.replace(".root","")+"_"+t+".root")
+                merger.AddFile(cls.getSampleOutFile(outFile, t))
 
             status = merger.Merge()
             print "Merge status: ", status
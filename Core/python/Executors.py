@@ -0,0 +1,418 @@
+import sys, os, shutil, traceback, subprocess, pickle, time
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+from multiprocessing import Process, Queue
+
+# Executors process a single sample with a selector class derived from
+# ExampleProofReader (see ExampleProofReader.runAll, executor parameter).
+# After process(...) returns the sample output is in place, ie inside
+#   - outFile_<sample>.root, when useProofOFile is set
+#   - outFile (directory <sample>) otherwise
+# exactly as it was written by proof
+
+def makeInputList(parameters):
+    ''' parameters - dictionary from ExampleProofReader.encodeSlaveParameters '''
+    inputList = ROOT.TList()
+    inputList.SetOwner(True)
+    for p in parameters:
+        obj = ROOT.TNamed(p, parameters[p])
+        ROOT.SetOwnership(obj, False) # owned by the list
+        inputList.Add(obj)
+    return inputList
+
+class ProofExecutor:
+    def __init__(self, nWorkers = None):
+        self.nWorkers = nWorkers
+        self.proof = None
+
+    def openProof(self):
+        proofConnectionString = None
+        if "proofConnectionString" in os.environ:
+            proofConnectionString = os.environ["proofConnectionString"]
+            print "Found proof environment. Will try to connect to", proofConnectionString
+
+        ROOT.TProof.AddEnvVar("PATH2",ROOT.gSystem.Getenv("PYTHONPATH")+":"+os.getcwd())
+        if not proofConnectionString:
+            if self.nWorkers == None:
+                proof = ROOT.TProof.Open('')
+            else:
+                proof = ROOT.TProof.Open('workers='+str(self.nWorkers))
+        else:
+            proof = ROOT.TProof.Open(proofConnectionString)
+
+        if not proof:
+            raise Exception("Cannot open proof session")
+
+        proof.Exec( 'gSystem->Setenv("PYTHONPATH",gSystem->Getenv("PATH2"));') # for some reason cannot use method below for python path
+        proof.Exec( 'gSystem->Setenv("PATH", "'+ROOT.gSystem.Getenv("PATH") + '");')
+        return proof
+
+    # all samples are processed (one query per sample) in a single proof
+    # session. Only the parameters are changed between queries
+    # resume - not supported by proof (whole sample is processed again)
+    def process(self, selectorClass, sampleName, files, treeName, slaveParameters, resume = False):
+        if self.proof == None:
+            self.proof = self.openProof()
+
+        dataset = ROOT.TDSet( 'TTree', 'data', treeName) # the last name is the directory name inside the root file
+        for file in files:
+            dataset.Add(file)
+
+        parameters = selectorClass.encodeSlaveParameters(slaveParameters)
+        for p in parameters:
+            self.proof.SetParameter(p, parameters[p])
+        print dataset.Process( 'TPySelector',  selectorClass.__name__)
+
+        try:
+            print "Logs saved to:"
+            logs = self.proof.GetManager().GetSessionLogs().GetListOfLogs()
+            for l in logs:
+                print l.GetTitle()
+        except:
+            print "Cannot get lognames"
+
+        for p in parameters:
+            self.proof.DeleteParameters(p)
+
+
+# Runs the selector (SlaveBegin/Process/SlaveTerminate) in worker processes
+# started with python multiprocessing. Work is distributed in units of
+#   - single files (default)
+#   - entry ranges of entriesPerTask entries (entry counts are read in the
+#     main process first)
+# Workers take units from a common queue, so faster workers simply process
+# more of them. Each worker saves its output to a partial file; partial files
+# are merged with TFileMerger and Terminate is called in the main process.
+#
+# Note: worker output goes directly to the terminal
+class MultiprocessingExecutor:
+    def __init__(self, nWorkers = None, entriesPerTask = None):
+        if nWorkers == None:
+            import multiprocessing
+            nWorkers = multiprocessing.cpu_count()
+        self.nWorkers = nWorkers
+        self.entriesPerTask = entriesPerTask
+
+    @staticmethod
+    def openTree(fileName, treeName):
+        curPath = ROOT.gDirectory.GetPath()
+        rootFile = ROOT.TFile.Open(fileName, "r")
+        ROOT.gDirectory.cd(curPath)
+        if not rootFile:
+            raise Exception("Cannot open "+fileName)
+        tree = rootFile.Get(treeName+"/data")
+        if not tree:
+            raise Exception("Cannot get tree "+treeName+"/data from "+fileName)
+        return rootFile, tree
+
+    def getTasks(self, files, treeName):
+        if self.entriesPerTask == None:
+            return [(f, 0, -1) for f in files]
+
+        ret = []
+        for f in files:
+            rootFile, tree = self.openTree(f, treeName)
+            nEntries = tree.GetEntries()
+            rootFile.Close()
+            for first in xrange(0, nEntries, self.entriesPerTask):
+                ret.append( (f, first, min(self.entriesPerTask, nEntries-first)) )
+        return ret
+
+    @classmethod
+    def runTasks(cls, selectorClass, sampleName, treeName, slaveParameters, tasks, partFile):
+        ''' executed in the worker process. tasks - iterable of (file, firstEntry, nEntries) '''
+        params = dict(slaveParameters)
+        params["localOutFile"] = partFile
+        selector = selectorClass()
+        inputList = makeInputList(selectorClass.encodeSlaveParameters(params))
+        selector.SetInputList(inputList)
+        selector.SlaveBegin(None)
+
+        for fileName, first, nEntries in tasks:
+            rootFile, tree = cls.openTree(fileName, treeName)
+            ROOT.TPySelector.Init(selector, tree) # sets fChain
+            selector.Notify()
+            if nEntries < 0:
+                nEntries = tree.GetEntries()-first
+            for entry in xrange(first, first+nEntries):
+                selector.Process(entry)
+            if selector.batchMode:
+                selector.flushBatch() # before the file gets closed
+            rootFile.Close()
+
+        selector.SlaveTerminate()
+        if not selector.useProofOFile: # otherwise written by SlaveTerminate
+            curPath = ROOT.gDirectory.GetPath()
+            of = ROOT.TFile(partFile, "RECREATE")
+            outDir = of.mkdir(sampleName)
+            outDir.cd()
+            for o in selector.GetOutputList():
+                o.Write()
+            of.Close()
+            ROOT.gDirectory.cd(curPath)
+        sys.stdout.flush()
+
+    @classmethod
+    def worker(cls, selectorClass, sampleName, treeName, slaveParameters, taskQueue, partFile):
+        def tasks():
+            while True:
+                task = taskQueue.get()
+                if task == None: break
+                yield task
+        try:
+            cls.runTasks(selectorClass, sampleName, treeName, slaveParameters, tasks(), partFile)
+        except:
+            print "Exception catched in worker. Traceback:"
+            traceback.print_exc(file=sys.stdout)
+            sys.stdout.flush()
+            sys.exit(1)
+
+    @staticmethod
+    def mergeFiles(partFiles, targetFile):
+        # note: TFileMerger (instead of hadd) - RooUnfold objects get merged properly
+        merger  = ROOT.TFileMerger( False, False);
+        merger.OutputFile(targetFile, True, 1)
+        for f in partFiles:
+            merger.AddFile(f)
+        if not merger.Merge():
+            raise Exception("Cannot merge into "+targetFile)
+
+    @staticmethod
+    def terminate(selectorClass, sampleName, slaveParameters, mergedFile):
+        ''' equivalent of client side part of proof processing (Begin/Terminate) '''
+        selector = selectorClass()
+        inputList = makeInputList(selectorClass.encodeSlaveParameters(slaveParameters))
+        selector.SetInputList(inputList)
+        selector.Begin()
+
+        curPath = ROOT.gDirectory.GetPath()
+        rootFile = None
+        if not slaveParameters["useProofOFile"]:
+            rootFile = ROOT.TFile(mergedFile, "READ")
+            mergedDir = rootFile.Get(sampleName)
+            if mergedDir:
+                for key in mergedDir.GetListOfKeys():
+                    selector.GetOutputList().Add(key.ReadObj())
+            ROOT.gDirectory.cd(curPath)
+
+        selector.Terminate()
+        if rootFile:
+            selector.GetOutputList().Clear() # objects are owned by rootFile
+            rootFile.Close()
+        ROOT.gDirectory.cd(curPath)
+
+    def getPartDir(self, outFile, sampleName):
+        return os.path.expanduser(outFile).replace(".root","")+"_"+sampleName+"_parts/"
+
+    # resume - not supported, partial files are saved only when a worker ends
+    def process(self, selectorClass, sampleName, files, treeName, slaveParameters, resume = False):
+        outFile = slaveParameters["outFile"]
+        partDir = self.getPartDir(outFile, sampleName)
+        if not os.path.isdir(partDir):
+            os.makedirs(partDir)
+
+        tasks = self.getTasks(files, treeName)
+        taskQueue = Queue()
+        for t in tasks:
+            taskQueue.put(t)
+
+        nWorkers = min(self.nWorkers, len(tasks))
+        workers = []
+        partFiles = []
+        for i in xrange(nWorkers):
+            taskQueue.put(None)
+            partFile = partDir+"part_"+str(i)+".root"
+            partFiles.append(partFile)
+            p = Process(target=self.worker,
+                        args=(selectorClass, sampleName, treeName, slaveParameters, taskQueue, partFile))
+            p.start()
+            workers.append(p)
+
+        for p in workers:
+            p.join()
+        failed = [p for p in workers if p.exitcode != 0]
+        if failed:
+            raise Exception("Whooopps! "+str(len(failed))+" worker(s) failed for "+sampleName)
+
+        self.finish(selectorClass, sampleName, slaveParameters, partFiles)
+        shutil.rmtree(partDir)
+
+    def finish(self, selectorClass, sampleName, slaveParameters, partFiles):
+        ''' merges partial files and runs Terminate '''
+        outFile = os.path.expanduser(slaveParameters["outFile"])
+        if slaveParameters["useProofOFile"]:
+            mergedFile = selectorClass.getSampleOutFile(outFile, sampleName)
+        else:
+            mergedFile = outFile.replace(".root","")+"_"+sampleName+"_merged.root"
+        self.mergeFiles(partFiles, mergedFile)
+        self.terminate(selectorClass, sampleName, slaveParameters, mergedFile)
+        if not slaveParameters["useProofOFile"]:
+            os.remove(mergedFile)
+
+
+# Runs tasks (shell scripts) as local subprocesses, at most nParallel at once.
+# Stand-in for a batch system, useful for testing BatchExecutor setup
+class LocalSubmitter:
+    def __init__(self, nParallel = None):
+        if nParallel == None:
+            import multiprocessing
+            nParallel = multiprocessing.cpu_count()
+        self.nParallel = nParallel
+        self.queued = []
+        self.running = []
+
+    def submit(self, script):
+        self.queued.append(script)
+        self.update()
+
+    def update(self):
+        self.running = [p for p in self.running if p.poll() == None]
+        while self.queued and len(self.running) < self.nParallel:
+            self.running.append(subprocess.Popen(["sh", self.queued.pop(0)]))
+
+# Submits tasks to HTCondor with condor_submit. The environment of the
+# submitting shell (CMSSW, grid proxy location,...) is passed to the job
+class CondorSubmitter:
+    def __init__(self, extraLines = None):
+        self.extraLines = extraLines or []
+
+    def submit(self, script):
+        base = script.replace(".sh", "")
+        jdl = open(base+".jdl", "w")
+        jdl.write("universe = vanilla\n")
+        jdl.write("executable = "+script+"\n")
+        jdl.write("getenv = True\n")
+        jdl.write("output = "+base+".condor.out\n")
+        jdl.write("error = "+base+".condor.err\n")
+        jdl.write("log = "+base+".condor.log\n")
+        for l in self.extraLines:
+            jdl.write(l+"\n")
+        jdl.write("queue\n")
+        jdl.close()
+        if subprocess.call(["condor_submit", base+".jdl"]) != 0:
+            raise Exception("condor_submit failed for "+base+".jdl")
+
+    def update(self):
+        pass
+
+# Splits a sample into chunks of filesPerTask files. Each chunk is described
+# by a self contained task file (workDir/<sample>/task_N.pkl: analyzer class and
+# directory, sample, files, slave parameters) executed by runBatchTask.py
+# through a shell script submitted with the submitter (LocalSubmitter or 
+# CondorSubmitter). Completion is tracked by task_N.status files containing
+# the exit code. Failed tasks are resubmitted (up to maxRetries times). When
+# all tasks are done partial outputs are merged as in MultiprocessingExecutor.
+#
+# In resume mode tasks finished in a previous run (with identical task 
+# description) are not submitted again.
+class BatchExecutor(MultiprocessingExecutor):
+    def __init__(self, workDir, submitter = None, filesPerTask = 10, maxRetries = 2, pollInterval = 10):
+        self.workDir = os.path.abspath(os.path.expanduser(workDir))
+        if submitter == None:
+            submitter = LocalSubmitter()
+        self.submitter = submitter
+        self.filesPerTask = filesPerTask
+        self.maxRetries = maxRetries
+        self.pollInterval = pollInterval
+
+    @staticmethod
+    def getAnalyzerDir(selectorClass):
+        fileName = os.path.abspath(sys.modules[selectorClass.__module__].__file__)
+        if os.path.splitext(os.path.basename(fileName))[0] != selectorClass.__name__:
+            raise Exception("Analyzer class "+selectorClass.__name__+" should be defined in a file named "\
+                            +selectorClass.__name__+".py")
+        return os.path.dirname(fileName)
+
+    def writeTask(self, taskDir, taskName, task):
+        taskFile = open(taskDir+taskName+".pkl", "wb")
+        pickle.dump(task, taskFile)
+        taskFile.close()
+
+        script = taskDir+taskName+".sh"
+        sh = open(script, "w")
+        sh.write("#!/bin/sh\n")
+        sh.write("runBatchTask.py "+taskDir+taskName+".pkl > "+taskDir+taskName+".log 2>&1\n")
+        sh.write("echo $? > "+taskDir+taskName+".status\n")
+        sh.close()
+        os.chmod(script, 0755)
+        return script
+
+    @staticmethod
+    def readStatus(statusFile):
+        if not os.path.isfile(statusFile):
+            return None
+        content = open(statusFile).read().strip()
+        if not content: # still being written
+            return None
+        return int(content)
+
+    def submit(self, script):
+        statusFile = script.replace(".sh", ".status")
+        if os.path.isfile(statusFile):
+            os.remove(statusFile)
+        self.submitter.submit(script)
+
+    def isTaskDone(self, taskDir, taskName, task):
+        if self.readStatus(taskDir+taskName+".status") != 0: return False
+        if not os.path.isfile(task["partFile"]): return False
+        try:
+            taskFile = open(taskDir+taskName+".pkl", "rb")
+            oldTask = pickle.load(taskFile)
+            taskFile.close()
+        except Exception:
+            return False
+        return oldTask == task
+
+    def process(self, selectorClass, sampleName, files, treeName, slaveParameters, resume = False):
+        taskDir = self.workDir+"/"+sampleName+"/"
+        if os.path.isdir(taskDir) and not resume:
+            shutil.rmtree(taskDir)
+        if not os.path.isdir(taskDir):
+            os.makedirs(taskDir)
+
+        analyzerDir = self.getAnalyzerDir(selectorClass)
+        scripts = {}
+        partFiles = []
+        for i in xrange(0, len(files), self.filesPerTask):
+            taskName = "task_"+str(i/self.filesPerTask)
+            task = {}
+            task["className"] = selectorClass.__name__
+            task["analyzerDir"] = analyzerDir
+            task["sampleName"] = sampleName
+            task["treeName"] = treeName
+            task["files"] = files[i:i+self.filesPerTask]
+            task["slaveParameters"] = dict(slaveParameters)
+            task["partFile"] = taskDir+taskName+".root"
+            partFiles.append(task["partFile"])
+            if resume and self.isTaskDone(taskDir, taskName, task):
+                continue
+            scripts[taskName] = self.writeTask(taskDir, taskName, task)
+
+        if resume:
+            print len(partFiles)-len(scripts), "tasks allready done for", sampleName
+        print "Submitting", len(scripts), "tasks for", sampleName, "- see", taskDir
+        attempts = {}
+        for t in scripts:
+            attempts[t] = 1
+            self.submit(scripts[t])
+
+        pending = set(scripts.keys())
+        while pending:
+            self.submitter.update()
+            for t in sorted(pending):
+                status = self.readStatus(taskDir+t+".status")
+                if status == None: continue
+                if status == 0:
+                    pending.remove(t)
+                    continue
+                if attempts[t] > self.maxRetries:
+                    raise Exception("Whooopps! Task "+taskDir+t+" failed "+str(attempts[t])+" times. See "+taskDir+t+".log")
+                print "Task", t, "failed (exit code "+str(status)+"). Resubmitting"
+                attempts[t] += 1
+                self.submit(scripts[t])
+            if pending:
+                time.sleep(self.pollInterval)
+
+        print "All tasks done for", sampleName
+        self.finish(selectorClass, sampleName, slaveParameters, partFiles)
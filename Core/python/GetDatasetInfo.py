@@ -10,86 +10,150 @@ AutoLibraryLoader.enable()
 import CommonFSQFramework.Core.Util
 import time
 from multiprocessing import Process, Queue
+from Queue import Empty
 
 import pickle
 import distutils.spawn
 
-def validateRootFile(fname, q):
-    rootFile = ROOT.TFile.Open(fname,"r")
-    infoHisto = rootFile.Get("infoHisto/cntHisto")
+def validateRootFile(fname):
     ret = {}
     ret["evCnt"]=-1
     ret["evCntSeenByTreeProducers"]=-1
+
+    rootFile = ROOT.TFile.Open(fname,"r")
+    if not rootFile:
+        print "\nProblem opening", fname
+        return ret
+    infoHisto = rootFile.Get("infoHisto/cntHisto")
     
     if type(infoHisto) != ROOT.TH1D:
         print "\nProblem reading info histo from", fname
     elif infoHisto.GetXaxis().GetBinLabel(3)!="evCnt":
-        if not quiet: print "\nProblem - evCnt bin expected at position 3. Got",  infoHisto.getBinLabel(3)
+        print "\nProblem - evCnt bin expected at position 3. Got",  infoHisto.GetXaxis().GetBinLabel(3)
     else:
         ret["evCnt"]  =  int(infoHisto.GetBinContent(3))
-    if  infoHisto.GetXaxis().GetBinLabel(4)=="evCntSeenByTreeProducers":
-        ret["evCntSeenByTreeProducers"] =  int(infoHisto.GetBinContent(4))
+        if  infoHisto.GetXaxis().GetBinLabel(4)=="evCntSeenByTreeProducers":
+            ret["evCntSeenByTreeProducers"] =  int(infoHisto.GetBinContent(4))
 
     del infoHisto
     rootFile.Close()
     del rootFile
-    return q.put(ret)
+    return ret
 
-def validateRootFiles(fileListUnvalidated, maxFiles=None, quiet = False):
+# Long lived validation worker. Takes file names from its own task queue
+# (None means "finish") and puts (fname, result) pairs into resultQueue
+def validationWorker(taskQueue, resultQueue):
+    while True:
+        fname = taskQueue.get()
+        if fname == None:
+            break
+        try:
+            ret = validateRootFile(fname)
+        except Exception, e:
+            print "\nProblem validating", fname, "-", e
+            ret = {"evCnt":-1, "evCntSeenByTreeProducers":-1}
+        sys.stdout.flush()
+        resultQueue.put( (fname, ret) )
+
+def startValidationWorker(resultQueue):
+    worker = {}
+    worker["tasks"] = Queue()
+    worker["proc"] = Process(target=validationWorker, args=(worker["tasks"], resultQueue))
+    worker["proc"].daemon = True
+    worker["proc"].start()
+    worker["file"] = None
+    worker["start"] = None
+    return worker
+
+# knownResults - results (see validateRootFile) for files validated 
+#                previously. Such files wont be opened again
+# maxWorkers - number of validation processes
+# timeout - time (in seconds) after which validation of a single file is 
+#           considered failed (the worker is killed and replaced)
+def validateRootFiles(fileListUnvalidated, maxFiles=None, quiet = False, knownResults = None, maxWorkers = 12, timeout = 600):
+    if knownResults == None:
+        knownResults = {}
     if not quiet: print "Validating",
     # verify we are able to read event counts from very file
-    fileCnt = 0
-    threads = {}
+    results = {}
     goodFiles = 0
-    maxThreads= 12
     fileList = []
     evCnt = 0
     evCntSeenByTreeProducers = 0
-    if maxFiles != None:
-        maxThreads  = min(maxThreads, maxFiles/2+1, len(fileListUnvalidated))
+    failed = {"evCnt":-1, "evCntSeenByTreeProducers":-1}
 
+    todo = []
     for fname in fileListUnvalidated:
-        if maxFiles != None and goodFiles >= maxFiles:
-            break
-        fileCnt += 1
-        if (fileCnt%50 == 0):
-            if not quiet: sys.stdout.write(str(int(100.*fileCnt/len(fileListUnvalidated)))+"%")
+        if fname in knownResults:
+            results[fname] = knownResults[fname]
+            if knownResults[fname]["evCnt"] > 0:
+                goodFiles += 1
         else:
-            if not quiet: sys.stdout.write('.')
-
-
-        q = Queue()               
-        thr = Process(target=validateRootFile, args=(fname, q))
-        thr.start()
-        threads[fname] = [thr, q, None]
-
-        while True:
-            waitingOrRunning = 0 
-            goodFiles = 0
-            for t in threads:
-                #if not threads[t][0].ident or  threads[t][0].is_alive():
-                if threads[t][0].exitcode == None:
-                    waitingOrRunning+=1
-                else:
-                    if threads[t][2] == None:
-                        threads[t][0].join()
-                        threads[t][2] = threads[t][1].get()
-                    if threads[t][2]["evCnt"] > 0:
-                        goodFiles+=1
-
-            if waitingOrRunning > maxThreads:
-                time.sleep(1)
+            todo.append(fname)
+
+    nWorkers = min(maxWorkers, len(todo))
+    if maxFiles != None:
+        nWorkers  = min(nWorkers, maxFiles/2+1)
+
+    resultQueue = Queue()
+    workers = [startValidationWorker(resultQueue) for i in xrange(nWorkers)]
+    todo.reverse() # we will pop from the end
+    fileCnt = len(results)
+    while True:
+        enough = maxFiles != None and goodFiles >= maxFiles
+        for w in workers:
+            if w["file"] == None and todo and not enough:
+                w["file"] = todo.pop()
+                w["start"] = time.time()
+                w["tasks"].put(w["file"])
+
+        running = [w for w in workers if w["file"] != None]
+        if not running:
+            break
+
+        # wake up at the latest every 10 seconds to look for crashed workers
+        wait = min([w["start"] + timeout for w in running]) - time.time()
+        try:
+            fname, ret = resultQueue.get(True, min(max(wait, 0.01), 10))
+        except Empty:
+            fname = None
+
+        if fname != None:
+            results[fname] = ret
+            if ret["evCnt"] > 0:
+                goodFiles += 1
+            for w in running:
+                if w["file"] == fname:
+                    w["file"] = None
+            fileCnt += 1
+            if (fileCnt%50 == 0):
+                if not quiet: sys.stdout.write(str(int(100.*fileCnt/len(fileListUnvalidated)))+"%")
             else:
-                break
+                if not quiet: sys.stdout.write('.')
+            continue
+
+        # nothing came within the time limit. Replace stuck (or crashed) workers
+        now = time.time()
+        for i in xrange(len(workers)):
+            w = workers[i]
+            if w["file"] == None: continue
+            if now - w["start"] < timeout and w["proc"].is_alive(): continue
+            print "\nValidation failed (timeout or crash) for", w["file"]
+            results[w["file"]] = dict(failed)
+            w["proc"].terminate()
+            w["proc"].join()
+            workers[i] = startValidationWorker(resultQueue)
+
+    for w in workers:
+        w["tasks"].put(None)
+    for w in workers:
+        w["proc"].join()
 
     if not quiet: print "" # EOL
     fileCnt = 0
-    for t in threads:
-        if threads[t][2]==None:
-            threads[t][0].join()
-            threads[t][2] = threads[t][1].get()
-        result = threads[t][2]["evCnt"] 
-        resEvCntSeenByTreeProducers = threads[t][2]["evCntSeenByTreeProducers"]
+    for t in results:
+        result = results[t]["evCnt"] 
+        resEvCntSeenByTreeProducers = results[t]["evCntSeenByTreeProducers"]
         if result < 0:
             print "Problematic file", t
             continue
@@ -110,8 +174,53 @@ def validateRootFiles(fileListUnvalidated, maxFiles=None, quiet = False):
     validationResult["fileList"]=fileList
     validationResult["evCnt"]=evCnt
     validationResult["evCntSeenByTreeProducers"]=evCntSeenByTreeProducers
+    validationResult["fileResults"]=results
     return validationResult
 
+# Per file validation cache. Each entry is keyed by file name and holds 
+# a fingerprint - (size, mtime) for local files, (size, None) for files
+# listed from SE - so only new or changed files are validated again
+def getFileFingerprint(fname):
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return (st.st_size, int(st.st_mtime))
+
+def loadValidationCache(cacheName, fingerprints):
+    ret = {}
+    if not os.path.isfile(cacheName):
+        return ret
+    try:
+        cacheFile = open(cacheName, 'rb')
+        cached = pickle.load(cacheFile)
+        cacheFile.close()
+    except Exception, e:
+        print "Cannot read validation cache", cacheName, "-", e
+        return ret
+
+    for fname in fingerprints:
+        if fname not in cached: continue
+        if fingerprints[fname] == None: continue
+        if cached[fname]["fingerprint"] != fingerprints[fname]: continue
+        ret[fname] = cached[fname]
+    return ret
+
+def saveValidationCache(cacheName, fingerprints, fileResults):
+    toPickle = {}
+    for fname in fileResults:
+        if fname not in fingerprints or fingerprints[fname] == None: continue
+        if fileResults[fname]["evCnt"] < 0: continue # dont cache failures (e.g. transient xrootd problems)
+        toPickle[fname] = dict(fileResults[fname])
+        toPickle[fname]["fingerprint"] = fingerprints[fname]
+
+    # write to a temporary file first, so the cache is never left half written
+    tmpName = cacheName + ".tmp" + str(os.getpid())
+    outputPickle = open(tmpName, 'wb')
+    pickle.dump(toPickle, outputPickle)
+    outputPickle.close()
+    os.rename(tmpName, cacheName)
+
 
 def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet = False, samplesToProcess = None, usePickle=False, donotvalidate=False):
     # in principle we should check if lcg-ls supports -c/ -o argumets
@@ -174,9 +283,8 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
             maxFiles = maxFilesMC
 
         ret[s] = {}
-        pickleName = samplesFileDir+"cache_"+anaVersion+"_"+s+".pkl"
-        fromPickle = False
-        writePickle = True
+        pickleName = samplesFileDir+"fileCache_"+anaVersion+"_"+s+".pkl"
+        fingerprints = {}
         if not quiet: print "#"*120
         if not quiet: print "Found sample:", s
         if not quiet: print tab,"dataset:",sampleList[s]["DS"]
@@ -187,7 +295,6 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
         if "pathTrees" not in sampleList[s]:
             # TODO: should this be in localAccess part?
             if not quiet: print tab, "path to trees not found! Blame the skim-responsible-guy."
-            writePickle = False
         else:
             fileListUnvalidated = set()
             if localAccess:
@@ -200,6 +307,8 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
                         if not f.endswith(".root"): continue
                         fname = dirpath.replace("//","/") + f   # somehow root doesnt like // at the begining
                         fileListUnvalidated.add(localROOTPrefix+fname)
+                        if usePickle:
+                            fingerprints[localROOTPrefix+fname] = getFileFingerprint(os.path.join(dirpath, f))
             elif isXrootdAccess:
                 if not quiet: print tab, "will access trees from:",sampleList[s]["pathSE"]
                 # Warning: duplicated from copyAnaData. Fixme
@@ -210,13 +319,13 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
                 lastSize = len(fileListUnvalidated)
                 while True:
                     if legacyMode:
-                        command = ["lcg-ls", pathSE]
+                        command = ["lcg-ls", "-l", pathSE]
                     else:
-                        command = ["lcg-ls", "-c", str(cnt), "-o", str(offset), pathSE]
+                        command = ["lcg-ls", "-l", "-c", str(cnt), "-o", str(offset), pathSE]
                     proc = subprocess.Popen(command, stdout=subprocess.PIPE)
                     for line in iter(proc.stdout.readline,''):
                         l = line.strip()
-                        fname = l.split("/")[-1]
+                        fname = l.split()[-1].split("/")[-1] if l else ""
                         if ".root" not in fname: continue
                         if "trees_" not in fname: continue
                         srcFile = pathSE + "/" + fname
@@ -226,6 +335,12 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
 
                         #targetFile = targetDir + "/" + fname
                         fileListUnvalidated.add(localROOTPrefix+lfn)
+                        # long listing format: permissions, links, uid, gid, size, locality, path
+                        fields = l.split()
+                        if len(fields) > 4 and fields[4].isdigit():
+                            fingerprints[localROOTPrefix+lfn] = (int(fields[4]), None)
+                        else:
+                            fingerprints[localROOTPrefix+lfn] = None
 
                     if lastSize !=  len(fileListUnvalidated):
                         lastSize = len(fileListUnvalidated)
@@ -244,38 +359,21 @@ def getTreeFilesAndNormalizations(maxFilesMC = None, maxFilesData = None, quiet
                 evCnt = 0
                 fileListUnvalidated = set()
 
-            if maxFiles == None and usePickle: 
-                if os.path.isfile(pickleName):
-                    pkl_file = open(pickleName, 'rb')
-                    pickledData = pickle.load(pkl_file)
-                    if set(pickledData["files"])!=set(fileListUnvalidated):
-                        print "File list from pickled file and unvalidated list of files different"
-                        print "Broken (?) pickle file", pickleName
-                    else:
-                        print "Cached data from", pickleName
-                        fileListUnvalidated = set()  # Q&D - disable validation. 
-                        fileList = pickledData["files"]
-                        evCnt =  pickledData["evCnt"]
-                        evCntSeenByTreeProducers = pickledData["evCntSeenByTreeProducers"]
-                        fromPickle = True
-
-            # xxxx
+            knownResults = {}
+            if usePickle:
+                knownResults = loadValidationCache(pickleName, fingerprints)
+                print "Cached validation results from", pickleName, "for", len(knownResults), "files"
+
             if fileListUnvalidated:
-                validationResult = validateRootFiles(fileListUnvalidated, maxFiles)
+                validationResult = validateRootFiles(fileListUnvalidated, maxFiles, knownResults=knownResults)
                 fileList =  validationResult["fileList"]
                 evCnt = validationResult["evCnt"]
                 evCntSeenByTreeProducers = validationResult["evCntSeenByTreeProducers"]
 
-        if writePickle and not fromPickle and  maxFiles == None and usePickle: 
-            toPickle = {}
-            toPickle["files"] = fileList
-            toPickle["evCnt"] = evCnt
-            toPickle["evCntSeenByTreeProducers"] = evCntSeenByTreeProducers
-
-            # pickleName
-            outputPickle = open(pickleName, 'wb')
-            pickle.dump(toPickle, outputPickle)
-            outputPickle.close()
+                if usePickle:
+                    fileResults = dict(knownResults)
+                    fileResults.update(validationResult["fileResults"])
+                    saveValidationCache(pickleName, fingerprints, fileResults)
 
 
         if not quiet: print tab, "number of tree files:", len(fileList)
@@ -0,0 +1,94 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import bisect
+import numpy
+
+# Family of 1D histograms with common binning, one histogram per variation
+# (e.g. _central, _puUp, _jecDown...). Single fill call fills the value for
+# many variations at once; bin is found only once.
+#
+# Contents are kept in numpy arrays of shape [variations, bins+2] (sum of
+# weights and sum of squared weights, under/overflow included). Histograms
+# are not touched until flush is called (e.g. from finalize) - it sets
+# contents and errors (Sumw2) of the ROOT histograms.
+#
+# Usage:
+#   bank = HistogramBank({"_central": hCentral, "_puUp": hPuUp})
+#   bank.fill(x, {"_central": w1, "_puUp": w2})
+#   ...
+#   bank.flush()
+class HistogramBank:
+    def __init__(self, histos):
+        if not histos:
+            raise Exception("HistogramBank: no histograms given")
+        self.histos = histos
+        self.labels = sorted(histos.keys())
+        self.index = dict((l, i) for i, l in enumerate(self.labels))
+
+        axis = histos[self.labels[0]].GetXaxis()
+        self.nBins = axis.GetNbins()
+        self.edges = [axis.GetBinLowEdge(i) for i in xrange(1, self.nBins+2)]
+        for l in self.labels:
+            if histos[l].GetNbinsX() != self.nBins:
+                raise Exception("HistogramBank: different binning for " + histos[l].GetName())
+
+        self.sumw = numpy.zeros((len(self.labels), self.nBins+2))
+        self.sumw2 = numpy.zeros((len(self.labels), self.nBins+2))
+        self.entries = numpy.zeros(len(self.labels))
+
+    # Creates TH1F for each variation, histogram name is namePattern % variation
+    @classmethod
+    def create(cls, namePattern, variations, *binning):
+        histos = {}
+        for v in variations:
+            name = namePattern % v
+            histos[v] = ROOT.TH1F(name, name, *binning)
+            histos[v].Sumw2()
+        return cls(histos)
+
+    def getHistos(self):
+        return [self.histos[l] for l in self.labels]
+
+    # same bin numbering as in TH1: 0 - underflow, nBins+1 - overflow
+    def findBin(self, value):
+        return bisect.bisect_right(self.edges, value)
+
+    # weights - dictionary: variation -> weight
+    def fill(self, value, weights):
+        b = self.findBin(value)
+        for l in weights:
+            i = self.index[l]
+            w = weights[l]
+            self.sumw[i, b] += w
+            self.sumw2[i, b] += w*w
+            self.entries[i] += 1
+
+    # batch version: values - array of length n, weights - dictionary with
+    # arrays of length n
+    def fillMany(self, values, weights):
+        bins = numpy.searchsorted(self.edges, values, side="right")
+        for l in weights:
+            i = self.index[l]
+            w = numpy.asarray(weights[l], dtype=numpy.float64)
+            self.sumw[i] += numpy.bincount(bins, weights=w, minlength=self.nBins+2)
+            self.sumw2[i] += numpy.bincount(bins, weights=w*w, minlength=self.nBins+2)
+            self.entries[i] += len(bins)
+
+    # adds accumulated contents to the histograms and resets the accumulators
+    def flush(self):
+        for l in self.labels:
+            i = self.index[l]
+            h = self.histos[l]
+            if h.GetSumw2N() == 0:
+                h.Sumw2()
+            entries = h.GetEntries() # note: SetBinContent changes number of entries
+            for b in xrange(self.nBins+2):
+                if self.sumw2[i, b] == 0: continue
+                err = h.GetBinError(b)
+                h.SetBinContent(b, h.GetBinContent(b) + self.sumw[i, b])
+                h.SetBinError(b, (err*err + self.sumw2[i, b])**0.5)
+            h.SetEntries(entries + self.entries[i])
+        self.sumw[:] = 0
+        self.sumw2[:] = 0
+        self.entries[:] = 0
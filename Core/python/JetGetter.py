@@ -10,7 +10,6 @@ class Jet():
         self.p4vecGen = genJet
         self.jetID = jetID
         self.i = i
-        self.dr = ROOT.Math.VectorUtil.DeltaR
 
 
     def p4(self):
@@ -36,24 +35,10 @@ class Jet():
         return self.p4vecGen
 
 
-    # todo: use index as a first check??
+    # jets are equal if they point in the same direction (deltaR == 0)
     def __eq__(self, other):
         if other == None: return False
-        #if self.p4 == other.p4: return True # could speed up a bit
-        dr = self.dr(self.p4vec, other.p4vec)
-        ret  = dr == 0.
-        ret2 = dr < 0.001
-        if ret != ret2:
-            print "Warning:Jet:dr equality may be calculated wrong for", self.pt(), self.eta(), "|", other.pt(), other.eta()
-        if not ret: return ret
-        pt1 = self.pt()
-        pt2 = other.pt()
-        
-        if pt1 != pt2:
-            print "Warning:Jet:pt equality may be calculated wrong for", self.pt(), self.eta(), "|", other.pt(), other.eta()
-
-        return ret
-        
+        return self.p4vec.eta() == other.p4vec.eta() and self.p4vec.phi() == other.p4vec.phi()
 
     def __neq__(self, other):
         return not self.__eq__(other)
@@ -120,14 +105,18 @@ class JetGetter:
 
     def newEvent(self, chain):
         self.data = {} # Note: this way we enforce user to call this method (note, that self.data is not present in init)
+        self.jets = {}
+        self.filtered = {}
         self.chain = chain
 
-    # TODO: cacheing
-    def get(self, shift):
-        cnt = 0
+    # jets for a given shift are build once per event (see newEvent)
+    def getJets(self, shift):
         if shift not in self.knownShifts:   # variation of a different kind, e.g. from PU
             shift = "_central"
 
+        if shift in self.jets:
+            return self.jets[shift]
+
         if shift not in self.data:
             # todo: choose what is actually read
             self.data.setdefault(shift, {}).setdefault("recojets", getattr(self.chain, self.jetcol+self.knownShifts[shift]))
@@ -136,7 +125,10 @@ class JetGetter:
             if not self.disableId:
                 self.data[shift].setdefault("jetid", getattr(self.chain, self.jetcolID+self.knownShifts[shift]))
 
-        while cnt < self.data[shift]["recojets"].size():
+        jets = []
+        cnt = 0
+        size = self.data[shift]["recojets"].size()
+        while cnt < size:
             jet = self.data[shift]["recojets"].at(cnt)
             if not self.disableGen:
                 genjet = self.data[shift]["genjets"].at(cnt)
@@ -146,5 +138,22 @@ class JetGetter:
                 id =   self.data[shift]["jetid"].at(cnt)
             else:
                 id = None
-            yield Jet(jet, genjet, id, cnt)
+            jets.append(Jet(jet, genjet, id, cnt))
             cnt += 1 # we could use a single cnt+=1 at the end, but this would be error prone
+
+        self.jets[shift] = jets
+        return jets
+
+    def get(self, shift):
+        return iter(self.getJets(shift))
+
+    # list of jets with pt > ptMin, |eta| < etaMax (and passing jet id). Returned
+    # list is shared between callers - do not modify it
+    def getFiltered(self, shift, ptMin, etaMax, requireId = True):
+        if shift not in self.knownShifts:
+            shift = "_central"
+        key = (shift, ptMin, etaMax, requireId)
+        if key not in self.filtered:
+            self.filtered[key] = [j for j in self.getJets(shift) \
+                                    if j.pt() > ptMin and abs(j.eta()) < etaMax and (not requireId or j.jetid())]
+        return self.filtered[key]
@@ -0,0 +1,101 @@
+import numpy
+
+# Matching of reco jets to gen jets (e.g. for filling RooUnfoldResponse).
+# Distances between all reco and gen jets of an event are calculated once
+# (deltaRMatrix); the matching itself works on this matrix only.
+#
+# Matching methods:
+#   closest - each reco jet gets the closest gen jet. Gen jet may be
+#             assigned to more than one reco jet
+#   greedy  - unique matching; pairs are taken in order of increasing deltaR
+#   optimal - unique matching minimizing sum of deltaR (needs scipy)
+#
+# In all cases matches with deltaR >= maxDR are dropped. Result of match is an
+# array with index of the gen jet matched to each reco jet (-1 - no match)
+
+def deltaRMatrix(eta1, phi1, eta2, phi2):
+    eta1 = numpy.asarray(eta1, dtype=numpy.float64)
+    phi1 = numpy.asarray(phi1, dtype=numpy.float64)
+    eta2 = numpy.asarray(eta2, dtype=numpy.float64)
+    phi2 = numpy.asarray(phi2, dtype=numpy.float64)
+    deta = eta1[:, None] - eta2[None, :]
+    dphi = numpy.abs(phi1[:, None] - phi2[None, :])
+    dphi = numpy.where(dphi > numpy.pi, 2*numpy.pi - dphi, dphi)
+    return numpy.sqrt(deta*deta + dphi*dphi)
+
+class JetMatcher:
+    def __init__(self, maxDR = 0.3, method = "greedy"):
+        if method not in ("closest", "greedy", "optimal"):
+            raise Exception("JetMatcher: matching method not known: " + method)
+        self.maxDR = maxDR
+        self.method = method
+        self.dr = None
+
+    # jets - anything with eta() and phi() methods
+    def matchJets(self, recoJets, genJets):
+        return self.match([j.eta() for j in recoJets], [j.phi() for j in recoJets],
+                          [j.eta() for j in genJets], [j.phi() for j in genJets])
+
+    def match(self, recoEta, recoPhi, genEta, genPhi):
+        self.dr = deltaRMatrix(recoEta, recoPhi, genEta, genPhi)
+        return self.matchMatrix(self.dr)
+
+    def matchMatrix(self, dr):
+        nReco, nGen = dr.shape
+        recoToGen = numpy.full(nReco, -1, dtype=numpy.int64)
+        if nReco == 0 or nGen == 0:
+            return recoToGen
+
+        if self.method == "closest":
+            closest = dr.argmin(axis=1)
+            good = dr[numpy.arange(nReco), closest] < self.maxDR
+            recoToGen[good] = closest[good]
+        elif self.method == "greedy":
+            order = numpy.argsort(dr, axis=None, kind="mergesort")
+            usedGen = numpy.zeros(nGen, dtype=bool)
+            for flat in order:
+                iReco, iGen = divmod(int(flat), nGen)
+                if dr[iReco, iGen] >= self.maxDR: break
+                if recoToGen[iReco] >= 0 or usedGen[iGen]: continue
+                recoToGen[iReco] = iGen
+                usedGen[iGen] = True
+        else:
+            from scipy.optimize import linear_sum_assignment
+            # pairs above the cut are never better than no match
+            cost = numpy.where(dr < self.maxDR, dr, self.maxDR*(nReco+nGen+1))
+            rows, cols = linear_sum_assignment(cost)
+            good = dr[rows, cols] < self.maxDR
+            recoToGen[rows[good]] = cols[good]
+
+        return recoToGen
+
+    # Classifies reco pairs (list of (i1, i2) tuples, indices of reco jets) as
+    # fills or fakes and finds gen pairs (indices of gen jets) that were missed.
+    #   fills  - list of (recoPair, genPair), genPair is sorted
+    #   fakes  - list of reco pairs without matching gen pair
+    #   misses - list of gen pairs without reco pair
+    # Reco pair is matched to a gen pair if both jets are matched to two
+    # different gen jets forming a pair from genPairs not used before (and
+    # accept(recoPair, genPair) is true, if given). Reco pairs are processed
+    # in the given order.
+    def matchPairs(self, recoToGen, recoPairs, genPairs, accept = None):
+        uniquePairs = []
+        for p in genPairs:
+            p = (min(p), max(p))
+            if p not in uniquePairs:
+                uniquePairs.append(p)
+        available = set(uniquePairs)
+        fills = []
+        fakes = []
+        for p in recoPairs:
+            g1 = recoToGen[p[0]]
+            g2 = recoToGen[p[1]]
+            genPair = (int(min(g1, g2)), int(max(g1, g2)))
+            if g1 >= 0 and g2 >= 0 and g1 != g2 and genPair in available \
+               and (accept == None or accept(p, genPair)):
+                available.remove(genPair)
+                fills.append((p, genPair))
+            else:
+                fakes.append(p)
+        misses = [p for p in uniquePairs if p in available]
+        return fills, fakes, misses
@@ -0,0 +1,68 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import bisect
+import numpy
+
+# Replacement for edm.LumiReWeighting. Weights (data/MC ratio of normalized
+# pileup distributions) are calculated once, when tables are created, and
+# stored as a dense array - one value per bin of the PU histogram, under and
+# overflow included. Same definition as in LumiReWeighting:
+#
+#   weight(pu) = data(pu)/Integral(data) / ( MC(pu)/Integral(MC) )
+#
+# (0 for bins empty in MC).
+#
+# Tables are cached - all analyzers (or getters) in a single process asking
+# for the same files and histograms share a single instance:
+#
+#   w = PUWeights.get(mcFile, dataFile, "MC", "pileup")
+#   w.weight(truePU)         # single value
+#   w.weights(truePUArray)   # numpy array for a batch of events
+class PUWeights:
+    cache = {}
+
+    @classmethod
+    def get(cls, mcFile, dataFile, mcHistName, dataHistName):
+        key = (mcFile, dataFile, mcHistName, dataHistName)
+        if key not in cls.cache:
+            cls.cache[key] = cls(mcFile, dataFile, mcHistName, dataHistName)
+        return cls.cache[key]
+
+    def __init__(self, mcFile, dataFile, mcHistName, dataHistName):
+        mc = self.readHisto(mcFile, mcHistName)
+        data = self.readHisto(dataFile, dataHistName)
+        if len(mc[0]) != len(data[0]) or numpy.any(mc[0] != data[0]):
+            raise Exception("PUWeights: different binning of " + mcHistName + " and " + dataHistName)
+
+        self.edges = mc[0]
+        mcNorm = mc[1]/mc[1][1:-1].sum()
+        dataNorm = data[1]/data[1][1:-1].sum()
+        self.table = numpy.zeros(len(mcNorm))
+        nonZero = mcNorm != 0
+        self.table[nonZero] = dataNorm[nonZero]/mcNorm[nonZero]
+
+        # plain python copies - faster for single value lookups
+        self.edgesList = self.edges.tolist()
+        self.tableList = self.table.tolist()
+
+    # returns bin edges and contents (under/overflow included)
+    @staticmethod
+    def readHisto(fileName, histName):
+        rootFile = ROOT.TFile(fileName)
+        if not rootFile or rootFile.IsZombie():
+            raise Exception("PUWeights: cannot open " + fileName)
+        h = rootFile.Get(histName)
+        if not h:
+            raise Exception("PUWeights: histogram " + histName + " not found in " + fileName)
+        nBins = h.GetNbinsX()
+        edges = numpy.array([h.GetXaxis().GetBinLowEdge(i) for i in xrange(1, nBins+2)])
+        contents = numpy.array([h.GetBinContent(i) for i in xrange(0, nBins+2)])
+        rootFile.Close()
+        return edges, contents
+
+    def weight(self, pu):
+        return self.tableList[bisect.bisect_right(self.edgesList, pu)]
+
+    def weights(self, pu):
+        return self.table[numpy.searchsorted(self.edges, pu, side="right")]
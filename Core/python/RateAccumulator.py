@@ -0,0 +1,49 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import bisect
+import math
+
+# Rate (or efficiency) vs threshold histograms. Event with maximal passing
+# threshold maxThr should be counted in every bin with center below maxThr
+# (with 0.1 tolerance):
+#
+#   binCenter < maxThr or abs(binCenter-maxThr) < 0.1
+#
+# Instead of filling all those bins, during the event loop only the last such
+# bin is filled (single Fill per event, histogram holds the distribution of
+# maximal thresholds). Since the histogram content is additive, worker
+# outputs can be merged as usual. After merging (finalizeWhenMerged)
+# integrate converts it to the rate histogram (reverse cumulative sum of
+# contents and of squared errors, so Sumw2 errors are the same as when
+# filling every bin).
+class RateAccumulator:
+    def __init__(self, hist):
+        self.hist = hist
+        axis = hist.GetXaxis()
+        self.centers = [axis.GetBinCenter(i) for i in xrange(1, hist.GetNbinsX()+1)]
+
+    # number of bins passed by the event
+    def getNumBins(self, maxThr):
+        n = bisect.bisect_left(self.centers, maxThr)
+        while n < len(self.centers) and abs(self.centers[n]-maxThr) < 0.1:
+            n += 1
+        return n
+
+    def fill(self, maxThr, weight):
+        n = self.getNumBins(maxThr)
+        if n > 0:
+            self.hist.Fill(self.centers[n-1], weight)
+
+    # to be called once, on the merged histogram
+    @staticmethod
+    def integrate(hist):
+        entries = hist.GetEntries() # note: SetBinContent changes number of entries
+        total, totalErr2 = 0., 0.
+        for i in xrange(hist.GetNbinsX(), 0, -1):
+            err = hist.GetBinError(i)
+            total += hist.GetBinContent(i)
+            totalErr2 += err*err
+            hist.SetBinContent(i, total)
+            hist.SetBinError(i, math.sqrt(totalErr2))
+        hist.SetEntries(entries)
@@ -0,0 +1,110 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import os
+import json
+import hashlib
+
+# On-disk cache of entries passing a selection. For every
+# (sample, file set fingerprint, selection string) a TEntryList with indices
+# of the selected entries is stored in a single root file (cacheFile). On the
+# first request the selection is evaluated (TTree::Draw with the "entrylist"
+# option - only branches used in the selection are read), later requests
+# (also in other runs) get the stored list, so only selected entries have to be
+# read again.
+#
+# Fingerprint of a file set consists of file paths, sizes and modification
+# times - recreating the input files invalidates the cached lists.
+#
+# Ranges (min/max) of all branches of the full tree are cached the same way
+# (getRanges), so variable ranges do not depend on the selection and do not
+# need a pass over the full tree on repeated runs.
+#
+# Usage:
+#   cache = SelectionCache("selections.root")
+#   fp = SelectionCache.getFingerprint([fileName])
+#   tree.SetEntryList(cache.getEntryList(tree, "sampleName", fp, "ptAve > 30"))
+class SelectionCache:
+    def __init__(self, cacheFile):
+        self.cacheFile = cacheFile
+        self.cached = {}
+
+    @staticmethod
+    def getFingerprint(fileNames):
+        ret = []
+        for f in sorted(fileNames):
+            st = os.stat(f)
+            ret.append("{0}:{1}:{2}".format(os.path.abspath(f), st.st_size, int(st.st_mtime)))
+        return ";".join(ret)
+
+    @staticmethod
+    def getKey(sample, fingerprint, selection, prefix = "sel_"):
+        return prefix + hashlib.md5("\n".join([sample, fingerprint, selection])).hexdigest()
+
+    def read(self, key):
+        if not os.path.exists(self.cacheFile):
+            return None
+        f = ROOT.TFile(self.cacheFile, "r")
+        if not f or f.IsZombie():
+            print "SelectionCache: cannot read", self.cacheFile, "- ignoring"
+            return None
+        obj = f.Get(key)
+        if obj == None:
+            obj = None
+        elif obj.InheritsFrom("TEntryList"):
+            obj.SetDirectory(0)
+        f.Close()
+        return obj
+
+    def write(self, key, obj):
+        curPath = ROOT.gDirectory.GetPath()
+        f = ROOT.TFile(self.cacheFile, "update")
+        if not f or f.IsZombie():
+            print "SelectionCache: cannot write", self.cacheFile, "- not cached"
+        else:
+            f.WriteTObject(obj, key, "Overwrite")
+            f.Close()
+        ROOT.gDirectory.cd(curPath)
+
+    # returned list is owned by the cache (do not delete it)
+    def getEntryList(self, tree, sample, fingerprint, selection):
+        key = self.getKey(sample, fingerprint, selection)
+        if key in self.cached:
+            return self.cached[key]
+
+        elist = self.read(key)
+        if elist == None:
+            curPath = ROOT.gDirectory.GetPath()
+            ROOT.gROOT.cd()
+            try:
+                n = tree.Draw(">>"+key, selection, "entrylist goff")
+                if n < 0:
+                    raise Exception("SelectionCache: cannot evaluate selection: " + selection)
+                elist = ROOT.gROOT.Get(key)
+                elist.SetDirectory(0)
+                elist.SetTitle(selection)
+            finally:
+                ROOT.gDirectory.cd(curPath)
+            self.write(key, elist)
+
+        self.cached[key] = elist
+        return elist
+
+    # dictionary branch name -> (min, max) over all entries of the tree
+    def getRanges(self, tree, sample, fingerprint):
+        key = self.getKey(sample, fingerprint, "", "rng_")
+        if key in self.cached:
+            return self.cached[key]
+
+        stored = self.read(key)
+        if stored != None:
+            ranges = dict((k, tuple(v)) for k, v in json.loads(stored.GetTitle()).iteritems())
+        else:
+            ranges = {}
+            for b in tree.GetListOfBranches():
+                name = b.GetName()
+                ranges[name] = (tree.GetMinimum(name), tree.GetMaximum(name))
+            self.write(key, ROOT.TNamed(key, json.dumps(ranges)))
+
+        self.cached[key] = ranges
+        return ranges
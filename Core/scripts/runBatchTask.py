@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+# Executes a single task written by BatchExecutor (see Executors.py):
+#
+#   runBatchTask.py /path/to/task_N.pkl
+#
+# Exit code different from 0 means the task failed (and will be resubmitted)
+
+import sys, os, pickle
+import ROOT
+ROOT.gROOT.SetBatch(True)
+ROOT.gSystem.Load("libFWCoreFWLite.so")
+ROOT.AutoLibraryLoader.enable()
+
+from CommonFSQFramework.Core.Executors import MultiprocessingExecutor
+
+def main():
+    if len(sys.argv) != 2:
+        print "Usage: runBatchTask.py taskFile"
+        sys.exit(1)
+
+    taskFile = open(sys.argv[1], "rb")
+    task = pickle.load(taskFile)
+    taskFile.close()
+
+    # same convention as for proof: analyzer class is defined in a file with
+    # the same name, analyzers expect to be run from their directory
+    sys.path.insert(0, task["analyzerDir"])
+    os.chdir(task["analyzerDir"])
+    mod = __import__(task["className"])
+    selectorClass = getattr(mod, task["className"])
+
+    print "Running", task["className"], "on", len(task["files"]), "files from", task["sampleName"]
+    todo = [(f, 0, -1) for f in task["files"]]
+    MultiprocessingExecutor.runTasks(selectorClass, task["sampleName"], task["treeName"],
+                                     task["slaveParameters"], todo, task["partFile"])
+    print "Done"
+
+if __name__ == "__main__":
+    sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+    main()
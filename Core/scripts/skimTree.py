@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import sys
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import os, fnmatch
+import multiprocessing
+from optparse import OptionParser
+
+from CommonFSQFramework.Core.GetDatasetInfo import getTreeFilesAndNormalizations
+from CommonFSQFramework.Core.Util import getAnaDefinition
+
+# Skims tree files of a sample: only entries passing the selection (TTree
+# formula, evaluated by TTree::CopyTree) and (optionally) only given branches
+# are written. Every input file is skimmed separately (in parallel), output
+# files keep the input layout (same tree path, infoHisto copied - event counts
+# used for normalization stay those of the full sample), so the output
+# directory can be used as pathTrees of a new sample. E.g. zero-PU subset:
+#
+#   skimTree.py QCD_Pt-15to3000_Tune4C_Flat_13TeV_pythia8 -c "PUNumInteractions==0"
+#
+# Note: branches used in the selection are always written.
+
+# top level branches read by the selection. Codes that are not leaves
+# (aliases, some Sum$/method call forms) give no leaf and are skipped; for
+# split objects the whole (top level) branch is returned
+def getBranchesUsed(tree, selection):
+    formula = ROOT.TTreeFormula("skimSelection", selection, tree)
+    if formula.GetNdim() == 0:
+        raise Exception("Cannot compile selection: " + selection)
+    ret = set()
+    for i in xrange(formula.GetNcodes()):
+        leaf = formula.GetLeaf(i)
+        if leaf == None:
+            continue
+        ret.add(leaf.GetBranch().GetMother().GetName())
+    del formula
+    return ret
+
+# branch together with all its sub-branches (split objects)
+def enableBranch(tree, branch):
+    tree.SetBranchStatus(branch.GetName(), 1)
+    for sub in branch.GetListOfBranches():
+        enableBranch(tree, sub)
+
+def selectBranches(tree, branches, selection):
+    allBranches = [b.GetName() for b in tree.GetListOfBranches()]
+    keep = getBranchesUsed(tree, selection)
+    for pattern in branches:
+        matched = fnmatch.filter(allBranches, pattern)
+        if not matched:
+            raise Exception("No branch matching " + pattern)
+        keep.update(matched)
+    tree.SetBranchStatus("*", 0)
+    for b in keep:
+        enableBranch(tree, tree.GetBranch(b))
+
+# executed in the worker processes
+def skimFile(args):
+    inputFile, outputFile, treeName, selection, branches = args
+    infile = ROOT.TFile.Open(inputFile, "r")
+    if not infile or infile.IsZombie():
+        return inputFile, -1, -1
+    tree = infile.Get(treeName)
+    if not tree:
+        return inputFile, -1, -1
+    if branches:
+        selectBranches(tree, branches, selection)
+
+    outfile = ROOT.TFile(outputFile, "recreate")
+    treeDir = os.path.dirname(treeName)
+    if treeDir:
+        outfile.mkdir(treeDir).cd()
+    skimmed = tree.CopyTree(selection)
+    nIn, nOut = tree.GetEntries(), skimmed.GetEntries()
+    skimmed.Write()
+
+    infoHisto = infile.Get("infoHisto/cntHisto")
+    if infoHisto:
+        outfile.mkdir("infoHisto").cd()
+        infoHisto.Write()
+
+    outfile.Close()
+    infile.Close()
+    return inputFile, nIn, nOut
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] sampleName")
+    parser.add_option("-c", "--cut", action="store", type="string", dest="cut", help="selection (TTree formula)" )
+    parser.add_option("-b", "--branches", action="store", type="string", dest="branches", \
+                      help="comma separated list of branches to keep (wildcards allowed). Default: all" )
+    parser.add_option("-t", "--tree", action="store", type="string", dest="tree", default="MNTriggerAnaNew/data", \
+                      help="tree name (default: MNTriggerAnaNew/data)" )
+    parser.add_option("-o", "--outdir", action="store", type="string", dest="outdir", help="output directory (default: ./sampleName_skim)" )
+    parser.add_option("-n", "--maxFiles", action="store", type="int", dest="maxFiles", help="process at most that many files" )
+    parser.add_option("-j", "--nWorkers", action="store", type="int", dest="nWorkers", help="number of parallel jobs (default: number of cores)" )
+    (options, args) = parser.parse_args()
+
+    anaDef = getAnaDefinition("sam")
+    if len(args) != 1 or args[0] not in anaDef or not options.cut:
+        parser.print_help()
+        print "Avaliable samples:"
+        for t in anaDef:
+            print " ", t
+        sys.exit(1)
+
+    sample = args[0]
+    branches = []
+    if options.branches:
+        branches = [b.strip() for b in options.branches.split(",") if b.strip()]
+
+    treeFilesAndNormalizations = getTreeFilesAndNormalizations(maxFilesMC=options.maxFiles, maxFilesData=options.maxFiles,
+                quiet = True, samplesToProcess=[sample,])
+    files = treeFilesAndNormalizations[sample]["files"]
+    if not files:
+        print "No files found for sample", sample, "- exiting"
+        sys.exit(1)
+
+    odir = options.outdir or sample+"_skim"
+    if not os.path.exists(odir):
+        os.makedirs(odir)
+
+    tasks = []
+    for i, f in enumerate(sorted(files)):
+        oname = os.path.join(odir, "trees_"+str(i+1)+"_skim.root")
+        tasks.append( (f, oname, options.tree, options.cut, branches) )
+
+    print "Skimming", len(tasks), "files of", sample, "with:", options.cut
+    pool = multiprocessing.Pool(options.nWorkers or multiprocessing.cpu_count())
+    totalIn, totalOut, failed = 0, 0, []
+    try:
+        for inputFile, nIn, nOut in pool.imap_unordered(skimFile, tasks):
+            if nIn < 0:
+                failed.append(inputFile)
+                print "Problem reading", inputFile
+                continue
+            totalIn += nIn
+            totalOut += nOut
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    print "Entries:", totalIn, "-> after skim:", totalOut
+    print "Output written to", odir
+    if failed:
+        print "Failed files:", len(failed)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,8 @@ from array import *
 # you have to run this file from directory where it is saved
 
 import CommonFSQFramework.Core.ExampleProofReader 
+from CommonFSQFramework.Core.PUWeights import PUWeights
+from CommonFSQFramework.Core.RateAccumulator import RateAccumulator
 import CommonFSQFramework.Core.Style
 
 class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
@@ -26,28 +28,28 @@ class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
 
         self.newlumiWeighters = {}
         #'''
-        #self.newlumiWeighters["flat2050toPU15"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU15/pileup")
-        #self.newlumiWeighters["flat2050toPU20"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU20/pileup")
-        #self.newlumiWeighters["flat2050toPU25"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU25/pileup")
-        #self.newlumiWeighters["flat2050toPU30"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU30/pileup")
+        #self.newlumiWeighters["flat2050toPU15"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU15/pileup")
+        #self.newlumiWeighters["flat2050toPU20"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU20/pileup")
+        #self.newlumiWeighters["flat2050toPU25"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU25/pileup")
+        #self.newlumiWeighters["flat2050toPU30"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU30/pileup")
         #'''
 
-        #self.newlumiWeighters["flat2050toPU35"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU35/pileup")
-        #self.newlumiWeighters["flat2050toPU40"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU40/pileup")
-        #self.newlumiWeighters["flat2050toPU45"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU45/pileup")
-        #self.newlumiWeighters["flat2050toPU50"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU50/pileup")
+        #self.newlumiWeighters["flat2050toPU35"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU35/pileup")
+        #self.newlumiWeighters["flat2050toPU40"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU40/pileup")
+        #self.newlumiWeighters["flat2050toPU45"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU45/pileup")
+        #self.newlumiWeighters["flat2050toPU50"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU50/pileup")
 
         #'''
-        self.newlumiWeighters["PU20toPU20"] = edm.LumiReWeighting(puFile, puFile, "PU20/pileup", "PU20/pileup")
-        self.newlumiWeighters["PU20toPU15"] = edm.LumiReWeighting(puFile, puFile, "PU20/pileup", "PU15/pileup")
-        self.newlumiWeighters["PU20toPU25"] = edm.LumiReWeighting(puFile, puFile, "PU20/pileup", "PU25/pileup")
-        self.newlumiWeighters["PU20toPU30"] = edm.LumiReWeighting(puFile, puFile, "PU20/pileup", "PU30/pileup")
+        self.newlumiWeighters["PU20toPU20"] = PUWeights.get(puFile, puFile, "PU20/pileup", "PU20/pileup")
+        self.newlumiWeighters["PU20toPU15"] = PUWeights.get(puFile, puFile, "PU20/pileup", "PU15/pileup")
+        self.newlumiWeighters["PU20toPU25"] = PUWeights.get(puFile, puFile, "PU20/pileup", "PU25/pileup")
+        self.newlumiWeighters["PU20toPU30"] = PUWeights.get(puFile, puFile, "PU20/pileup", "PU30/pileup")
         #'''
 
-        #self.newlumiWeighters["PU40toPU45"] = edm.LumiReWeighting(puFile, puFile, "PU40/pileup", "PU45/pileup")
-        #self.newlumiWeighters["PU40toPU40"] = edm.LumiReWeighting(puFile, puFile, "PU40/pileup", "PU40/pileup")
-        #self.newlumiWeighters["PU40toPU35"] = edm.LumiReWeighting(puFile, puFile, "PU40/pileup", "PU35/pileup")
-        #self.newlumiWeighters["PU40toPU30"] = edm.LumiReWeighting(puFile, puFile, "PU40/pileup", "PU30/pileup")
+        #self.newlumiWeighters["PU40toPU45"] = PUWeights.get(puFile, puFile, "PU40/pileup", "PU45/pileup")
+        #self.newlumiWeighters["PU40toPU40"] = PUWeights.get(puFile, puFile, "PU40/pileup", "PU40/pileup")
+        #self.newlumiWeighters["PU40toPU35"] = PUWeights.get(puFile, puFile, "PU40/pileup", "PU35/pileup")
+        #self.newlumiWeighters["PU40toPU30"] = PUWeights.get(puFile, puFile, "PU40/pileup", "PU30/pileup")
  
         self.histos = {}
         self.histos["genW"] =   ROOT.TH1D("genW", "genW", 1, 0, 2)
@@ -55,6 +57,7 @@ class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
         self.sumGenW = 0.
 
         self.histoDenoms = {}
+        self.rateAccumulators = {}
 
         todo = []
         todo.append( ("L1SingleJet", 15.5, 177.5) )
@@ -89,6 +92,7 @@ class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
                 self.histos[name].SetMarkerStyle(20)
                 self.histos[name].Sumw2()
                 self.GetOutputList().Add(self.histos[name])
+                self.rateAccumulators[name] = RateAccumulator(self.histos[name])
                 nameDenom = name+"Denom"
                 self.histoDenoms[nameDenom] = ROOT.TH1D(nameDenom, nameDenom, 1, -0.5, 0.5)
                 self.histoDenoms[nameDenom].Sumw2()
@@ -102,18 +106,9 @@ class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
 
 
 
+    # histogram is converted to rate in finalizeWhenMerged
     def fillRate(self, hist, maxThr, weight):
-        nbins = hist.GetNbinsX()
-        getBinCenter = hist.GetXaxis().GetBinCenter
-        for i in xrange(1,nbins+1):
-            #binCenter = int(getBinCenter(i))
-            binCenter = getBinCenter(i)
-
-            # As always "<=" is a tricky thing...
-            if binCenter < maxThr or abs(binCenter-maxThr) < 0.1:
-                hist.Fill(binCenter, weight)
-            else:
-                break
+        self.rateAccumulators[hist.GetName()].fill(maxThr, weight)
 
 
     #  0.0 0.34906578064 0.698131561279 1.04719740549 1.39626330534 1.74532920519 2.09439510107 2.44346088568 2.79252672195 3.14159256617
@@ -226,6 +221,7 @@ class L1Rate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
             #raise "HERE"
             # ptint XXXXX
             denom = histos[h+"Denom"].GetBinContent(1)
+            RateAccumulator.integrate(histos[h])
             #print "DDD", denom
             '''
             for iBin in xrange(1, histos[h].GetNbinsX()+1):
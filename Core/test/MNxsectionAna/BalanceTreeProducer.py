@@ -16,6 +16,7 @@ from array import *
 
 # you have to run this file from directory where it is saved
 import CommonFSQFramework.Core.ExampleProofReader 
+from CommonFSQFramework.Core.PUWeights import PUWeights
 from CommonFSQFramework.Core.JetGetter import JetGetter
 from  CommonFSQFramework.Core.BetterJetGetter import BetterJetGetter
 
@@ -123,13 +124,13 @@ class BalanceTreeProducer(CommonFSQFramework.Core.ExampleProofReader.ExampleProo
         puFiles["j15_0_95"] = edm.FileInPath("CommonFSQFramework/Core/test/MNxsectionAna/data/pu_j15_0_95.root").fullPath()
 
         self.lumiWeighters = {}
-        self.lumiWeighters["_jet15_central"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_1"], "MC", "pileup")
-        self.lumiWeighters["_jet15_puUp"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_1_05"], "MC", "pileup")
-        self.lumiWeighters["_jet15_puDown"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_0_95"], "MC", "pileup")
+        self.lumiWeighters["_jet15_central"] = PUWeights.get(jet15FileV2, puFiles["j15_1"], "MC", "pileup")
+        self.lumiWeighters["_jet15_puUp"] = PUWeights.get(jet15FileV2, puFiles["j15_1_05"], "MC", "pileup")
+        self.lumiWeighters["_jet15_puDown"] = PUWeights.get(jet15FileV2, puFiles["j15_0_95"], "MC", "pileup")
 
-        self.lumiWeighters["_dj15fb_central"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_1"], "MC", "pileup")
-        self.lumiWeighters["_dj15fb_puUp"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_1_05"], "MC", "pileup")
-        self.lumiWeighters["_dj15fb_puDown"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_0_95"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_central"] = PUWeights.get(jet15FileV2, puFiles["dj15_1"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_puUp"] = PUWeights.get(jet15FileV2, puFiles["dj15_1_05"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_puDown"] = PUWeights.get(jet15FileV2, puFiles["dj15_0_95"], "MC", "pileup")
 
 
 
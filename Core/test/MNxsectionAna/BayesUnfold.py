@@ -0,0 +1,108 @@
+import numpy
+
+# D'Agostini iterative bayesian unfolding done with numpy. Follows the
+# RooUnfoldBayes implementation (no smoothing, errors propagated from the
+# measured distribution through all iterations as described in
+# arXiv:1105.1160), so it can be used instead of RooUnfoldBayes in unfoldMN.py
+# (which checks the agreement with RooUnfoldBayes on every response it
+# unfolds, see checkBackend there). Tests: test_BayesUnfold.py
+#
+# All arrays hold regular bins only (no under/overflow - as in RooUnfold with
+# overflow treatment disabled):
+#   measured  - [..., nMeas]          distribution to be unfolded
+#   response  - [..., nMeas, nTruth]  matched (measured, truth) pairs
+#   truth     - [..., nTruth]         truth distribution (misses included)
+#   fakes     - [..., nMeas]
+#   hmeas     - [..., nMeas]          measured distribution of the response (fakes included)
+#
+# Leading dimensions are broadcasted, so many spectra (e.g. toys, shifts) can be
+# unfolded with a single call.
+
+# components of a RooUnfoldResponse object
+def responseToArrays(rooresponse):
+    def th1(h):
+        return numpy.array([h.GetBinContent(i) for i in xrange(1, h.GetNbinsX()+1)])
+    hresponse = rooresponse.Hresponse()
+    ret = {}
+    ret["response"] = numpy.array([[hresponse.GetBinContent(i, j) for j in xrange(1, hresponse.GetNbinsY()+1)]
+                                   for i in xrange(1, hresponse.GetNbinsX()+1)])
+    ret["truth"] = th1(rooresponse.Htruth())
+    ret["fakes"] = th1(rooresponse.Hfakes())
+    ret["hmeas"] = th1(rooresponse.Hmeasured())
+    return ret
+
+# Same as RooUnfoldResponse(measured, truth, response) - fakes are the part of
+# the measured distribution not present in the response. Inputs include
+# under/overflow bins (as from UnfoldingToys.histoToArrays), result does not
+def responseFromArrays(hmeas, htruth, hresponse):
+    ret = {}
+    ret["response"] = hresponse[..., 1:-1, 1:-1]
+    ret["truth"] = htruth[..., 1:-1]
+    ret["hmeas"] = hmeas[..., 1:-1]
+    ret["fakes"] = hmeas[..., 1:-1] - hresponse[..., 1:-1, :].sum(axis=-1)
+    return ret
+
+def safeDivide(a, b):
+    ok = b != 0
+    return numpy.where(ok, a/numpy.where(ok, b, 1.), 0.)
+
+# Returns unfolded distribution, its errors and covariance matrix
+def unfold(measured, measuredErr, resp, nIter, alaGri = False):
+    measured = numpy.asarray(measured, dtype=numpy.float64)
+    measuredErr = numpy.asarray(measuredErr, dtype=numpy.float64)
+    response = resp["response"]
+    truth = resp["truth"]
+    fakes = resp["fakes"]
+    hmeas = resp["hmeas"]
+
+    if alaGri:
+        # fakes subtracted from measured distribution (in proportion observed
+        # in MC), then unfolded with no fakes in the response
+        factor = numpy.where(hmeas != 0, 1. - safeDivide(fakes, hmeas), 1.)
+        measured = measured*factor
+        measuredErr = measuredErr*factor
+        fakes = numpy.zeros_like(fakes)
+
+    # probability of measuring in bin j events from cause i, fakes treated as
+    # an additional cause
+    pEC = safeDivide(response, truth[..., None, :])
+    nFakes = fakes.sum(axis=-1)
+    fakeColumn = safeDivide(fakes, nFakes[..., None])
+    shape = numpy.broadcast(pEC[..., 0], fakeColumn).shape
+    pEC = numpy.concatenate((numpy.broadcast_to(pEC, shape + (pEC.shape[-1],)),
+                             numpy.broadcast_to(fakeColumn, shape)[..., None]), axis=-1)
+    eff = pEC.sum(axis=-2)
+    priorShape = numpy.broadcast(truth[..., 0], nFakes).shape
+    n0 = numpy.concatenate((numpy.broadcast_to(truth, priorShape + truth.shape[-1:]),
+                            numpy.broadcast_to(nFakes, priorShape)[..., None]), axis=-1)
+
+    nC = pEC.shape[-1]
+    nE = pEC.shape[-2]
+    batch = numpy.broadcast(pEC[..., 0, 0], measured[..., 0]).shape
+    n0 = numpy.broadcast_to(n0, batch + (nC,))
+    dn0 = numpy.zeros(batch + (nC, nE)) # derivative of the prior wrt measured
+    for k in xrange(nIter):
+        f = numpy.einsum("...ji,...i->...j", pEC, n0)
+        # M_ij = P(E_j|C_i) n0_i / (eff_i f_j)
+        M = safeDivide(numpy.swapaxes(pEC, -1, -2)*n0[..., :, None], eff[..., :, None]*f[..., None, :])
+        nHat = numpy.einsum("...ij,...j->...i", M, measured)
+        if k == 0:
+            dnHat = M.copy()
+        else:
+            # see arXiv:1105.1160, eq. 4
+            a = safeDivide(nHat, n0)
+            b = numpy.einsum("...j,...ij,...rj->...ir", measured, M, M)*safeDivide(eff, n0)[..., None, :]
+            dnHat = M + a[..., :, None]*dn0 - numpy.einsum("...ir,...rk->...ik", b, dn0)
+        n0 = nHat
+        dn0 = dnHat
+
+    nTruth = truth.shape[-1]
+    reco = nHat[..., :nTruth]
+    d = dn0[..., :nTruth, :]
+    cov = numpy.einsum("...ij,...j,...kj->...ik", d, measuredErr*measuredErr, d)
+    errors = numpy.sqrt(numpy.diagonal(cov, axis1=-2, axis2=-1))
+    return reco, errors, cov
+
+# chi2 of unfolded distribution wrt truth (as RooUnfold::Chi2 with kErrors)
+def chi2(reco, errors, truth):
+    return (safeDivide((reco-truth)**2, errors**2)).sum(axis=-1)
@@ -0,0 +1,162 @@
+import numpy
+
+# Batch versions of the dijet selections from DijetVariants.py (BaseDijetAna
+# and derived classes). Instead of looping over jets of a single event, all
+# kernels work on a batch of events stored as jagged arrays (as returned by
+# ColumnarReader):
+#
+#   pt, eta - flat arrays with jets from all events
+#   offsets - jets of event i are pt[offsets[i]:offsets[i+1]]
+#
+# Result of findPairs is a dictionary of flat arrays, one element per selected
+# pair (there can be many pairs per event for the inclusive variants):
+#   event  - index of the event in the batch
+#   i1, i2 - indices of the jets in the flat pt/eta arrays, in the same
+#            order as j1, j2 in MNxsAnalyzerClean.analyze
+#   xs     - value of xsVariable for the pair
+#
+# Pairs are given in the same order as in the double loop over goodRecoJets
+# in MNxsAnalyzerClean.analyze, ties are resolved the same way as in the
+# python version (first jet/pair wins)
+
+# Keeps only jets with pt > ptMin, |eta| < etaMax (and nonzero jetid).
+# Returns indices of the kept jets (in the original flat arrays) and
+# offsets of the reduced collection
+def selectJets(pt, eta, offsets, ptMin, etaMax, jetid = None):
+    mask = (pt > ptMin) & (numpy.abs(eta) < etaMax)
+    if jetid is not None:
+        mask &= (jetid != 0)
+    kept = numpy.flatnonzero(mask)
+    cumulative = numpy.concatenate(([0], numpy.cumsum(mask)))
+    return kept, cumulative[offsets]
+
+# Converts jagged array into a 2d [nEvents, maxJets] array. Missing entries
+# are set to fill. Also returns mask of valid entries
+def toPadded(values, offsets, fill):
+    counts = numpy.diff(offsets)
+    nEvents = len(counts)
+    width = counts.max() if nEvents else 0
+    local = numpy.arange(len(values)) - numpy.repeat(offsets[:-1], counts)
+    rows = numpy.repeat(numpy.arange(nEvents), counts)
+    padded = numpy.full((nEvents, width), fill, dtype=numpy.float64)
+    padded[rows, local] = values
+    valid = numpy.zeros((nEvents, width), dtype=bool)
+    valid[rows, local] = True
+    return padded, valid
+
+def makeResult(event, l1, l2, offsets, pt, eta, ptOfCentral):
+    i1 = offsets[event] + l1
+    i2 = offsets[event] + l2
+    if ptOfCentral:
+        xs = numpy.where(numpy.abs(eta[i1]) < numpy.abs(eta[i2]), pt[i1], pt[i2])
+    else:
+        xs = numpy.abs(eta[i1] - eta[i2])
+    return {"event": event, "i1": i1, "i2": i2, "xs": xs}
+
+def emptyResult():
+    empty = numpy.zeros(0, dtype=numpy.int64)
+    return {"event": empty, "i1": empty, "i2": empty, "xs": numpy.zeros(0)}
+
+# All pairs of valid jets (valid - [nEvents, maxJets] mask), optionally
+# restricted by pairMask - [nEvents, nPairs] for pairs from numpy.triu_indices
+def allPairs(valid, pairMask = None):
+    width = valid.shape[1]
+    if width < 2:
+        return None
+    a, b = numpy.triu_indices(width, 1)
+    ok = valid[:, a] & valid[:, b]
+    if pairMask is not None:
+        ok &= pairMask
+    event, pair = numpy.nonzero(ok) # row major - same order as the python double loop
+    return event, a[pair], b[pair]
+
+# Most backward and most forward jet (MNBasic, MNWindow), events with less than
+# two valid jets are skipped
+def etaExtremes(eta, offsets, valid):
+    paddedEta, _ = toPadded(eta, offsets, 0.)
+    if paddedEta.shape[1] < 2:
+        return None
+    hasPair = valid.sum(axis=1) >= 2
+    lo = numpy.where(valid, paddedEta, numpy.inf).argmin(axis=1)
+    hi = numpy.where(valid, paddedEta, -numpy.inf).argmax(axis=1)
+    event = numpy.flatnonzero(hasPair)
+    return event, lo[event], hi[event]
+
+def inclusiveBasic(pt, eta, offsets):
+    _, valid = toPadded(pt, offsets, 0.)
+    return allPairs(valid)
+
+def inclusiveAsym(pt, eta, offsets):
+    paddedPt, valid = toPadded(pt, offsets, 0.)
+    if paddedPt.shape[1] < 2:
+        return None
+    # filterCol: at least two jets, leading one above 45
+    leading = numpy.where(valid, paddedPt, -numpy.inf).max(axis=1)
+    valid &= ((valid.sum(axis=1) >= 2) & (leading >= 45))[:, None]
+    a, b = numpy.triu_indices(paddedPt.shape[1], 1)
+    # filterPair
+    pairMask = numpy.maximum(paddedPt[:, a], paddedPt[:, b]) > 45
+    return allPairs(valid, pairMask)
+
+def inclusiveWindow(pt, eta, offsets):
+    paddedPt, valid = toPadded(pt, offsets, 0.)
+    return allPairs(valid & (paddedPt < 55))
+
+def mnBasic(pt, eta, offsets):
+    _, valid = toPadded(pt, offsets, 0.)
+    return etaExtremes(eta, offsets, valid)
+
+def mnWindow(pt, eta, offsets):
+    paddedPt, valid = toPadded(pt, offsets, 0.)
+    return etaExtremes(eta, offsets, valid & (paddedPt < 55))
+
+# pair with largest delta eta, out of pairs with at least one jet above 45
+def mnAsym(pt, eta, offsets):
+    paddedPt, valid = toPadded(pt, offsets, 0.)
+    paddedEta, _ = toPadded(eta, offsets, 0.)
+    width = paddedPt.shape[1]
+    if width < 2:
+        return None
+    a, b = numpy.triu_indices(width, 1)
+    ok = valid[:, a] & valid[:, b] & (numpy.maximum(paddedPt[:, a], paddedPt[:, b]) >= 45)
+    deta = numpy.where(ok, numpy.abs(paddedEta[:, a] - paddedEta[:, b]), -1.)
+    best = deta.argmax(axis=1)
+    event = numpy.flatnonzero(ok.any(axis=1))
+    return event, a[best[event]], b[best[event]]
+
+# hardest central (|eta| < 2.8) and hardest forward (|eta| > 3.2) jet
+def fwd11_002(pt, eta, offsets):
+    paddedPt, valid = toPadded(pt, offsets, 0.)
+    paddedEta, _ = toPadded(eta, offsets, 0.)
+    if paddedPt.shape[1] < 2:
+        return None
+    aeta = numpy.abs(paddedEta)
+    cen = valid & (aeta < 2.8)
+    fwd = valid & (aeta > 3.2)
+    bestCen = numpy.where(cen, paddedPt, -numpy.inf).argmax(axis=1)
+    bestFwd = numpy.where(fwd, paddedPt, -numpy.inf).argmax(axis=1)
+    event = numpy.flatnonzero(cen.any(axis=1) & fwd.any(axis=1))
+    return event, bestCen[event], bestFwd[event]
+
+kernels = {"InclusiveBasic": inclusiveBasic,
+           "InclusiveAsym": inclusiveAsym,
+           "InclusiveWindow": inclusiveWindow,
+           "MNBasic": mnBasic,
+           "MNAsym": mnAsym,
+           "MNWindow": mnWindow,
+           "FWD11_002": fwd11_002}
+
+# pt, eta, offsets - good jets only (see selectJets)
+def findPairs(variant, pt, eta, offsets):
+    if variant not in kernels:
+        raise Exception("Variant not known! Known variants are: " + " ".join(kernels.keys()))
+    pt = numpy.asarray(pt, dtype=numpy.float64)
+    eta = numpy.asarray(eta, dtype=numpy.float64)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    if len(offsets) < 2:
+        return emptyResult()
+    pairs = kernels[variant](pt, eta, offsets)
+    if pairs is None or len(pairs[0]) == 0:
+        return emptyResult()
+    event, l1, l2 = pairs
+    return makeResult(event, l1, l2, offsets, pt, eta, variant == "FWD11_002")
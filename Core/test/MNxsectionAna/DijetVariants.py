@@ -0,0 +1,124 @@
+from array import array
+
+import DijetKernels
+
+# Analysis variants (choice of jet pairs used for the cross section) of
+# MNxsAnalyzerClean. Kept apart from the analyzer (no ROOT needed), so they
+# can be compared with the batch versions from DijetKernels.py, see
+# test_DijetKernels.py
+
+class EtaBinning:
+    def bins(self):
+        binsEta = [x/10. for x in xrange(0, 61, 5)]
+        binsEta.extend([7.0, 8.0, 9.4])
+        print "xs vs eta: gonna use binning: ", binsEta
+        binsNew = array('d',binsEta)
+        return binsNew
+
+class PtBinning:
+    def bins(self):
+        bins = [35,45,57,72,90,120,150]
+        print "xs vs pt: gonna use binning: ", bins
+        binsNew = array('d',bins)
+        return binsNew
+
+class BaseDijetAna:
+    def xsVariable(self, j1, j2):
+        return abs(j1.eta()-j2.eta())
+    def filterPair(self, j1, j2):
+        return True
+    def filterCol(self, l):
+        return l
+    # batch version of filterCol+filterPair+xsVariable, see DijetKernels.py
+    def findPairs(self, pt, eta, offsets):
+        return DijetKernels.findPairs(self.__class__.__name__, pt, eta, offsets)
+    @staticmethod
+    def variant(v):
+        r = {}
+        r["InclusiveBasic"]=InclusiveBasic()
+        r["InclusiveAsym"]=InclusiveAsym()
+        r["InclusiveWindow"]=InclusiveWindow()
+        r["MNBasic"]=MNBasic()
+        r["MNAsym"]=MNAsym()
+        r["MNWindow"]=MNWindow()
+        r["FWD11_002"]=FWD11_002()
+        if v not in r:
+            raise Exception("Variant not known! Known variants are: " + " ".join(r.keys()))
+        return r[v]
+    
+
+# inclusive, pt > 35
+class InclusiveBasic(BaseDijetAna, EtaBinning):
+    def __init__(self): pass
+
+class InclusiveAsym(BaseDijetAna, EtaBinning):
+    def filterPair(self, j1, j2):
+        return max(j1.pt(), j2.pt()) > 45
+
+    def filterCol(self, l):
+        if len(l) < 2: return []
+        if max(l, key=lambda j: j.pt()).pt() < 45: return []
+        return l
+
+class InclusiveWindow(BaseDijetAna, EtaBinning):
+    def filterCol(self, l):
+        return [j for j in l if j.pt()  < 55]
+
+class MNBasic(BaseDijetAna, EtaBinning):
+    def filterCol(self, l):
+        if len(l) < 2: return []
+        return [min(l, key=lambda j: j.eta()), max(l, key=lambda j: j.eta())]
+
+class MNAsym(BaseDijetAna, EtaBinning):
+    def filterCol(self, l):
+        if len(l) < 2: return []
+        bestPair = []
+        bestDeta = -1
+        for i1 in xrange(len(l)):
+            for i2 in xrange(i1+1, len(l)):
+                if max(  l[i1].pt(), l[i2].pt()) < 45: continue
+                aeta = abs(l[i1].eta()-l[i2].eta())
+                if aeta > bestDeta:
+                    bestDeta = aeta
+                    bestPair = [i1, i2]
+        if len(bestPair) == 0: return []
+        return [l[bestPair[0]], l[bestPair[1]]]
+
+class MNWindow(BaseDijetAna, EtaBinning):
+    def filterCol(self, l):
+        if len(l) < 2: return []
+        window = [j for j in l if j.pt()  < 55]
+        if len(window) < 2: return []
+        return [min(window, key=lambda j: j.eta()), max(window, key=lambda j: j.eta())]
+
+# TODO (?) - filter mid eta jets
+# https://rivet.hepforge.org/code/dev/a00636_source.html#l00018
+# acording to rivet - we take strongest cen/fwd jet
+class FWD11_002(BaseDijetAna, PtBinning):
+    def xsVariable(self, j1, j2):
+        ret = j1.pt() if abs(j1.eta()) < abs(j2.eta()) else j2.pt() # pt of central jet
+        return ret
+    def filterPair(self, j1, j2):
+        eta1 = abs(j1.eta())
+        eta2 = abs(j2.eta())
+        if max(eta1, eta2) < 3.2: return False # no FWD jet
+        if min(eta1, eta2) > 2.8: return False # no central Jet
+        return True
+
+    def filterCol(self, l):
+        if len(l) < 2: return []
+        bestCen = None
+        bestCenPt = -1
+        bestFwd = None
+        bestFwdPt = -1
+        for i in xrange(len(l)):
+            aeta = abs(l[i].eta())
+            pt = l[i].pt()
+            if aeta > 3.2  and pt > bestFwdPt:
+                bestFwdPt = pt
+                bestFwd = i
+            elif aeta < 2.8 and pt > bestCenPt:
+                bestCenPt = pt
+                bestCen = i
+        if bestCen == None or bestFwd == None: return []   
+        return [l[bestCen], l[bestFwd]]
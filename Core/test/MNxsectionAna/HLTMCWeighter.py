@@ -1,4 +1,5 @@
-import pickle
+import pickle, os, bisect, hashlib, tempfile, stat
+import numpy
 
 import ROOT
 ROOT.gROOT.SetBatch(True)
@@ -9,6 +10,13 @@ from  CommonFSQFramework.Core.BetterJetGetter import BetterJetGetter
 from array import array 
 
 class HLTMCWeighter:
+    # merged efficiency maps are cached here. Directory has to be owned by the
+    # user (and not writable by others), otherwise cache is not used. Can be
+    # changed with the HLTMCWEIGHTER_CACHE environment variable, default is
+    # inside the CMSSW area, so it is shared by jobs running on batch nodes
+    cacheDir = os.environ.get("HLTMCWEIGHTER_CACHE",
+                    os.path.join(os.environ.get("CMSSW_BASE", os.path.expanduser("~")), "tmp", "HLTMCWeighter"))
+    mapNames = ["efficiency", "nom", "denom"]
 
     # https://wiki.physik.uzh.ch/lhcb/root:colorscheme    
     def set_palette(name="palette", ncontours=999):
@@ -86,16 +94,134 @@ class HLTMCWeighter:
         # hltEffHistos.root  prescales_Jet15U.p  
         # CommonFSQFramework.Core/test/MNxsectionAna/trgEfficiency
         fPrescales = edm.FileInPath( "CommonFSQFramework/Core/test/MNxsectionAna/trgEfficiency/prescales_" + shortName2+".p").fullPath()
-        prescales = pickle.load( open( fPrescales, "rb" ) )
-
         fLumi      = edm.FileInPath( "CommonFSQFramework/Core/test/MNxsectionAna/trgEfficiency/runLumi_" + shortName2+".p").fullPath()
-        runLumi = pickle.load( open( fLumi, "rb" ) )
 
         # hltEffHistos_DoubleJet15U_ForwardBackward.root  hltEffHistos_Jet15U.root
 
         fName =  "CommonFSQFramework/Core/test/MNxsectionAna/trgEfficiency/hltEffHistos_"+ shortName1 + ".root"
         print self.label, "- using", fName
         filePath = edm.FileInPath( fName ).fullPath()
+
+        # merging per run histograms is slow - result is cached
+        cacheName = "HLTMCWeighter_{0}_{1}_{2}_{3}.npz".format(shortName1, runMin, runMax, int(bool(weight)))
+        sources = self.getSourcesStamp([fPrescales, fLumi, filePath])
+        cacheFile = self.getCacheFile(cacheName)
+        maps = None
+        if cacheFile != None:
+            maps = self.loadCache(cacheFile, sources)
+        if maps == None:
+            maps = self.buildMaps(fPrescales, fLumi, filePath, runMin, runMax, weight)
+            if cacheFile != None:
+                self.saveCache(cacheFile, sources, maps)
+
+        self.runs = maps["runs"]
+        self.maps = maps
+        self.ptEdges = maps["efficiency"][0]
+        self.etaEdges = maps["efficiency"][1]
+        self.values = maps["efficiency"][2]
+        # plain python copies - faster for single jet lookups
+        self.ptEdgesList = self.ptEdges.tolist()
+        self.etaEdgesList = self.etaEdges.tolist()
+        self.valuesList = self.values.tolist()
+
+    # efficiency maps of a single trigger/run period are stored as arrays:
+    #   pt (x) bin edges, eta (y) bin edges, bin contents [nx+2, ny+2]
+    # (under and overflow included, same bin numbering as in TH2)
+    @staticmethod
+    def histoToArrays(h):
+        nx = h.GetNbinsX()
+        ny = h.GetNbinsY()
+        xEdges = numpy.array([h.GetXaxis().GetBinLowEdge(i) for i in xrange(1, nx+2)])
+        yEdges = numpy.array([h.GetYaxis().GetBinLowEdge(i) for i in xrange(1, ny+2)])
+        values = numpy.array([[h.GetBinContent(ix, iy) for iy in xrange(ny+2)] for ix in xrange(nx+2)])
+        return xEdges, yEdges, values
+
+    @staticmethod
+    def arraysToHisto(name, arrays):
+        xEdges, yEdges, values = arrays
+        h = ROOT.TH2D(name, name, len(xEdges)-1, array('d', xEdges), len(yEdges)-1, array('d', yEdges))
+        for ix in xrange(len(xEdges)+1):
+            for iy in xrange(len(yEdges)+1):
+                h.SetBinContent(ix, iy, values[ix, iy])
+        return h
+
+    # histograms are build only when needed (e.g. dumpEfficiencyHisto)
+    def __getattr__(self, name):
+        todo = {"efficiencyHisto":"efficiency", "nom":"nom", "denom":"denom"}
+        if name not in todo or "maps" not in self.__dict__:
+            raise AttributeError(name)
+        h = self.arraysToHisto(name+"_"+self.label, self.maps[todo[name]])
+        h.SetDirectory(0)
+        self.__dict__[name] = h
+        return h
+
+    # md5 of the source files contents (paths differ between batch nodes)
+    @staticmethod
+    def getSourcesStamp(sources):
+        ret = []
+        for f in sources:
+            with open(f, "rb") as inFile:
+                ret.append(hashlib.md5(inFile.read()).hexdigest())
+        return ret
+
+    # owned by the user and not writable by others
+    @staticmethod
+    def isOwned(path):
+        st = os.lstat(path)
+        return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    # path of the cache file, None if the cache directory cannot be used
+    def getCacheFile(self, cacheName):
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir, 0700)
+            if not os.path.isdir(self.cacheDir) or not self.isOwned(self.cacheDir):
+                print "HLTMCWeighter: cache directory", self.cacheDir, "not owned by user (or writable by others) - not used"
+                return None
+        except OSError, e:
+            print "HLTMCWeighter: cannot use cache directory", self.cacheDir, e
+            return None
+        return os.path.join(self.cacheDir, cacheName)
+
+    def loadCache(self, cacheFile, sources):
+        if not os.path.isfile(cacheFile):
+            return None
+        if not self.isOwned(cacheFile):
+            print "HLTMCWeighter: ignoring", cacheFile, "- not owned by user (or writable by others)"
+            return None
+        try:
+            cached = numpy.load(cacheFile, allow_pickle=False)
+            if cached["sources"].tolist() != sources:
+                return None
+            maps = {}
+            maps["runs"] = set(cached["runs"].tolist())
+            for m in self.mapNames:
+                maps[m] = (cached[m+"_x"], cached[m+"_y"], cached[m+"_values"])
+            cached.close()
+        except Exception, e:
+            print "HLTMCWeighter: cannot read", cacheFile, e
+            return None
+        return maps
+
+    def saveCache(self, cacheFile, sources, maps):
+        arrays = {}
+        arrays["sources"] = numpy.array(sources)
+        arrays["runs"] = numpy.array(sorted(maps["runs"]), dtype=numpy.int64)
+        for m in self.mapNames:
+            arrays[m+"_x"], arrays[m+"_y"], arrays[m+"_values"] = maps[m]
+        try:
+            fd, tmpName = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(cacheFile))
+            with os.fdopen(fd, "wb") as tmpFile:
+                numpy.savez(tmpFile, **arrays)
+            os.rename(tmpName, cacheFile)
+        except (IOError, OSError), e:
+            print "HLTMCWeighter: cannot write", cacheFile, e
+
+    def buildMaps(self, fPrescales, fLumi, filePath, runMin, runMax, weight):
+        prescales = pickle.load( open( fPrescales, "rb" ) )
+        runLumi = pickle.load( open( fLumi, "rb" ) )
+        period = (runMin, runMax)
+
         curPath = ROOT.gDirectory.GetPath()
         rootFileTF = ROOT.TFile(filePath, "READ")
         lst = rootFileTF.GetListOfKeys()
@@ -173,20 +299,29 @@ class HLTMCWeighter:
         h["nom"].Divide(h["denom"]) 
 
         
-        #  the histogram is associated with a currently open rootfile (which soon will be closed). A clone is needed in root main dir
         ROOT.gDirectory.cd(curPath)
-        self.efficiencyHisto = h["nom"].Clone() 
-        self.nom = nom.Clone("nomAA")
-        self.denom = denom.Clone("denomAA")
+        maps = {}
+        maps["runs"] = self.runs
+        maps["efficiency"] = self.histoToArrays(h["nom"])
+        maps["nom"] = self.histoToArrays(nom)
+        maps["denom"] = self.histoToArrays(denom)
+        rootFileTF.Close()
+        return maps
 
     # TODO: check limits
     def getEfficiency(self,eta,pt):
         #if self.fb: # temporary, till workaround for HLT_FB logic is implemented
         #    eta = abs(eta)
 
-        binx = self.efficiencyHisto.GetXaxis().FindBin(pt)
-        biny = self.efficiencyHisto.GetYaxis().FindBin(eta)
-        return self.efficiencyHisto.GetBinContent(binx,biny)
+        binx = bisect.bisect_right(self.ptEdgesList, pt)
+        biny = bisect.bisect_right(self.etaEdgesList, eta)
+        return self.valuesList[binx][biny]
+
+    # vectorized version of getEfficiency (etas, pts - arrays of equal length)
+    def getEfficiencies(self, etas, pts):
+        binx = numpy.searchsorted(self.ptEdges, pts, side="right")
+        biny = numpy.searchsorted(self.etaEdges, etas, side="right")
+        return self.values[binx, biny]
 
     def setGetter(self, getter):
         self.getter = getter
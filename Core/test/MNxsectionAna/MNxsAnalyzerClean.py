@@ -20,131 +20,23 @@ import cProfile
 # you have to run this file from directory where it is saved
 
 import CommonFSQFramework.Core.ExampleProofReader
+from CommonFSQFramework.Core.PUWeights import PUWeights
 from  CommonFSQFramework.Core.BetterJetGetter import BetterJetGetter
+from  CommonFSQFramework.Core.JetMatcher import JetMatcher
+from  CommonFSQFramework.Core.HistogramBank import HistogramBank
 
 from optparse import OptionParser
 
 from HLTMCWeighter import HLTMCWeighter
+from DijetVariants import BaseDijetAna
 #import DiJetBalancePlugin
 
-class EtaBinning:
-    def bins(self):
-        binsEta = [x/10. for x in xrange(0, 61, 5)]
-        binsEta.extend([7.0, 8.0, 9.4])
-        print "xs vs eta: gonna use binning: ", binsEta
-        binsNew = array('d',binsEta)
-        return binsNew
-
-class PtBinning:
-    def bins(self):
-        bins = [35,45,57,72,90,120,150]
-        print "xs vs pt: gonna use binning: ", bins
-        binsNew = array('d',bins)
-        return binsNew
-
-class BaseDijetAna:
-    def xsVariable(self, j1, j2):
-        return abs(j1.eta()-j2.eta())
-    def filterPair(self, j1, j2):
-        return True
-    def filterCol(self, l):
-        return l
-    @staticmethod
-    def variant(v):
-        r = {}
-        r["InclusiveBasic"]=InclusiveBasic()
-        r["InclusiveAsym"]=InclusiveAsym()
-        r["InclusiveWindow"]=InclusiveWindow()
-        r["MNBasic"]=MNBasic()
-        r["MNAsym"]=MNAsym()
-        r["MNWindow"]=MNWindow()
-        r["FWD11_002"]=FWD11_002()
-        if v not in r:
-            raise Exception("Variant not known! Known variants are: " + " ".join(r.keys()))
-        return r[v]
-    
-
-# inclusive, pt > 35
-class InclusiveBasic(BaseDijetAna, EtaBinning):
-    def __init__(self): pass
-
-class InclusiveAsym(BaseDijetAna, EtaBinning):
-    def filterPair(self, j1, j2):
-        return max(j1.pt(), j2.pt()) > 45
-
-    def filterCol(self, l):
-        if len(l) < 2: return []
-        if max(l, key=lambda j: j.pt()).pt() < 45: return []
-        return l
-
-class InclusiveWindow(BaseDijetAna, EtaBinning):
-    def filterCol(self, l):
-        return [j for j in l if j.pt()  < 55]
-
-class MNBasic(BaseDijetAna, EtaBinning):
-    def filterCol(self, l):
-        if len(l) < 2: return []
-        return [min(l, key=lambda j: j.eta()), max(l, key=lambda j: j.eta())]
-
-class MNAsym(BaseDijetAna, EtaBinning):
-    def filterCol(self, l):
-        if len(l) < 2: return []
-        bestPair = []
-        bestDeta = -1
-        for i1 in xrange(len(l)):
-            for i2 in xrange(i1+1, len(l)):
-                if max(  l[i1].pt(), l[i2].pt()) < 45: continue
-                aeta = abs(l[i1].eta()-l[i2].eta())
-                if aeta > bestDeta:
-                    bestDeta = aeta
-                    bestPair = [i1, i2]
-        if len(bestPair) == 0: return []
-        return [l[bestPair[0]], l[bestPair[1]]]
-
-class MNWindow(BaseDijetAna, EtaBinning):
-    def filterCol(self, l):
-        if len(l) < 2: return []
-        window = [j for j in l if j.pt()  < 55]
-        if len(window) < 2: return []
-        return [min(window, key=lambda j: j.eta()), max(window, key=lambda j: j.eta())]
-
-# TODO (?) - filter mid eta jets
-# https://rivet.hepforge.org/code/dev/a00636_source.html#l00018
-# acording to rivet - we take strongest cen/fwd jet
-class FWD11_002(BaseDijetAna, PtBinning):
-    def xsVariable(self, j1, j2):
-        ret = j1.pt() if abs(j1.eta()) < abs(j2.eta()) else j2.pt() # pt of central jet
-        return ret
-    def filterPair(self, j1, j2):
-        eta1 = abs(j1.eta())
-        eta2 = abs(j2.eta())
-        if max(eta1, eta2) < 3.2: return False # no FWD jet
-        if min(eta1, eta2) > 2.8: return False # no central Jet
-        return True
-
-    def filterCol(self, l):
-        if len(l) < 2: return []
-        bestCen = None
-        bestCenPt = -1
-        bestFwd = None
-        bestFwdPt = -1
-        for i in xrange(len(l)):
-            aeta = abs(l[i].eta())
-            pt = l[i].pt()
-            if aeta > 3.2  and pt > bestFwdPt:
-                bestFwdPt = pt
-                bestFwd = i
-            elif aeta < 2.8 and pt > bestCenPt:
-                bestCenPt = pt
-                bestCen = i
-        if bestCen == None or bestFwd == None: return []   
-        return [l[bestCen], l[bestFwd]]
-
 import math
 class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
     def init( self):
 
         self.variantFilter = BaseDijetAna.variant(self.variant)
+        self.genMatcher = JetMatcher(0.3, self.jetMatching)
 
         if not self.isData:
             #self.hltMCWeighter = HLTMCWeighter("HLT_Jet15U")
@@ -204,6 +96,12 @@ class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofR
                                                                     "response"+t,"response"+t)
 
 
+        # histograms filled for all weight variations at once (see analyze)
+        self.banks = {}
+        for trg in todoTrg:
+            for q in ["ptLead", "ptSublead", "etaLead", "etaSublead", "xsVsDeltaEta", "vtx"]:
+                self.banks[q+trg] = HistogramBank(dict((s, self.hist[q+s+trg]) for s in set(self.todoShifts+self.shiftsPU)))
+
         # in principle trigger does not applies to gen plots. We keep consistent naming though, so the unfolded result to gen level plots is possible
         # in each category
         self.hist["detaGen_jet15"] =  ROOT.TH1F("detaGen_central_jet15", "detaGen_central_jet15",
@@ -255,13 +153,13 @@ class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofR
         puFiles["j15_0_95"] = edm.FileInPath("CommonFSQFramework/Core/test/MNxsectionAna/data/pu_j15_0_95.root").fullPath()
 
         self.lumiWeighters = {}
-        self.lumiWeighters["_jet15_central"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_1"], "MC", "pileup")
-        self.lumiWeighters["_jet15_puUp"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_1_05"], "MC", "pileup")
-        self.lumiWeighters["_jet15_puDown"] = edm.LumiReWeighting(jet15FileV2, puFiles["j15_0_95"], "MC", "pileup")
+        self.lumiWeighters["_jet15_central"] = PUWeights.get(jet15FileV2, puFiles["j15_1"], "MC", "pileup")
+        self.lumiWeighters["_jet15_puUp"] = PUWeights.get(jet15FileV2, puFiles["j15_1_05"], "MC", "pileup")
+        self.lumiWeighters["_jet15_puDown"] = PUWeights.get(jet15FileV2, puFiles["j15_0_95"], "MC", "pileup")
 
-        self.lumiWeighters["_dj15fb_central"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_1"], "MC", "pileup")
-        self.lumiWeighters["_dj15fb_puUp"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_1_05"], "MC", "pileup")
-        self.lumiWeighters["_dj15fb_puDown"] = edm.LumiReWeighting(jet15FileV2, puFiles["dj15_0_95"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_central"] = PUWeights.get(jet15FileV2, puFiles["dj15_1"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_puUp"] = PUWeights.get(jet15FileV2, puFiles["dj15_1_05"], "MC", "pileup")
+        self.lumiWeighters["_dj15fb_puDown"] = PUWeights.get(jet15FileV2, puFiles["dj15_0_95"], "MC", "pileup")
 
         self.jetGetter = BetterJetGetter("PFAK5") 
         self.getterForTriggerModelling = BetterJetGetter("CaloRaw")
@@ -286,16 +184,9 @@ class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofR
             puWeight =  self.lumiWeighters["_jet15_central"].weight(truePU)
             weight = weightBase*puWeight
 
-        sortKey = lambda j: j.pt()*(j.pt()>self.threshold)\
-                          *(j.jetid()>0.5)*(abs(j.eta())<4.7)
-
-        # if empty sequence...
-        try:
-            bestJet = max(self.jetGetter.get("_central"), key=sortKey)
-        except ValueError:
-            return
-
-        if not sortKey(bestJet): return # do we really have a jet passing the criteria?
+        goodJets = self.jetGetter.getFiltered("_central", self.threshold, 4.7)
+        if not goodJets: return # do we really have a jet passing the criteria?
+        bestJet = max(goodJets, key=lambda j: j.pt())
         pt, eta =  bestJet.pt(), bestJet.eta()
         self.var["leadPt"][0] = pt
         self.var["leadEta"][0] = eta
@@ -416,11 +307,17 @@ class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofR
             goodGenJets = self.variantFilter.filterCol([j for j in self.fChain.genJets \
                                                         if j.pt()>self.threshold and abs(j.eta()) < 4.7 ])
 
+        doResponse = self.unfoldEnabled and not self.isData
+        if doResponse:
+            genPairs = [(i1, i2) for i1 in xrange(len(goodGenJets)) for i2 in xrange(i1+1, len(goodGenJets)) \
+                            if self.variantFilter.filterPair(goodGenJets[i1], goodGenJets[i2])]
+
         for shift in self.todoShifts:
-            matchedPairs = set()
             # todo: j.jetID() > 0.5
-            goodRecoJets = self.variantFilter.filterCol([j for j in self.jetGetter.get(shift) \
-                                                        if j.pt()>self.threshold and abs(j.eta()) < 4.7 and  j.jetid()])
+            goodRecoJets = self.variantFilter.filterCol(self.jetGetter.getFiltered(shift, self.threshold, 4.7))
+            # reco pairs entering the response (in order of the loop below):
+            # (i1, i2), topology, detaDet, weightNoNorm
+            responseCands = []
 
             for i1 in xrange(len(goodRecoJets)):
                 for i2 in xrange(i1+1, len(goodRecoJets)):
@@ -454,95 +351,74 @@ class MNxsAnalyzerClean(CommonFSQFramework.Core.ExampleProofReader.ExampleProofR
                     detaDet = self.variantFilter.xsVariable(j1, j2) # note: we should rename this...
                     ptSorted = sorted( [j1, j2], key = lambda j: -j.pt())
 
-                    for w in weight:
+                    self.banks["ptLead"+topology].fill(ptSorted[0].pt(), weight)
+                    self.banks["etaLead"+topology].fill(ptSorted[0].eta(), weight)
+                    self.banks["ptSublead"+topology].fill(ptSorted[1].pt(), weight)
+                    self.banks["etaSublead"+topology].fill(ptSorted[1].eta(), weight)
+                    self.banks["xsVsDeltaEta"+topology].fill(detaDet, weight)
+                    self.banks["vtx"+topology].fill(self.fChain.ngoodVTX, weight)
+
+                    if doResponse:
+                        responseCands.append( ((i1, i2), topology, detaDet, weightNoNorm) )
+
+            # fill the response matrix. Gen jet matched to each reco jet (dR < 0.3,
+            # method given by jetMatching) decides, if reco pair is
+            #   a fill: both jets matched to a gen pair of the same topology (gen
+            #           pair used only once)
+            #   a fake: otherwise
+            # gen pairs not used by any reco pair are misses
+            if doResponse:
+                recoToGen = self.genMatcher.matchJets(goodRecoJets, goodGenJets)
+                cands = dict((c[0], c) for c in responseCands)
+                sameTopology = lambda recoPair, genPair: \
+                    self.topology(goodGenJets[genPair[0]], goodGenJets[genPair[1]]) == cands[recoPair][1]
+                fills, fakes, misses = self.genMatcher.matchPairs(recoToGen, [c[0] for c in responseCands],
+                                                                  genPairs, sameTopology)
+                for recoPair, genPair in fills:
+                    _, topology, detaDet, weightNoNorm = cands[recoPair]
+                    detaGen = self.variantFilter.xsVariable(goodGenJets[genPair[0]], goodGenJets[genPair[1]])
+                    for w in weightNoNorm:
                         histoName = w + topology
-                        self.hist["ptLead"+histoName].Fill(ptSorted[0].pt(), weight[w])
-                        self.hist["etaLead"+histoName].Fill(ptSorted[0].eta(), weight[w])
-                        self.hist["ptSublead"+histoName].Fill(ptSorted[1].pt(), weight[w])
-                        self.hist["etaSublead"+histoName].Fill(ptSorted[1].eta(), weight[w])
-                        self.hist["xsVsDeltaEta"+histoName].Fill(detaDet, weight[w])
-                        self.hist["vtx"+histoName].Fill(self.fChain.ngoodVTX, weight[w])
-
-                    # todo: fill detLevel Histograms
-                    # for MC - check if there is a matching pair, save result inside matchedPairs set
-                    if not self.isData: # and len(goodGenJets) > 1:
-                        matched=() # empty tuple
-                        if len(goodGenJets) > 1:
-                            closestGenJetI1 = min(xrange(len(goodGenJets)), key = lambda i: self.dr(j1, goodGenJets[i]) )
-                            closestGenJetI2 = min(xrange(len(goodGenJets)), key = lambda i: self.dr(j2, goodGenJets[i]) )
-                            if self.variantFilter.filterPair(goodGenJets[closestGenJetI1], goodGenJets[closestGenJetI2]):
-                                dr1 = self.dr(j1, goodGenJets[closestGenJetI1])
-                                dr2 = self.dr(j2, goodGenJets[closestGenJetI2])
-                                if max(dr1, dr2) < 0.3:
-                                    if closestGenJetI1 != closestGenJetI2:
-                                        # check the topology is correct
-                                        genTopology = self.topology(goodGenJets[closestGenJetI1], goodGenJets[closestGenJetI2])
-                                        if genTopology == topology:
-                                            matchCand=(min(closestGenJetI1,closestGenJetI2), max(closestGenJetI1,closestGenJetI2))    
-                                            if not matchCand in matchedPairs:
-                                                matched=matchCand
-                                                matchedPairs.add(matchCand)
-                                    else:
-                                        pass
-                                        #print "XXX Warning, matched to same genJet"
-                                        #print  j1.pt(), j1.eta(), j1.phi()
-                                        #print  j2.pt(), j2.eta(), j2.phi()
-                                        #def pr(x): print x
-                                        #map(lambda x: pr("Gen: {0} {1} {2}".format(x.pt(), x.eta() , x.phi())),  goodGenJets  )
-
-                        # add this point we know, if this is
-                        #   a fake: no matched genJetPair (or genJet pair from different category)
-                        #   a fill: matched genJetPai
-                        #fill the response matrix
-                        if len(matched)>0:
-                            if self.unfoldEnabled:
-                                detaGen = self.variantFilter.xsVariable(goodGenJets[matched[0]],goodGenJets[matched[1]])
-                                for w in weightNoNorm:
-                                    histoName = w + topology
-                                    self.hist["response"+histoName].Fill(detaDet, detaGen, weightNoNorm[w])
-                        else:
-                            if self.unfoldEnabled:
-                                for w in weightNoNorm:
-                                    histoName = w + topology
-                                    self.hist["response"+histoName].Fake(detaDet, weightNoNorm[w])
+                        self.hist["response"+histoName].Fill(detaDet, detaGen, weightNoNorm[w])
+                for recoPair in fakes:
+                    _, topology, detaDet, weightNoNorm = cands[recoPair]
+                    for w in weightNoNorm:
+                        histoName = w + topology
+                        self.hist["response"+histoName].Fake(detaDet, weightNoNorm[w])
 
             # Now: fill miss cateogory
             # note: this is still happening in "shift" loop
-            if self.unfoldEnabled and not self.isData:
-                for i1 in xrange(len(goodGenJets)):
-                    for i2 in xrange(i1+1, len(goodGenJets)):
-                        if not self.variantFilter.filterPair(goodGenJets[i1], goodGenJets[i2]): continue
-                        genTopology = None
-                        detaGen = None
-                        if shift == "_central":
-                            genTopology = self.topology(goodGenJets[i1], goodGenJets[i2])
-                            detaGen = self.variantFilter.xsVariable(goodGenJets[i1], goodGenJets[i2])
-                            self.hist["detaGen"+genTopology].Fill(detaGen, weightBase)
-
-                        if (i1, i2) in matchedPairs: continue
-                        if genTopology == None:
-                            genTopology = self.topology(goodGenJets[i1], goodGenJets[i2])
+            if doResponse:
+                if shift == "_central":
+                    for i1, i2 in genPairs:
+                        genTopology = self.topology(goodGenJets[i1], goodGenJets[i2])
+                        detaGen = self.variantFilter.xsVariable(goodGenJets[i1], goodGenJets[i2])
+                        self.hist["detaGen"+genTopology].Fill(detaGen, weightBase)
+
+                for i1, i2 in misses:
+                    genTopology = self.topology(goodGenJets[i1], goodGenJets[i2])
    
-                        # note: code repeated here, see above defintion of weightNoNorm
-                        weightNoNorm = {}
-                        if shift == "_central":
-                            for s in self.shiftsPU: # note: shifts pu contains central, puUp and puDown
-                                weightPU = puWeights[genTopology][s]
-                                weightNoNorm[s] = weightPU*weightBaseNoMCNorm    
-                        else:
-                            weightPU = puWeights[genTopology]["_central"]
-                            weightNoNorm[shift] = weightPU*weightBaseNoMCNorm    
-
-                        if detaGen == None:
-                            detaGen = self.variantFilter.xsVariable(goodGenJets[i1], goodGenJets[i2])
+                    # note: code repeated here, see above defintion of weightNoNorm
+                    weightNoNorm = {}
+                    if shift == "_central":
+                        for s in self.shiftsPU: # note: shifts pu contains central, puUp and puDown
+                            weightPU = puWeights[genTopology][s]
+                            weightNoNorm[s] = weightPU*weightBaseNoMCNorm    
+                    else:
+                        weightPU = puWeights[genTopology]["_central"]
+                        weightNoNorm[shift] = weightPU*weightBaseNoMCNorm    
 
-                        for w in weightNoNorm:
-                            histoName = w + genTopology
-                            self.hist["response"+histoName].Miss(detaGen, weightNoNorm[w])
-                            self.hist["miss"+histoName].Fill(detaGen, weightNoNorm[w])
+                    detaGen = self.variantFilter.xsVariable(goodGenJets[i1], goodGenJets[i2])
+                    for w in weightNoNorm:
+                        histoName = w + genTopology
+                        self.hist["response"+histoName].Miss(detaGen, weightNoNorm[w])
+                        self.hist["miss"+histoName].Fill(detaGen, weightNoNorm[w])
 
     def finalize(self):
         print "Finalize:"
+        for b in self.banks.values():
+            b.flush()
+
         if hasattr(self, "pr"):
             dname = "/nfs/dust/cms/user/fruboest/2015.01.MN/slc6/CMSSW_7_0_5/src/CommonFSQFramework/Core/test/MNxsectionAna/bak/"
             profName = dname + "stats"
@@ -569,6 +445,8 @@ if __name__ == "__main__":
                                 help="produce tree for ptHat reweighing")
     parser.add_option("-v", "--variant",   action="store", dest="variant", type="string", \
                                 help="choose analysis variant")
+    parser.add_option("-m", "--jetMatching",   action="store", dest="jetMatching", type="string", default="closest", \
+                                help="reco-gen jet matching used for the response: closest (default), greedy or optimal")
 
     (options, args) = parser.parse_args()
 
@@ -609,6 +487,7 @@ if __name__ == "__main__":
     #slaveParams["jetID"] = "pfJets_jetID" # TODO
 
     slaveParams["unfoldEnabled"] = True
+    slaveParams["jetMatching"] = options.jetMatching
 
     if options.ptHatReweighing:
         slaveParams["onlyPtHatReweighing"] = True
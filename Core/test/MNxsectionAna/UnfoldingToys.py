@@ -0,0 +1,192 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+ROOT.gSystem.Load("libRooUnfold.so")
+
+import multiprocessing
+from array import array
+
+import numpy
+import BayesUnfold
+
+# Toy MC estimation of unfolding uncertainties (see unfoldMN.py)
+#
+# Inputs (measured histogram and the response object) are converted into
+# numpy arrays once. All toy replicas are generated with numpy, toy i is always
+# generated from a random generator seeded with (seed, i), so results do not
+# depend on number of workers used. Unfolding of the toys is done in a pool of
+# processes (backend="RooUnfold") or, with backend="numpy", all at once with
+# BayesUnfold.py.
+#
+# Varied components:
+#   measured - measured (detector level) distribution
+#   truth    - truth distribution of the response object
+#   fakes    - fakes (measured distribution of the response changed accordingly)
+#   response - 2d response matrix
+
+# contents and errors, under/overflow bins included
+def histoToArrays(h):
+    if "TH2" in h.ClassName():
+        nx = h.GetNbinsX()+2
+        ny = h.GetNbinsY()+2
+        vals = numpy.array([[h.GetBinContent(ix, iy) for iy in xrange(ny)] for ix in xrange(nx)])
+        errs = numpy.array([[h.GetBinError(ix, iy) for iy in xrange(ny)] for ix in xrange(nx)])
+    else:
+        n = h.GetNbinsX()+2
+        vals = numpy.array([h.GetBinContent(i) for i in xrange(n)])
+        errs = numpy.array([h.GetBinError(i) for i in xrange(n)])
+    return vals, errs
+
+def getEdges(axis):
+    return [axis.GetBinLowEdge(i) for i in xrange(1, axis.GetNbins()+2)]
+
+def arraysToHisto(name, vals, errs, xEdges, yEdges = None):
+    if yEdges == None:
+        h = ROOT.TH1D(name, name, len(xEdges)-1, array('d', xEdges))
+        for i in xrange(len(vals)):
+            h.SetBinContent(i, vals[i])
+            h.SetBinError(i, errs[i])
+    else:
+        h = ROOT.TH2D(name, name, len(xEdges)-1, array('d', xEdges), len(yEdges)-1, array('d', yEdges))
+        for ix in xrange(vals.shape[0]):
+            for iy in xrange(vals.shape[1]):
+                h.SetBinContent(ix, iy, vals[ix, iy])
+                h.SetBinError(ix, iy, errs[ix, iy])
+    h.SetDirectory(0)
+    return h
+
+# Same as unfoldMN.vary (gaussian smearing of bins with nonzero content,
+# negative results set to zero), for nToys replicas at once
+def makeToys(vals, errs, nToys, seed):
+    toys = numpy.empty((nToys,) + vals.shape)
+    toyErrs = numpy.empty((nToys,) + vals.shape)
+    nonZero = vals != 0
+    for i in xrange(nToys):
+        rnd = numpy.random.RandomState([seed, i])
+        varied = vals + rnd.normal(0., 1., vals.shape)*errs
+        varied = numpy.where(nonZero, varied, vals)
+        bad = varied <= 0
+        toys[i] = numpy.where(nonZero & bad, 0., varied)
+        toyErrs[i] = numpy.where(nonZero & bad, 0., errs)
+    return toys, toyErrs
+
+# RooUnfoldBayes unfolding of a single spectrum given as arrays. Same procedure
+# as in unfoldMN.doUnfold (including the alaGri fakes treatment)
+def unfoldWithRooUnfold(inputs, nIter, alaGri, name):
+    xEdges = inputs["measEdges"]
+    tEdges = inputs["truthEdges"]
+    measured = arraysToHisto("toyMeasured"+name, inputs["measured"][0], inputs["measured"][1], xEdges)
+    hmeas = arraysToHisto("toyHmeas"+name, inputs["hmeas"][0], inputs["hmeas"][1], xEdges)
+    htruth = arraysToHisto("toyHtruth"+name, inputs["htruth"][0], inputs["htruth"][1], tEdges)
+    hresponse = arraysToHisto("toyHresponse"+name, inputs["hresponse"][0], inputs["hresponse"][1], xEdges, tEdges)
+    response = ROOT.RooUnfoldResponse(hmeas, htruth, hresponse, "toyResponse"+name)
+
+    if alaGri:
+        for i in xrange(0, measured.GetNbinsX()+1):
+            denom = response.Hmeasured().GetBinContent(i)
+            if denom == 0: continue
+            nom = response.Hfakes().GetBinContent(i)
+            factor = 1.-nom/denom
+            measured.SetBinContent(i, measured.GetBinContent(i)*factor)
+            measured.SetBinError(i, measured.GetBinError(i)*factor)
+        response.Hmeasured().Add(response.Hfakes(), -1)
+        response.Hfakes().Add(response.Hfakes(), -1)
+
+    unfold = ROOT.RooUnfoldBayes(response, measured, nIter)
+    hReco = unfold.Hreco(1)
+    return numpy.array([hReco.GetBinContent(i) for i in xrange(hReco.GetNbinsX()+2)])
+
+# executed in the worker processes
+def unfoldToys(args):
+    chunk, inputs, varied, toys, nIter, alaGri = args
+    ret = []
+    for i, toyIndex in enumerate(chunk):
+        toyInputs = dict(inputs)
+        toyInputs[varied] = (toys[0][i], toys[1][i])
+        if varied == "fakes":
+            # measured distribution of the response follows the fakes
+            hmeasVals = inputs["hmeas"][0] + toys[0][i] - inputs["fakes"][0]
+            toyInputs["hmeas"] = (hmeasVals, inputs["hmeas"][1])
+        ret.append(unfoldWithRooUnfold(toyInputs, nIter, alaGri, "_{0}_{1}".format(varied, toyIndex)))
+    return ret
+
+class ToyUnfolder:
+    def __init__(self, measured, rooresponse, nIter, alaGri, nWorkers = None, backend = "RooUnfold"):
+        if backend not in ("RooUnfold", "numpy"):
+            raise Exception("ToyUnfolder: unknown backend " + backend)
+        self.nIter = nIter
+        self.alaGri = alaGri
+        self.backend = backend
+        self.nWorkers = nWorkers or multiprocessing.cpu_count()
+
+        hresponse = rooresponse.Hresponse()
+        self.inputs = {}
+        self.inputs["measEdges"] = getEdges(hresponse.GetXaxis())
+        self.inputs["truthEdges"] = getEdges(hresponse.GetYaxis())
+        self.inputs["measured"] = histoToArrays(measured)
+        self.inputs["hmeas"] = histoToArrays(rooresponse.Hmeasured())
+        self.inputs["htruth"] = histoToArrays(rooresponse.Htruth())
+        self.inputs["fakes"] = histoToArrays(rooresponse.Hfakes())
+        self.inputs["hresponse"] = histoToArrays(hresponse)
+
+    # Returns dictionary with:
+    #   toys       - unfolded toys [nGoodToys, nBins+2] (under/overflow included)
+    #   mean       - mean of the toys in each bin
+    #   spread     - standard deviation of the toys in each bin
+    #   meanError  - spread/sqrt(nGoodToys), (same as TProfile bin error)
+    #   covariance - covariance matrix of the unfolded bins
+    #   badToys    - number of toys rejected (nan/inf in the first bin)
+    def run(self, varied, nToys, seed = 1):
+        names = {"measured":"measured", "truth":"htruth", "fakes":"fakes", "response":"hresponse"}
+        if varied not in names:
+            raise Exception("ToyUnfolder: dont know how to vary " + varied)
+        key = names[varied]
+        toys = makeToys(self.inputs[key][0], self.inputs[key][1], nToys, seed)
+        if self.backend == "numpy":
+            return self.summarize(self.unfoldWithNumpy(key, toys))
+
+        nChunks = min(nToys, self.nWorkers*4)
+        chunks = [range(nToys)[i::nChunks] for i in xrange(nChunks)]
+        tasks = [(c, self.inputs, key, (toys[0][c], toys[1][c]), self.nIter, self.alaGri) for c in chunks]
+        pool = multiprocessing.Pool(self.nWorkers)
+        try:
+            results = pool.map(unfoldToys, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        unfolded = numpy.empty((nToys, len(self.inputs["truthEdges"])+1))
+        for c, r in zip(chunks, results):
+            unfolded[c] = r
+        return self.summarize(unfolded)
+
+    # all toys unfolded in a single, batched call
+    def unfoldWithNumpy(self, varied, toys):
+        inputs = dict(self.inputs)
+        inputs[varied] = toys
+        if varied == "fakes":
+            inputs["hmeas"] = (self.inputs["hmeas"][0] + toys[0] - self.inputs["fakes"][0], None)
+        resp = BayesUnfold.responseFromArrays(inputs["hmeas"][0], inputs["htruth"][0], inputs["hresponse"][0])
+        measured, measuredErr = inputs["measured"]
+        reco = BayesUnfold.unfold(measured[..., 1:-1], measuredErr[..., 1:-1], resp, self.nIter, self.alaGri)[0]
+        reco = numpy.broadcast_to(reco, (len(toys[0]), reco.shape[-1]))
+        unfolded = numpy.zeros((len(reco), reco.shape[-1]+2))
+        unfolded[:, 1:-1] = reco
+        return unfolded
+
+    @staticmethod
+    def summarize(unfolded):
+        good = numpy.isfinite(unfolded[:, 1])
+        toys = unfolded[good]
+        ret = {}
+        ret["toys"] = toys
+        ret["badToys"] = len(unfolded) - len(toys)
+        if len(toys) == 0:
+            raise Exception("ToyUnfolder: all toys failed")
+        # nan/inf in other bins are ignored (per bin)
+        masked = numpy.ma.masked_invalid(toys)
+        ret["mean"] = masked.mean(axis=0).filled(0.)
+        ret["spread"] = masked.std(axis=0).filled(0.)
+        counts = masked.count(axis=0)
+        ret["meanError"] = ret["spread"]/numpy.sqrt(numpy.maximum(counts, 1))
+        ret["covariance"] = numpy.ma.cov(masked, rowvar=False, bias=True).filled(0.)
+        return ret
@@ -7,6 +7,7 @@ from ROOT import *
 import os,re,sys,math
 
 import CommonFSQFramework.Core.Util
+import CommonFSQFramework.Core.DatasetLoader
 
 from array import array
 import resource
@@ -15,98 +16,129 @@ import time
 import multiprocessing
 from optparse import OptionParser
 
-class FitThread(multiprocessing.Process):
-    def __init__(self, inputMap):
-        super(FitThread, self).__init__()
-        self.inputMap = inputMap
-
-    def run(self):
-        inputMap = self.inputMap
-        canvas = ROOT.TCanvas()
-        #dsReduced = inputMap["dsReduced"]
-
-        dsReduced =  inputMap["ds"].reduce(inputMap["cut"])
-        myVar = inputMap["myVar"]
-
-        #myVar = vars[t][vary("balance")]
-        meanVal = dsReduced.mean(myVar)
-        sigma   = dsReduced.sigma(myVar)
-
-        print "XXXXX", meanVal, sigma
-
-        #rangeLow = meanVal - sigma*0.75
-        #rangeHigh = meanVal + sigma*0.75
-        rangeLow = meanVal - sigma*3
-        rangeHigh = meanVal + sigma*3
-        #rangeLow = meanVal - sigma*1.5
-        #rangeHigh = meanVal + sigma*1.5
-
-        #rangeLow = -1.7
-        #rangeHigh = 1.7
-        rangeLow = -0.5
-        rangeHigh = 0.5
-
-        mean2 = RooRealVar("mean","mean of gaussian", 0, -1.5, 1.5)
-        sigma2 = RooRealVar("sigma","width of gaussian", .1, 0, 1)
-        gauss2 = RooGaussian("gauss","gaussian PDF",myVar, mean2, sigma2)
-
-        ''' RooFit info:      
-            If you want the errors to reflect the information contained in the provided dataset, choose kTRUE.
-            If you want the errors to reflect the precision you would be able to obtain with an unweighted dataset
-               with 'sum-of-weights' events, choose kFALSE.'''
-        gauss2.fitTo(dsReduced, ROOT.RooFit.Range(rangeLow, rangeHigh), \
-                     #ROOT.RooFit.PrintLevel(-1), ROOT.RooFit.SumW2Error(False)) # this exludes -1 point ("no jet matched point")
-                     ROOT.RooFit.PrintLevel(-1), ROOT.RooFit.SumW2Error(True)) # this exludes -1 point ("no jet matched point")
-
-        balanceVariable = "diJet balance"
-        frame = myVar.frame(ROOT.RooFit.Range(-1.5,1))
-        frame.GetXaxis().SetTitle(balanceVariable)
-        #sampleList[s]["RooDS"].plotOn(frame)
-        dsReduced.plotOn(frame)
-        gauss2.plotOn(frame)
-
-        gauss2.paramOn(frame, ROOT.RooFit.Layout(0.2, 0.5,0.95)) # , RooFit.Label("Gauss Fit"))
-
-        # myVar = treeReader.variables[balanceVariable]["RooVar"]
-        ptProbeJetVar = inputMap["ptProbeJetVar"]
-        meanPT = dsReduced.mean(ptProbeJetVar)
-        sigmaPT = dsReduced.sigma(ptProbeJetVar)
-        #meanPU = dsReduced.mean(inputMap["PU"])
-
-        etaMin = inputMap["etaMin"]
-        etaMax = inputMap["etaMax"]
-        minPtAVG = inputMap["minPtAVG"] 
-
-        box = ROOT.TPaveText(0.2,0.45, 0.50, 0.8, "BRNDC")
-        box.SetFillColor(0)
-        #box.AddText(tag)
-        box.AddText("avg(p^{probe}_{T})=%10.2f" % meanPT)
-        box.AddText("\sigma(p^{probe}_{T})=%10.2f" % sigmaPT )
-        box.AddText(str(etaMin) + " < |#eta_{probe}| < "+str(etaMax))
-        box.AddText("p_{T}^{ave} > "+str(minPtAVG))
-        #box.AddText("PU mean=%10.2f"% meanPU)
-        #box.AddText("probe jet p_{T} > "+str(minPtAVG))
-
-        frame.addObject(box)
-        frame.Draw()
-        odir = inputMap["odir"]
-        preName = odir + myVar.GetName() + "_" + inputMap["name"] + "_ptAveMin_" + str(minPtAVG)  \
-        + "_etaMin_" + str(etaMin).replace(".", "_") \
-        + "_etaMax_" + str(etaMax).replace(".", "_") 
-        #+ "_" + tag
-        fname = preName + "__2.png"
-        canvas.Print(fname)
-        #fname = preName + "__2.root"
-        #canvas.Print(fname)
-
-        fitResult = {}
-        fitResult["iEta"] = inputMap["iEta"]
-        fitResult["mean"]      = mean2.getVal()
-        fitResult["meanErr"] = mean2.getError()
-        fitResult["gaussWidth"] = sigma2.getVal()
-        fitResult["gaussWidthErr"] = sigma2.getError()
-        fitResult["sumEntries"] = dsReduced.sumEntries() # return sum of weights
-        self.queue.put(fitResult)
+# inputs of the fits of the current variation (key - (name, variation, iEta)).
+# Filled before the pool of workers is created, so worker processes get them
+# (with the already partitioned datasets) through fork
+fitInputs = {}
+
+# fit in a single eta bin, executed in a worker process
+def fitEtaBin(key):
+    inputMap = fitInputs[key]
+    canvas = ROOT.TCanvas()
+    #dsReduced = inputMap["dsReduced"]
+
+    dsReduced =  inputMap["ds"]
+    myVar = inputMap["myVar"]
+
+    #myVar = vars[t][vary("balance")]
+    meanVal = dsReduced.mean(myVar)
+    sigma   = dsReduced.sigma(myVar)
+
+    print "XXXXX", meanVal, sigma
+
+    #rangeLow = meanVal - sigma*0.75
+    #rangeHigh = meanVal + sigma*0.75
+    rangeLow = meanVal - sigma*3
+    rangeHigh = meanVal + sigma*3
+    #rangeLow = meanVal - sigma*1.5
+    #rangeHigh = meanVal + sigma*1.5
+
+    #rangeLow = -1.7
+    #rangeHigh = 1.7
+    rangeLow = -0.5
+    rangeHigh = 0.5
+
+    mean2 = RooRealVar("mean","mean of gaussian", 0, -1.5, 1.5)
+    sigma2 = RooRealVar("sigma","width of gaussian", .1, 0, 1)
+    gauss2 = RooGaussian("gauss","gaussian PDF",myVar, mean2, sigma2)
+
+    ''' RooFit info:      
+        If you want the errors to reflect the information contained in the provided dataset, choose kTRUE.
+        If you want the errors to reflect the precision you would be able to obtain with an unweighted dataset
+           with 'sum-of-weights' events, choose kFALSE.'''
+    gauss2.fitTo(dsReduced, ROOT.RooFit.Range(rangeLow, rangeHigh), \
+                 #ROOT.RooFit.PrintLevel(-1), ROOT.RooFit.SumW2Error(False)) # this exludes -1 point ("no jet matched point")
+                 ROOT.RooFit.PrintLevel(-1), ROOT.RooFit.SumW2Error(True)) # this exludes -1 point ("no jet matched point")
+
+    balanceVariable = "diJet balance"
+    frame = myVar.frame(ROOT.RooFit.Range(-1.5,1))
+    frame.GetXaxis().SetTitle(balanceVariable)
+    #sampleList[s]["RooDS"].plotOn(frame)
+    dsReduced.plotOn(frame)
+    gauss2.plotOn(frame)
+
+    gauss2.paramOn(frame, ROOT.RooFit.Layout(0.2, 0.5,0.95)) # , RooFit.Label("Gauss Fit"))
+
+    # myVar = treeReader.variables[balanceVariable]["RooVar"]
+    ptProbeJetVar = inputMap["ptProbeJetVar"]
+    meanPT = dsReduced.mean(ptProbeJetVar)
+    sigmaPT = dsReduced.sigma(ptProbeJetVar)
+    #meanPU = dsReduced.mean(inputMap["PU"])
+
+    etaMin = inputMap["etaMin"]
+    etaMax = inputMap["etaMax"]
+    minPtAVG = inputMap["minPtAVG"] 
+
+    box = ROOT.TPaveText(0.2,0.45, 0.50, 0.8, "BRNDC")
+    box.SetFillColor(0)
+    #box.AddText(tag)
+    box.AddText("avg(p^{probe}_{T})=%10.2f" % meanPT)
+    box.AddText("\sigma(p^{probe}_{T})=%10.2f" % sigmaPT )
+    box.AddText(str(etaMin) + " < |#eta_{probe}| < "+str(etaMax))
+    box.AddText("p_{T}^{ave} > "+str(minPtAVG))
+    #box.AddText("PU mean=%10.2f"% meanPU)
+    #box.AddText("probe jet p_{T} > "+str(minPtAVG))
+
+    frame.addObject(box)
+    frame.Draw()
+    odir = inputMap["odir"]
+    preName = odir + myVar.GetName() + "_" + inputMap["name"] + "_ptAveMin_" + str(minPtAVG)  \
+    + "_etaMin_" + str(etaMin).replace(".", "_") \
+    + "_etaMax_" + str(etaMax).replace(".", "_") 
+    #+ "_" + tag
+    fname = preName + "__2.png"
+    canvas.Print(fname)
+    #fname = preName + "__2.root"
+    #canvas.Print(fname)
+
+    fitResult = {}
+    fitResult["iEta"] = inputMap["iEta"]
+    fitResult["mean"]      = mean2.getVal()
+    fitResult["meanErr"] = mean2.getError()
+    fitResult["gaussWidth"] = sigma2.getVal()
+    fitResult["gaussWidthErr"] = sigma2.getError()
+    fitResult["sumEntries"] = dsReduced.sumEntries() # return sum of weights
+    return key, fitResult
+
+# Selects events passing the cut and splits them into eta bins of the probe
+# jet (single pass over the dataset). Bin i: etaRanges[i-1] <= |eta| < etaRanges[i]
+# Returns dictionary iEta -> dataset. Datasets are owned by the caller (see
+# deleteDatasets), the intermediate copies are deleted here
+def partitionInEta(ds, cut, etaVar, etaRanges):
+    dsBase = ds.reduce(cut)
+    absEta = ROOT.RooFormulaVar("abs_"+etaVar.GetName(), "abs_"+etaVar.GetName(), "abs("+etaVar.GetName()+")", ROOT.RooArgList(etaVar))
+    etaBin = ROOT.RooThresholdCategory("bin_"+etaVar.GetName(), "bin_"+etaVar.GetName(), absEta, "above")
+    etaBin.addThreshold(etaRanges[0], "below")
+    for iEta in xrange(1, len(etaRanges)):
+        etaBin.addThreshold(etaRanges[iEta], "eta"+str(iEta))
+    dsBase.addColumn(etaBin)
+    parts = dsBase.split(etaBin)
+    dsBase.IsA().Destructor(dsBase)
+    ret = {}
+    for iEta in xrange(1, len(etaRanges)):
+        part = parts.FindObject("eta"+str(iEta))
+        if not part:
+            print "Warning: no events in", etaRanges[iEta-1], etaRanges[iEta], "for", cut
+            continue
+        ret[iEta] = part
+        parts.Remove(part)
+    parts.Delete() # below/above the eta ranges, not used
+    parts.IsA().Destructor(parts)
+    return ret
+
+def deleteDatasets(datasets):
+    for ds in datasets:
+        ds.IsA().Destructor(ds)
 
 
 def main():
@@ -120,6 +152,8 @@ def main():
     parser.add_option("-e", "--etaTable", action="store", type="int",  dest="etaTable" )
     parser.add_option("-a", "--minPTAvg", action="store", type="float",  dest="minPTAve" )
     parser.add_option("-w", "--weight", action="store", type="string",  dest="weight" )
+    parser.add_option("-j", "--nWorkers", action="store", type="int",  dest="nWorkers", \
+                                help="number of fits done in parallel (default: number of cores)")
     (options, args) = parser.parse_args()
 
     weight = "weight"
@@ -177,76 +211,32 @@ def main():
     
     sampleList=CommonFSQFramework.Core.Util.getAnaDefinition("sam")
 
-    f = ROOT.TFile(infile, "r")
-    lst = f.GetListOfKeys()
-    trees = {}
-    trees["MC_jet15"] = []
-    trees["data_jet15"] = []
+    loader = CommonFSQFramework.Core.DatasetLoader.DatasetLoader(infile, cacheSelections=True)
+    samples = {}
+    samples["MC_jet15"] = []
+    samples["data_jet15"] = []
 
     samplesData = ["Jet-Run2010B-Apr21ReReco-v1", "JetMETTau-Run2010A-Apr21ReReco-v1", "JetMET-Run2010A-Apr21ReReco-v1"]
 
-    for l in lst:
-        #print "Going through", l.GetName(), l.ClassName()
-        currentDir = l.ReadObj()
-
-        if not currentDir:
-            print "Problem reading", l.GetName(), " - skipping"
-            continue
-
-        if type(currentDir) != ROOT.TDirectoryFile:
-            print "Expected TDirectoryFile,", type(currentDir), "found"
-            continue
-
-        sampleName = l.GetName()
+    for sampleName in loader.getSamples():
         if sampleName not in sampleList:
             raise Exception("Thats confusing...")
-        tree = currentDir.Get("data")
         isData = sampleList[sampleName]["isData"]
         if isData:
             if sampleName in samplesData:
-                #tree.SetDirectory(0)
-                trees["data_jet15"].append(tree)
-                
+                samples["data_jet15"].append(sampleName)
         else:
-            #tree.SetDirectory(0)
-            trees["MC_jet15"].append(tree)
+            samples["MC_jet15"].append(sampleName)
 
-        print sampleName, tree.GetEntries()
+        print sampleName, loader.getEntries(sampleName)
 
-        #print d
-
-    dummyFile = ROOT.TFile("/tmp/dummy.root", "recreate")
-    if len(trees["data_jet15"]) == 0:
+    if len(samples["data_jet15"]) == 0:
             print "Cleaning data (no sample found)"
-            del trees["data_jet15"]
-
-    for t in trees:
-        tlist = ROOT.TList()
-        if len(trees[t]) == 1 and False:
-            trees[t] = trees[t][0]
-        else:
-            for tree in trees[t]:
-                tlist.Add(tree)
-            trees[t] =  ROOT.TTree.MergeTrees(tlist)
-            print "data tree after merge: ", trees[t].GetEntries()
-
-
-    vars = {} # note: we whave to save the variables outside the loop, otherwise they get
-              #       garbage collected by python leading to a crash
-
-    ds = {}
+            del samples["data_jet15"]
 
     variations = set()
-
-
-    for t in trees:
-        print "RooDataset:",t
-        vars[t] = {}
-        tree = trees[t]
-        observables = ROOT.RooArgSet()
-        print "  min/max"
-        for b in tree.GetListOfBranches():
-            name =  b.GetName()
+    for t in samples:
+        for name in loader.getBranches(samples[t]):
             if name != "weight":
                 spl = name.split("_")
                 if len(spl) > 1:
@@ -255,28 +245,6 @@ def main():
                 else:
                     print "Not a variation, skip:", name
 
-            rmin = tree.GetMinimum(name)
-            rmax = tree.GetMaximum(name)
-            rmin = rmin-abs(rmin/100.)
-            rmax = rmax+abs(rmin/100.)
-            #print name, rmin, rmax
-            roovar = ROOT.RooRealVar( name, name, rmin, rmax, "")
-            vars[t][name] = roovar
-            print "Creating variable", name, type(roovar)
-            sys.stdout.flush()
-            observables.add(roovar)
-        #importCMD = RooFit.Import(tree)
-        #cutCMD = RooFit.Cut(preselectionString)
-        print "  create dataset...", weight
-        if "data_" in t:
-            ds[t] = ROOT.RooDataSet(t, t, tree, observables)
-        else:
-            #ds[t] = ROOT.RooDataSet(t, t, tree, observables, "weight < 100", weight)
-            ds[t] = ROOT.RooDataSet(t, t, tree, observables,  "", weight)
-        print "        ...done"
-
-        print "Dataset:", t, ds[t].numEntries()
-
     if "central" not in variations:
         raise Exception("Central value not found!")
 
@@ -288,6 +256,44 @@ def main():
     #etaRanges.extend([4.101, 4.701])
     minPt = 10
 
+    cuts = {}
+    for v in variations:
+        def vary(x, v=v):
+            return x + "_" + v
+
+        # eta requirement is applied when partitioning
+        cut =  vary("tagPt") + " > " + str(minPt)
+        cut += " && " + vary("probePt") + " > " + str(minPt)
+        cut += " && " + vary("ptAve") + " > " + str(minPTAve)
+        cut +=  " &&" +vary("veto2") + " <0.3 "
+        #cut += " && " + vary("balance") + " > " + str(-1)
+        #cut += " && " + vary("balance") + " < " + str(1)
+        if options.cutExtra != None:
+            cut += " && " +  options.cutExtra
+        cuts[v] = cut
+
+    vars = {} # note: we whave to save the variables outside the loop, otherwise they get
+              #       garbage collected by python leading to a crash
+
+    ds = {}
+
+    for t in samples:
+        # only entries passing the cut of any of the variations are loaded
+        # (entry lists cached between runs, see DatasetLoader)
+        if "data_" in t:
+            preselection = cuts["central"]
+        else:
+            preselection = " || ".join(["(" + cuts[v] + ")" for v in sorted(variations)])
+        print "RooDataset:",t
+        print "  create dataset...", weight
+        if "data_" in t:
+            ds[t], vars[t] = loader.getDataset(t, samples[t], cut=preselection)
+        else:
+            ds[t], vars[t] = loader.getDataset(t, samples[t], weight, preselection)
+        print "        ...done"
+
+        print "Dataset:", t, ds[t].numEntries()
+
     curPath = ROOT.gDirectory.GetPath()
     of = ROOT.TFile(odir+"balanceHistos.root","RECREATE")
     outputHistos = {}
@@ -295,79 +301,59 @@ def main():
     outputHistos["MC_jet15"] = of.mkdir("MC_jet15")
     ROOT.gDirectory.cd(curPath)
     
+    # one variation at a time: only datasets of a single variation are kept
+    # in memory (and copied into the workers)
+    allResults = {}
     for t in ds:
         for v in variations:
-
-            queue = multiprocessing.Queue()
             if t=="data_jet15" and v != "central":
                 continue
 
+            def vary(x, v=v):
+                return x + "_" + v
 
-            myThreads = []
-            results = []
-            for iEta in xrange(1, len(etaRanges)):
-                etaMin = etaRanges[iEta-1]
-                etaMax = etaRanges[iEta]
-                print "Doing", t, v, etaMin, etaMax
-
-                def vary(x, v=v):
-                    return x + "_" + v
-
-                cut =  vary("tagPt") + " > " + str(minPt)
-                cut += " && " + vary("probePt") + " > " + str(minPt)
-                cut += " && abs(" + vary("probeEta") + ") >  " + str(etaMin)
-                cut += " && abs(" + vary("probeEta") + ") <  " + str(etaMax)
-                cut += " && " + vary("ptAve") + " > " + str(minPTAve)
-                cut +=  " &&" +vary("veto2") + " <0.3 "
-                #cut += " && " + vary("balance") + " > " + str(-1)
-                #cut += " && " + vary("balance") + " < " + str(1)
-                if options.cutExtra != None:
-                    cut += " && " +  options.cutExtra
-
+            cut = cuts[v]
 
-                print cut
+            print "Partitioning", t, v
+            print cut
+            parts = partitionInEta(ds[t], cut, vars[t][vary("probeEta")], etaRanges)
 
-                #print "Reduce"
-                #dsReduced = ds[t].reduce(cut)
-                #print "Reduce...done"
-            
+            tasks = []
+            for iEta in parts:
+                etaMin = etaRanges[iEta-1]
+                etaMax = etaRanges[iEta]
 
                 inputMap = {}
                 inputMap["name"] = t
                 inputMap["odir"] = odir
-                #inputMap["dsReduced"] = dsReduced
-                #inputMap["ds"] =  ds[t].Clone()
-                inputMap["ds"] =  ds[t]
+                inputMap["ds"] =  parts[iEta]
                 inputMap["myVar"] = vars[t][vary("balance")]
                 inputMap["ptProbeJetVar"] = vars[t][vary("probePt")]
                 inputMap["etaMin"] = etaMin
                 inputMap["etaMax"] = etaMax
                 inputMap["minPtAVG"] = minPTAve
                 inputMap["iEta"] = iEta # xcheck only
-                inputMap["cut"] = cut
                 #inputMap["PU"] = vars[t]["PUNumInteractions"]
+                fitInputs[(t, v, iEta)] = inputMap
+                tasks.append((t, v, iEta))
+
+            print "Fits to do:", len(tasks)
+            pool = multiprocessing.Pool(options.nWorkers or multiprocessing.cpu_count())
+            try:
+                for key, ret in pool.imap_unordered(fitEtaBin, tasks):
+                    print "Done", key, ret
+                    allResults.setdefault(key[:2], []).append(ret)
+            finally:
+                pool.close()
+                pool.join()
+                fitInputs.clear()
+                deleteDatasets(parts.values())
 
-
-                thr = FitThread(inputMap)
-                thr.queue = queue
-                thr.start()
-                myThreads.append(thr)
-                #ptProbeJetVar
-                #fitResult = fit(inputMap)
-                #results.append(fitResult)
-
-                #t = threading.Thread(target=fit, args = (dsReduced, queue))
-                #t.daemon = False
-                #t.start()
-
-            for thr in myThreads:
-                print "Joining!"
-                thr.join()
-                ret = queue.get()
-                print ret
-                results.append(ret)
-            #sys.exit()            
-
+    for t in ds:
+        for v in variations:
+            if t=="data_jet15" and v != "central":
+                continue
+            results = allResults.get((t, v), [])
 
             # all etas done. Create summary (vs eta) histogram
             etaArray = array('d', etaRanges)
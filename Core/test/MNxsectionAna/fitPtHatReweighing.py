@@ -10,7 +10,9 @@ from array import array
 
 import CommonFSQFramework.Core.Util
 
-from  RooDSHelper import getSummedRooDS, reweighDS
+from  RooDSHelper import getSummedRooDS
+from CommonFSQFramework.Core.DatasetLoader import DatasetLoader
+import numpy
 
 # I hate myself...
 #bins = [x for x in xrange(35, 81,5)]
@@ -23,19 +25,67 @@ hData = ROOT.TH1F("dataa", "dataa", len(binsArray)-1, binsArray)
 #hData = ROOT.TH1F("dataa", "dataa", 100, 35, 135)
 hData.Sumw2()
 hMCbase = hData.Clone()
-globalMC = None
 
 
 #numParams = 4
 numParams = 3
 
-def doMinuitFit(ofile, dsData, dsMC, lumi):
+# Everything needed to calculate chi2 for given parameters of the weight
+# function. MC trees are read once, column-wise (qScale, base weight, bin of
+# leadPt, see DatasetLoader.getArrays), later each call needs only few numpy
+# operations:
+#
+#   w = weight * f(qScale), f = (a0+1./(a1*qScale-a2))*(f>0)
+#
+# Data histogram (hData) has to be filled before.
+class ReweighingFit:
+    def __init__(self, arrays):
+        self.qScale = arrays["qScale"]
+        self.baseWeight = arrays["weight"]
+        nBins = hData.GetNbinsX()
+        edges = [hData.GetXaxis().GetBinLowEdge(i) for i in xrange(1, nBins+2)]
+        self.bins = numpy.searchsorted(edges, arrays["leadPt"], side="right") # TH1 numbering
+        self.nBins = nBins
+        self.dataVal = numpy.array([hData.GetBinContent(i) for i in xrange(nBins+2)])
+        self.dataErr = numpy.array([hData.GetBinError(i) for i in xrange(nBins+2)])
+
+    @staticmethod
+    def weightFunction(par, qScale):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            lin = par[0]+1./(par[1]*qScale-par[2])
+        return numpy.where(lin > 0, lin, 0.)
+
+    # contents and errors (under/overflow included)
+    def getMC(self, par):
+        w = self.baseWeight*self.weightFunction(par, self.qScale)
+        val = numpy.bincount(self.bins, weights=w, minlength=self.nBins+2)
+        err = numpy.sqrt(numpy.bincount(self.bins, weights=w*w, minlength=self.nBins+2))
+        return val, err
+
+    # bins from 1 up to overflow (as before)
+    def chi2(self, par):
+        mcVal, mcErr = self.getMC(par)
+        err = numpy.sqrt(self.dataErr**2+mcErr**2)[1:]
+        delta = (self.dataVal-mcVal)[1:]
+        good = err > 0
+        return float(((delta[good]/err[good])**2).sum())
+
+    def getMCHisto(self, par, name):
+        val, err = self.getMC(par)
+        hMC = hMCbase.Clone(name)
+        hMC.Reset()
+        for i in xrange(self.nBins+2):
+            hMC.SetBinContent(i, val[i])
+            hMC.SetBinError(i, err[i])
+        return hMC
+
+def doMinuitFit(ofile, dsData, dsMC, arraysMC, lumi):
     c = ROOT.TCanvas()
     hData.Reset()
     dsData[0].fillHistogram(hData, ROOT.RooArgList(dsData[1]["leadPt"]))
     hData.Scale(1./lumi)
-    global globalMC
-    globalMC = dsMC
+    global globalFit
+    globalFit = ReweighingFit(arraysMC)
 
 
     # initial fit for starting values
@@ -111,78 +161,19 @@ def doMinuitFit(ofile, dsData, dsMC, lumi):
 
 
     val, err = ROOT.Double(0), ROOT.Double(0)
+    best = []
     for i in xrange(len(vstart)):
         gMinuit.GetParameter(i, val, err)
         fitF.SetParameter(i, val)
+        best.append(float(val))
 
+    plotResult(globalFit, best, dsMC[0].GetName())
     ofile.WriteTObject(fitF)
 
 
-
-cnt = 0
-lastTime = None
-import time
-def sinceLast(msg):
-    return
-    global lastTime
-    #cur = time.clock()
-    cur = time.time()
-    if not lastTime:
-        lastTime = cur
-
-    print "T", msg, cur-lastTime
-    lastTime = cur
-
-
-
-
-def fcn( npar, gin, f, par, iflag ):
-    sinceLast("fcn start")
-    global cnt
-    cnt +=1
-    # get weighted MC ds
-    global globalMC
-    vars = globalMC[1]
-    baseWeight = "weight" # yuck, Q&D
-
-
-    args = ROOT.RooArgList()
-    pars = ROOT.RooArgList()
-    obs = ROOT.RooArgList()
-    args.add(vars["qScale"])
-    obs.add(vars["qScale"])
-    global numParams
-    store = []
-    for i in xrange(numParams):
-        name = "a"+str(i)
-        var = ROOT.RooRealVar(name, name, par[i])
-        args.add( var)
-        pars.add( var)
-        store.append(var) # prevent gc
-
-
-    #linear = ROOT.RooFormulaVar("lin", "lin", "a1+a2*qScale", args)
-    #linear = ROOT.RooFormulaVar("lin", "lin", "(a0+a1/qScale)*(qScale>0.01)", args)
-    #linear = ROOT.RooFormulaVar("lin", "lin", "(a1+a2*(qScale**a3))*(qScale>0.01)", args)
-    #linear = ROOT.RooFormulaVar("lin", "lin", "a1+a2*exp(qScale/a3)", args)
-    #linear = ROOT.RooFormulaVar("lin", "lin", "(a0+a1/(a2*qScale-a3))*( (a0+a1/(a2*qScale-a3))>0  )", args)
-    linear = ROOT.RooFormulaVar("lin", "lin", "(a0+1./(a1*qScale-a2))*( (a0+1./(a1*qScale-a2))>0  )", args)
-
-    newweight = ROOT.RooFormulaVar("w"+str(cnt), "ww", baseWeight+"*lin"  , ROOT.RooArgList(vars[baseWeight], linear))
-
-    sys.stdout.flush()
-
-    sinceLast("fcn init donw, now reweigh")
-    wds = reweighDS(globalMC[0], "neww", newweight) # 
-
-    # fill MC histograms
-    hMC = hMCbase.Clone("MC")
-    sinceLast("fcn rew done, now fill")
-    wds.fillHistogram(hMC, ROOT.RooArgList(vars["leadPt"]))
-    del wds
-    #globalMC[0].fillHistogram(hMC, ROOT.RooArgList(vars["leadPt"]))
-
-    sinceLast("fcn fill done, now plots")
+# MC reweighed with the fit result compared with data (done once, after fit)
+def plotResult(fit, par, name):
+    hMC = fit.getMCHisto(par, "MC_"+name)
     c = ROOT.TCanvas()
     hMC.Draw()
     hMC.SetLineColor(2)
@@ -191,31 +182,25 @@ def fcn( npar, gin, f, par, iflag ):
     newMax = 1.05*max(hMC.GetMaximum(), hData.GetMaximum())
     hMC.SetMaximum(newMax)
     #hData.SetMaximum(newMax)
-    c.Print("~/tmp/steps/"+globalMC[0].GetName()+"_"+str(cnt)+".png")
+    c.Print("~/tmp/steps/"+name+"_final.png")
 
     hRatio = hData.Clone()
     hRatio.Divide(hMC)
     hRatio.Draw()
     hRatio.SetMaximum(1.5)
-    c.Print("~/tmp/steps/ratio_"+globalMC[0].GetName()+"_"+str(cnt)+".png")
-
-    # get chi2
-    sinceLast("fcn plots dons, now chi2")
-    #'''
-    chisq, delta = 0., 0.
-    for i in xrange(1, hMC.GetNbinsX()+2):
-        errData = hData.GetBinError(i)
-        errMC =   hMC.GetBinError(i)
-        #print "B", i, errData, errMC, 
-        err = math.sqrt(errData*errData+errMC*errMC)
-        if err > 0:
-            delta = (hData.GetBinContent(i)-hMC.GetBinContent(i))/err
-            chisq += delta*delta
-    '''    
+    c.Print("~/tmp/steps/ratio_"+name+"_final.png")
+
+
+
+cnt = 0
+globalFit = None
+def fcn( npar, gin, f, par, iflag ):
+    global cnt
+    cnt +=1
+    global numParams
+    p = [par[i] for i in xrange(numParams)]
+    chisq = globalFit.chi2(p)
     #chisq = hData.Chi2Test(hMC, "WW OF CHI2") # overflow bin included in comparison
-    #chisq = hData.Chi2Test(hMC, "WW CHI2") 
-    #chisq = hData.Chi2Test(hMC, "UW CHI2") 
-    # '''
     f[0] = chisq
 
     sss = " "
@@ -223,16 +208,9 @@ def fcn( npar, gin, f, par, iflag ):
         sss += str(par[i]) + " "
     print "Call:", cnt, sss, "chisq", chisq
 
-    f = linear.asTF(obs, pars)
     todo = [30, 50, 100, 200, 500, 1000, 3000]
     print " ".join(map(str,  todo))
-    print " ".join(map(str,  map(f, todo)))
-    #for t in todo:
-    #print "At 100:", f.Eval(100)
-    f.IsA().Destructor(f)
-
-    
-    sinceLast("fcn end")
+    print " ".join(map(str,  globalFit.weightFunction(p, numpy.array(todo, dtype=float))))
 
 def doBaselineFit(ofile, dsData, dsMC, lumi):
     c = ROOT.TCanvas()
@@ -284,7 +262,8 @@ def main():
         #dMC = getSummedRooDS(t, "treesForPTHatReweighing.root", [t])
 
         #doBaselineFit(xxx, data, dMC, lumi)
-        doMinuitFit(xxx, data, dMC, lumi)
+        arraysMC = DatasetLoader("treesForPTHatReweighing.root").getArrays([t], ["qScale", "leadPt", "weight"])
+        doMinuitFit(xxx, data, dMC, arraysMC, lumi)
 
 #       leadEta
 #       leadPt
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import unittest
+import numpy
+
+import BayesUnfold
+
+# Compares BayesUnfold.unfold with a plain loop version of the RooUnfoldBayes
+# algorithm (fakes as an additional cause - added only if there are fakes, as
+# in RooUnfoldBayes; alaGri fakes treatment as in unfoldMN.doUnfold; error
+# propagation as in RooUnfoldBayes::unfold, see arXiv:1105.1160). Derivatives
+# used for the errors are also checked with finite differences.
+#
+# Comparison with RooUnfoldBayes itself (needs ROOT and RooUnfold) is done by
+# unfoldMN.py, see checkBackend there.
+#
+# Run with: python test_BayesUnfold.py (or pytest)
+
+def unfoldLoop(measured, measuredErr, resp, nIter, alaGri = False):
+    response, truth, fakes, hmeas = resp["response"], resp["truth"], resp["fakes"], resp["hmeas"]
+    nE, nT = response.shape
+    measured = list(measured)
+    measuredErr = list(measuredErr)
+    fakes = list(fakes)
+    if alaGri:
+        for j in xrange(nE):
+            if hmeas[j] == 0: continue
+            factor = 1. - fakes[j]/hmeas[j]
+            measured[j] *= factor
+            measuredErr[j] *= factor
+        fakes = [0.]*nE
+
+    # P[j][i] - probability of measuring in bin j an event from cause i
+    P = [[response[j][i]/truth[i] if truth[i] != 0 else 0. for i in xrange(nT)] for j in xrange(nE)]
+    n0 = list(truth)
+    nFakes = sum(fakes)
+    if nFakes != 0:
+        for j in xrange(nE):
+            P[j].append(fakes[j]/nFakes)
+        n0.append(nFakes)
+    nC = len(n0)
+    eff = [sum(P[j][i] for j in xrange(nE)) for i in xrange(nC)]
+
+    dn = None
+    for k in xrange(nIter):
+        f = [sum(P[j][i]*n0[i] for i in xrange(nC)) for j in xrange(nE)]
+        M = [[0.]*nE for i in xrange(nC)]
+        for i in xrange(nC):
+            for j in xrange(nE):
+                if eff[i] != 0 and f[j] != 0:
+                    M[i][j] = P[j][i]*n0[i]/(eff[i]*f[j])
+        nHat = [sum(M[i][j]*measured[j] for j in xrange(nE)) for i in xrange(nC)]
+        if k == 0:
+            dn = [row[:] for row in M]
+        else:
+            nr = [nHat[i]/n0[i] if n0[i] != 0 else 0. for i in xrange(nC)]
+            en = [-eff[i]/n0[i] if n0[i] != 0 else 0. for i in xrange(nC)]
+            newDn = [[0.]*nE for i in xrange(nC)]
+            for i in xrange(nC):
+                for l in xrange(nE):
+                    val = M[i][l] + nr[i]*dn[i][l]
+                    for j in xrange(nE):
+                        for r in xrange(nC):
+                            val += M[i][j]*M[r][j]*measured[j]*en[r]*dn[r][l]
+                    newDn[i][l] = val
+            dn = newDn
+        n0 = nHat
+
+    cov = [[sum(dn[i][j]*measuredErr[j]**2*dn[l][j] for j in xrange(nE)) for l in xrange(nT)] for i in xrange(nT)]
+    errors = [cov[i][i]**0.5 for i in xrange(nT)]
+    return numpy.array(nHat[:nT]), numpy.array(errors), numpy.array(cov)
+
+# Random response: nE measured and nT truth bins, some empty rows/columns,
+# misses and fakes. Input arrays include under/overflow bins (as from
+# UnfoldingToys.histoToArrays); matched entries with truth in under/overflow
+# count as fakes (as in RooUnfoldResponse)
+def randomInputs(rnd, nE, nT, withFakes = True, truthOverflow = True):
+    hresponse = rnd.uniform(0., 100., (nE+2, nT+2))*(rnd.uniform(size=(nE+2, nT+2)) < 0.7)
+    hresponse[:, 2] = 0. # truth bin with no matched entries
+    if not truthOverflow:
+        hresponse[:, 0] = hresponse[:, -1] = 0.
+    fakes = rnd.uniform(0., 30., nE+2)*(rnd.uniform(size=nE+2) < 0.7)*withFakes
+    hmeas = hresponse.sum(axis=1) + fakes
+    htruth = hresponse.sum(axis=0) + rnd.uniform(0., 50., nT+2)
+    measured = hmeas[1:-1]*rnd.uniform(0.7, 1.3, nE)
+    measuredErr = numpy.sqrt(measured)
+    return measured, measuredErr, BayesUnfold.responseFromArrays(hmeas, htruth, hresponse)
+
+class TestBayesUnfold(unittest.TestCase):
+    def compare(self, got, expected):
+        for g, e in zip(got, expected):
+            numpy.testing.assert_allclose(g, e, rtol=1e-9, atol=1e-9)
+
+    def testIterations(self):
+        rnd = numpy.random.RandomState(7)
+        for nIter in xrange(1, 6):
+            for alaGri in (False, True):
+                for withFakes in (False, True):
+                    measured, measuredErr, resp = randomInputs(rnd, 6, 5, withFakes)
+                    self.compare(BayesUnfold.unfold(measured, measuredErr, resp, nIter, alaGri),
+                                 unfoldLoop(measured, measuredErr, resp, nIter, alaGri))
+
+    def testFakes(self):
+        rnd = numpy.random.RandomState(8)
+        measured, measuredErr, resp = randomInputs(rnd, 5, 5, truthOverflow = False)
+        self.assertTrue(resp["fakes"].sum() > 0)
+        numpy.testing.assert_allclose(resp["fakes"] + resp["response"].sum(axis=-1), resp["hmeas"])
+        # unfolding the measured distribution of the response gives back the
+        # matched part of the truth in the first iteration (when prior = truth)
+        reco = BayesUnfold.unfold(resp["hmeas"], numpy.sqrt(resp["hmeas"]), resp, 1)[0]
+        efficiency = BayesUnfold.safeDivide(resp["response"].sum(axis=-2), resp["truth"])
+        numpy.testing.assert_allclose(reco*efficiency, resp["response"].sum(axis=-2), rtol=1e-9)
+        # alaGri: fakes removed from the measured distribution, same result
+        recoGri = BayesUnfold.unfold(resp["hmeas"], numpy.sqrt(resp["hmeas"]), resp, 1, True)[0]
+        numpy.testing.assert_allclose(recoGri, reco, rtol=1e-9)
+
+    def testErrorsFiniteDifferences(self):
+        rnd = numpy.random.RandomState(9)
+        for alaGri in (False, True):
+            measured, measuredErr, resp = randomInputs(rnd, 6, 4)
+            nIter = 4
+            reco, errors, cov = BayesUnfold.unfold(measured, measuredErr, resp, nIter, alaGri)
+            jacobian = numpy.empty((len(reco), len(measured)))
+            for k in xrange(len(measured)):
+                step = 1e-5*max(measured[k], 1.)
+                up, down = measured.copy(), measured.copy()
+                up[k] += step
+                down[k] -= step
+                jacobian[:, k] = (BayesUnfold.unfold(up, measuredErr, resp, nIter, alaGri)[0] -
+                                  BayesUnfold.unfold(down, measuredErr, resp, nIter, alaGri)[0])/(2*step)
+            if alaGri:
+                # errors are propagated from the fake subtracted distribution
+                factor = numpy.where(resp["hmeas"] != 0,
+                                     1. - BayesUnfold.safeDivide(resp["fakes"], resp["hmeas"]), 1.)
+                jacobian = BayesUnfold.safeDivide(jacobian, factor)
+                measuredErr = measuredErr*factor
+            expected = numpy.dot(jacobian*measuredErr**2, jacobian.T)
+            numpy.testing.assert_allclose(cov, expected, rtol=1e-5, atol=1e-6*abs(expected).max())
+            numpy.testing.assert_allclose(errors, numpy.sqrt(numpy.diag(expected)), rtol=1e-5)
+
+    def testBatch(self):
+        rnd = numpy.random.RandomState(10)
+        measured, measuredErr, resp = randomInputs(rnd, 6, 5)
+        spectra = measured*rnd.uniform(0.8, 1.2, (4, len(measured)))
+        batch = BayesUnfold.unfold(spectra, measuredErr, resp, 3, True)
+        for i in xrange(len(spectra)):
+            single = BayesUnfold.unfold(spectra[i], measuredErr, resp, 3, True)
+            self.compare([b[i] for b in batch], single)
+
+    def testChi2(self):
+        self.assertAlmostEqual(BayesUnfold.chi2(numpy.array([1., 2., 5.]), numpy.array([1., 0., 2.]),
+                                                numpy.array([2., 4., 1.])), 1. + 4.)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import unittest
+import numpy
+
+import DijetKernels
+from DijetVariants import BaseDijetAna
+
+# Compares DijetKernels.findPairs with the per-event python loop of
+# MNxsAnalyzerClean.analyze (filterCol, double loop with filterPair,
+# xsVariable) on random jagged batches.
+#
+# Run with: python test_DijetKernels.py (or pytest)
+
+class Jet:
+    def __init__(self, index, pt, eta):
+        self.index = index
+        self._pt = pt
+        self._eta = eta
+    def pt(self): return self._pt
+    def eta(self): return self._eta
+
+def findPairsPython(variant, pt, eta, offsets):
+    filt = BaseDijetAna.variant(variant)
+    ret = []
+    for iEv in xrange(len(offsets)-1):
+        jets = [Jet(i, pt[i], eta[i]) for i in xrange(offsets[iEv], offsets[iEv+1])]
+        good = filt.filterCol(jets)
+        for i1 in xrange(len(good)):
+            for i2 in xrange(i1+1, len(good)):
+                j1, j2 = good[i1], good[i2]
+                if not filt.filterPair(j1, j2): continue
+                ret.append((iEv, j1.index, j2.index, filt.xsVariable(j1, j2)))
+    return ret
+
+def randomBatch(rnd, nEvents, maxJets):
+    counts = rnd.randint(0, maxJets+1, nEvents)
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    # pt around the 45/55 GeV cuts, eta covering the 2.8/3.2 cen/fwd boundaries
+    pt = rnd.uniform(35., 80., offsets[-1])
+    eta = rnd.uniform(-5., 5., offsets[-1])
+    return pt, eta, offsets
+
+class TestDijetKernels(unittest.TestCase):
+    def compare(self, pt, eta, offsets):
+        for variant in sorted(DijetKernels.kernels):
+            expected = findPairsPython(variant, pt, eta, offsets)
+            result = DijetKernels.findPairs(variant, pt, eta, offsets)
+            got = zip(result["event"].tolist(), result["i1"].tolist(), result["i2"].tolist())
+            self.assertEqual(got, [e[:3] for e in expected], variant)
+            numpy.testing.assert_allclose(result["xs"], [e[3] for e in expected], err_msg=variant)
+
+    def testRandomBatches(self):
+        rnd = numpy.random.RandomState(1)
+        for i in xrange(300):
+            self.compare(*randomBatch(rnd, rnd.randint(1, 20), rnd.randint(0, 7)))
+
+    def testEmptyBatches(self):
+        self.compare([], [], [0])
+        self.compare([], [], [0, 0, 0])
+        self.compare([40.], [1.], [0, 0, 1, 1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,6 +18,9 @@ from HistosHelper import getHistos
 
 
 from mnDraw import DrawMNPlots 
+from UnfoldingToys import ToyUnfolder
+import BayesUnfold
+import numpy
 
 optionsReg = {}
 
@@ -72,11 +75,54 @@ def vary(histo):
         raise Exception("vary: unsupported object {} {}".format(histo.ClassName(), histo.GetName()))
 
 
+# unfolding with BayesUnfold.py instead of RooUnfoldBayes. Inputs are not
+# modified
+def doUnfoldNumpy(measured, rooresponse, nIter):
+    nBins = measured.GetNbinsX()
+    meas = numpy.array([measured.GetBinContent(i) for i in xrange(1, nBins+1)])
+    measErr = numpy.array([measured.GetBinError(i) for i in xrange(1, nBins+1)])
+    resp = BayesUnfold.responseToArrays(rooresponse)
+    reco, errors, cov = BayesUnfold.unfold(meas, measErr, resp, nIter, optionsReg["alaGri"])
+    chi2 = BayesUnfold.chi2(reco, errors, resp["truth"])
+
+    hReco = rooresponse.Htruth().Clone()
+    hReco.SetDirectory(0)
+    hReco.Reset()
+    for i in xrange(len(reco)):
+        hReco.SetBinContent(i+1, reco[i])
+        hReco.SetBinError(i+1, errors[i])
+
+    if hReco.GetNbinsX() != measured.GetNbinsX():
+        raise Exception("Different histogram sizes after unfolding")
+
+    return (hReco, chi2)
+
+# numpy backend is used only if it reproduces RooUnfoldBayes on the stored
+# responses: unfolded values and errors have to agree within relative
+# tolerance optionsReg["backendTolerance"]. Inputs are not modified
+def checkBackend(measured, rooresponse, nIter, name):
+    hRoo = doUnfoldRooUnfold(measured.Clone(), rooresponse.Clone(), nIter)[0]
+    hNumpy = doUnfoldNumpy(measured, rooresponse, nIter)[0]
+    maxDiff = 0.
+    for i in xrange(1, hRoo.GetNbinsX()+1):
+        for a, b in [(hRoo.GetBinContent(i), hNumpy.GetBinContent(i)), (hRoo.GetBinError(i), hNumpy.GetBinError(i))]:
+            norm = max(abs(a), abs(b))
+            if norm > 0:
+                maxDiff = max(maxDiff, abs(a-b)/norm)
+    print "Backend check:", name, "max. relative difference numpy vs RooUnfoldBayes:", maxDiff
+    if maxDiff > optionsReg["backendTolerance"]:
+        raise Exception("numpy unfolding backend differs from RooUnfoldBayes for {}: {} > {}".format(name, maxDiff, optionsReg["backendTolerance"]))
+
 def doUnfold(measured, rooresponse, nIter = None):
     global optionsReg
     if nIter == None:
         nIter = optionsReg["unfNIter"]
 
+    if optionsReg["backend"] == "numpy":
+        return doUnfoldNumpy(measured, rooresponse, nIter)
+    return doUnfoldRooUnfold(measured, rooresponse, nIter)
+
+def doUnfoldRooUnfold(measured, rooresponse, nIter):
     if optionsReg["alaGri"]:
         # histos[baseMC][r] - response object
         # histo - detector level distribution
@@ -248,6 +294,8 @@ def unfold(action, infileName):
             print "Doing: ", c, r, variation
             rawName = "xsunfolded_" + variation+ c
             sys.stdout.flush()
+            if optionsReg["backend"] == "numpy":
+                checkBackend(histo, histos[baseMC][r], optionsReg["unfNIter"], action+" "+r)
         
             '''
             histoWithChangedErrors = histo.Clone()
@@ -306,51 +354,11 @@ def unfold(action, infileName):
                 todo = []
             if variation == "central":
                 badToys = 0
+                toyUnfolder = ToyUnfolder(histo, histos[baseMC][r], optionsReg["unfNIter"], \
+                                          optionsReg["alaGri"], optionsReg["nWorkers"], optionsReg["backend"])
                 for t in todo:
-                    #   TProfile(const char* name, const char* title, Int_t nbinsx, const Double_t* xbins, Option_t* option = "")
-                    bins = hReco.GetXaxis().GetXbins()
-                    profile =  TProfile("prof_{}_{}".format(rawName, t), "", bins.GetSize()-1, bins.GetArray())
-                    for i in xrange(0, optionsReg["ntoys"]):
-                        clonedResponse = histos[baseMC][r].Clone()
-                        htruth = clonedResponse.Htruth()
-                        hfakes = clonedResponse.Hfakes()
-                        hresponse = clonedResponse.Hresponse()
-                        hmeas = clonedResponse.Hmeasured()
-
-                        histoToUnfold = histo.Clone()
-                        if t == "truth":
-                            vary(htruth)
-                        elif t == "fakes":
-                            fakesOrg = hfakes.Clone()
-                            vary(hfakes)
-                            fakesDiff = hfakes.Clone()
-                            fakesDiff.Add(fakesOrg, -1)
-                            hmeas.Add(fakesDiff)
-                        elif t == "response":
-                            vary(hresponse)
-                        elif t == "measured":
-                            vary(histoToUnfold)
-
-                        else:
-                            raise Exception("dont know what to do")
-
-                        newResponse = ROOT.RooUnfoldResponse(hmeas, htruth, hresponse, \
-                                                             "resp_{}_{}_{}".format(rawName, t,i)) 
-                        hRecoVaried = doUnfold(histoToUnfold, newResponse)[0]
-                        #print "TTT", hReco.Integral(), hRecoVaried.Integral()
-                        binv1 =  hRecoVaried.GetBinContent(1)
-                        if math.isnan(binv1) or math.isinf(binv1): 
-                            badToys += 1
-                            continue
-
-                        for ix in xrange(0, hRecoVaried.GetNbinsX()+2):
-                            binCenter = hRecoVaried.GetBinCenter(ix)
-                            val = hRecoVaried.GetBinContent(ix)
-                            if math.isnan(val) or math.isinf(val): 
-                                print "TOYmc Error: nan/inf value found"
-                                continue
-                            # what to do??
-                            profile.Fill(binCenter, val)
+                    toyResult = toyUnfolder.run(t, optionsReg["ntoys"], optionsReg["seed"])
+                    badToys += toyResult["badToys"]
 
                     #print "Var: ", variation
                     #rawName = "xsunfolded_" + variation+ c
@@ -360,12 +368,11 @@ def unfold(action, infileName):
                     hDown = hReco.Clone(rawNameDown)
                     for i in xrange(1, hReco.GetNbinsX()+1):
                         binc1 =  hReco.GetBinCenter(i)
-                        binc2 =  profile.GetBinCenter(i)
                         val1 =  hReco.GetBinContent(i)
-                        val2 =  profile.GetBinContent(i)
+                        val2 =  toyResult["mean"][i]
                         if val1 <= 0: continue
-                        errProf =  profile.GetBinError(i)
-                        print "binc: {} {}, vals ratio {}, error: {}".format(binc1, binc2, val1/val2, errProf/val1)
+                        errProf =  toyResult["meanError"][i]
+                        print "binc: {}, vals ratio {}, error: {}".format(binc1, val1/val2, errProf/val1)
                         hUp.SetBinContent(i, val1+errProf)
                         hDown.SetBinContent(i, val1-errProf)
 
@@ -443,6 +450,10 @@ def main():
     optionsReg["ntoys"]  = 1000
     optionsReg["unfNIter"]  = 3
     optionsReg["disableToys"]  = False
+    optionsReg["seed"]  = 1 # toy i is generated with seed (seed, i)
+    optionsReg["nWorkers"]  = None # None - number of cores
+    optionsReg["backend"]  = "RooUnfold"
+    optionsReg["backendTolerance"]  = 1e-6
     #optionsReg["disableToys"]  = True
     
     parser = OptionParser(usage="usage: %prog [options] filename",
@@ -450,6 +461,10 @@ def main():
 
     parser.add_option("-v", "--variant",   action="store", dest="variant", type="string", \
                                 help="choose analysis variant")
+    parser.add_option("-b", "--backend",   action="store", dest="backend", type="string", default="RooUnfold", \
+                                help="unfolding backend: RooUnfold (default) or numpy (checked against RooUnfold on every response)")
+    parser.add_option("-t", "--backendTolerance",   action="store", dest="backendTolerance", type="float", default=1e-6, \
+                                help="max. relative difference of numpy and RooUnfold backends (default 1e-6)")
 
 
 
@@ -458,6 +473,12 @@ def main():
         print "Provide analysis variant"
         sys.exit()
 
+    if options.backend not in ["RooUnfold", "numpy"]:
+        print "Unknown backend", options.backend
+        sys.exit()
+    optionsReg["backend"] = options.backend
+    optionsReg["backendTolerance"] = options.backendTolerance
+
     infileName = "plotsMNxs_{}.root".format(options.variant)
     odir = "~/tmp/unfolded_{}/".format(options.variant)
     os.system("mkdir -p "+odir)
@@ -1,59 +1,79 @@
 import ROOT
 import sys
 
+import numpy
+from CommonFSQFramework.Core.JetMatcher import deltaRMatrix
+
+# Trigger objects (jets) of a single collection. Objects of each event are
+# read once into arrays (sorted by pt, highest first): pt, eta, phi. Objects
+# matched to given offline objects (deltaR <= maxDR with any of them, matching
+# done on the deltaR matrix) are cached per event as well, the key is the
+# content (eta, phi) of the matching objects.
+#
+#   get(matchingObjects)       - list of trigger objects
+#   getArrays(matchingObjects) - (pt, eta, phi) arrays
 class TriggerObjectsGetter:
     def __init__(self, chain, collection, minPT=None, maxDR=0.8):
         self.run = -1
         self.ev = -1
-        self.trgMomenta = {}
+        self.cache = {}
         self.chain = chain
         self.collection = collection
         self.minPT = minPT
-        self.dr = ROOT.Math.VectorUtil.DeltaR
         self.maxDR = maxDR
 
-    def get(self, matchingObjects = None):
-        newEvent = False
+    def newEventIfNeeded(self):
         ev = self.chain.event
         run = self.chain.run
-        if self.ev != ev or self.run != run:
-            self.ev = ev
-            self.run = run
-            newEvent = True
-        if newEvent:
-            self.trgMomenta = {}
-
-        idnum = id(matchingObjects) 
-        if  idnum in self.trgMomenta:
-            return self.trgMomenta[idnum]
-
-        self.trgMomenta[idnum] = []
-        jets = getattr(self.chain, self.collection)
-        for j in jets:
-            if self.minPT != None and j.pt() < self.minPT: continue
-            isOK = True
-            if matchingObjects != None and self.maxDR > 0:
-                for m in matchingObjects:
-                    #print type(m)
-                    #sys.stdout.flush()
-                    #try:
-                    #    dr = self.dr(m, j)
-                    #except:
-                    #    dr = self.dr(m.p4(), j)
-                    dr = self.dr(m.p4(), j)
-                    if dr > self.maxDR: continue
-                    #print "XXX match", dr, m.eta(), m.phi(), j.eta(), j.phi()
-                    break 
-                else: # executed only if we dont hit break line above
-                    isOK = False
-
-            if isOK:
-                self.trgMomenta[idnum].append(j)
-            #else:
-            #    print "XXX no match"
-        
-        self.trgMomenta[idnum] = sorted(self.trgMomenta[idnum], reverse = True, key = lambda j: j.pt())
-        return self.trgMomenta[idnum]
+        if self.ev == ev and self.run == run:
+            return
+        self.ev = ev
+        self.run = run
+        self.cache = {}
+
+        objects = []
+        pt, eta, phi = [], [], []
+        for j in getattr(self.chain, self.collection):
+            jPt = j.pt()
+            if self.minPT != None and jPt < self.minPT: continue
+            objects.append(j)
+            pt.append(jPt)
+            eta.append(j.eta())
+            phi.append(j.phi())
+
+        pt = numpy.array(pt, dtype=numpy.float64)
+        order = numpy.argsort(-pt, kind="mergesort")
+        self.objects = [objects[i] for i in order]
+        self.arrays = (pt[order], numpy.array(eta, dtype=numpy.float64)[order], \
+                       numpy.array(phi, dtype=numpy.float64)[order])
+
+    # indices of objects surviving the matching
+    def getSelected(self, matchingObjects):
+        self.newEventIfNeeded()
+        if matchingObjects == None or self.maxDR <= 0:
+            key = None
+        else:
+            key = tuple((m.eta(), m.phi()) for m in matchingObjects)
+        if key in self.cache:
+            return self.cache[key]
+
+        pt, eta, phi = self.arrays
+        if key == None:
+            selected = numpy.arange(len(pt))
+        elif len(key) == 0 or len(pt) == 0:
+            selected = numpy.arange(0)
+        else:
+            dr = deltaRMatrix(eta, phi, [k[0] for k in key], [k[1] for k in key])
+            selected = numpy.nonzero((dr <= self.maxDR).any(axis=1))[0]
+        self.cache[key] = (selected, [self.objects[i] for i in selected], \
+                           tuple(a[selected] for a in self.arrays))
+        return self.cache[key]
+
+    def get(self, matchingObjects = None):
+        return self.getSelected(matchingObjects)[1]
+
+    def getArrays(self, matchingObjects = None):
+        return self.getSelected(matchingObjects)[2]
 
 class BaseTrigger:
 
@@ -70,6 +90,13 @@ class BaseTrigger:
         else:
             return twopi - diff
 
+    # same as dphi, for arrays
+    def dphiArray(self, p1, p2):
+        pi    = 3.141592654
+        twopi = 6.283185307
+        diff = numpy.abs(p1 - p2)
+        return numpy.where(diff < pi, diff, twopi - diff)
+
     def init(self):
         ''' initialization routine for derived classes '''
         pass
@@ -79,86 +106,58 @@ class BaseTrigger:
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
         return 0
 
+# Note: objects from getter are sorted by pt (highest first)
 class ForwardBackwardTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        bestF, bestB = (None, None)
-        for j in hltJets:
-            eta = j.eta()
-            if abs(eta) < 3.: continue
-            pt = j.pt()
-            if eta > 0:
-                if bestF == None or pt > bestF:
-                    bestF= pt
-            else:
-                if bestB == None or pt > bestB:
-                    bestB = pt
-
-        if None in [bestF, bestB]:
+        pt, eta, phi = self.objectsGetter.getArrays()
+        fwd = numpy.abs(eta) >= 3.
+        ptF = pt[fwd & (eta > 0)]
+        ptB = pt[fwd & (eta <= 0)]
+        if len(ptF) == 0 or len(ptB) == 0:
             return 0.
 
-        return min(bestF, bestB)
+        return min(ptF[0], ptB[0])
 
 
 class DoubldForwardTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        pts = []
-        for j in hltJets:
-            eta = j.eta()
-            if abs(eta) < 3.: continue
-            pts.append(j.pt())
-
+        pt, eta, phi = self.objectsGetter.getArrays()
+        pts = pt[numpy.abs(eta) >= 3.]
         if len(pts) < 2:
             return 0
 
-        return min(pts[:2])
+        return pts[1]
 
 
 class DoubleJetWithAtLeastOneCentralJetTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        jetsF = []
-        jetsC = []
-        for j in hltJets:
-            eta = j.eta()
-            cen = abs(eta) < 3.
-            fwd = abs(eta) > 3.
-            pt = j.pt()
-            if cen: jetsC.append(pt)
-            if fwd: jetsF.append(pt)
+        pt, eta, phi = self.objectsGetter.getArrays()
+        absEta = numpy.abs(eta)
+        jetsC = pt[absEta < 3.]
+        jetsF = pt[absEta > 3.]
         
         if len(jetsC) == 0 : return 0
         if len(jetsC) + len(jetsF) < 2 : return 0
         pt1 = jetsC[0]
-        jetsC.append(0) # Q&D way of making sure, we dont get out of range 
-        jetsF.append(0) #    when calculating pt2 below
-        pt2 = max(jetsC[1], jetsF[0])
+        pt2 = max(jetsC[1] if len(jetsC) > 1 else 0, jetsF[0] if len(jetsF) > 0 else 0)
         return min(pt1, pt2)
 
 class PTAveForHFJecTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        tag, probe = (None, None) 
-        for j in hltJets:
-            eta = abs(j.eta())
-            tagCand = eta < 1.4
-            probeCand = eta > 2.8 and eta < 5.2
-            if probeCand or tagCand:
-                pt = j.pt() 
-                if probeCand and (probe == None or probe < pt): probe = pt
-                if tagCand and (tag == None or tag < pt): tag = pt
-            
-        if None in [tag, probe]:
+        pt, eta, phi = self.objectsGetter.getArrays()
+        absEta = numpy.abs(eta)
+        tags = pt[absEta < 1.4]
+        probes = pt[(absEta > 2.8) & (absEta < 5.2)]
+        if len(tags) == 0 or len(probes) == 0:
             return 0.
-        return  (tag+probe)/2
+        return  (tags[0]+probes[0])/2
 
 
 class SingleJetTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        if len(hltJets) > 0:
-            return hltJets[0].pt()
+        pt, eta, phi = self.objectsGetter.getArrays()
+        if len(pt) > 0:
+            return pt[0]
         return 0
 
 
@@ -172,10 +171,10 @@ class SingleForwardJetTrigger(BaseTrigger):
         if topologyFullfillyingObjects != None and len(topologyFullfillyingObjects) != 1:
             raise Exception("Expected 1 good object, got " + str(len(topologyFullfillyingObjects)))
 
-        hltJets = self.objectsGetter.get(topologyFullfillyingObjects)
-        for j in hltJets:
-            if abs(j.eta() ) < self.etaLim: continue
-            return j.pt()
+        pt, eta, phi = self.objectsGetter.getArrays(topologyFullfillyingObjects)
+        pts = pt[numpy.abs(eta) >= self.etaLim]
+        if len(pts) > 0:
+            return pts[0]
         return 0
 
 
@@ -187,18 +186,22 @@ class SingleCentralJetTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
         if topologyFullfillyingObjects != None and len(topologyFullfillyingObjects) != 1:
             raise Exception("Expected 1 good object, got " + str(len(topologyFullfillyingObjects)))
-        hltJets = self.objectsGetter.get(topologyFullfillyingObjects)
-        #print "----"
-        for j in hltJets:
-            #print j.eta(), j.pt(), self.etaLim
-            #print "XXX", j.eta()
-            if abs(j.eta() ) > self.etaLim: 
-                #print "   skip"
-                continue
-            return j.pt()
+        pt, eta, phi = self.objectsGetter.getArrays(topologyFullfillyingObjects)
+        pts = pt[numpy.abs(eta) <= self.etaLim]
+        if len(pts) > 0:
+            return pts[0]
         return 0
 
 
+# tag-probe pairs: pt of the tag and probe jets of all pairs with dphi >= minDphi
+def getPairs(trigger, pt, eta, phi, isTag, isProbe, minDphi):
+    tags = numpy.nonzero(isTag)[0]
+    probes = numpy.nonzero(isProbe)[0]
+    t = numpy.repeat(tags, len(probes))
+    p = numpy.tile(probes, len(tags))
+    good = trigger.dphiArray(phi[t], phi[p]) >= minDphi
+    return pt[t[good]], pt[p[good]]
+
 class PTAveProperTrigger(BaseTrigger):
     def __init__(self, getter, etaTag = 1.4, etaProbeMin = 2.7, etaProbeMax = 10, minDphi = 2.5):
         BaseTrigger.__init__(self, getter)
@@ -211,96 +214,38 @@ class PTAveProperTrigger(BaseTrigger):
 
 
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        tags   =  []
-        probes = []
-        for j in hltJets:
-            if j.pt() < 10: continue
-            eta = abs(j.eta())
-            if eta < self.etaTag: 
-                tags.append(j)
-            elif eta > self.etaProbeMin and eta < self.etaProbeMax:
-                probes.append(j)
-
-        if not tags or not probes: return 0
-        bestAve = 0.
+        pt, eta, phi = self.objectsGetter.getArrays()
+        absEta = numpy.abs(eta)
+        good = pt >= 10
+        isTag = good & (absEta < self.etaTag)
+        isProbe = good & ~isTag & (absEta > self.etaProbeMin) & (absEta < self.etaProbeMax)
+
+        if not isTag.any() or not isProbe.any(): return 0
         self.bestTag = None
         self.bestProbe = None
-        for t in tags:
-            phiT = t.phi()
-            for p in probes:
-                phiP = p.phi()
-                if abs(self.dphi(phiT, phiP)) < self.minDphi:
-                    continue
-
-                pt1 = t.pt()
-                pt2 = p.pt()
-                ave = (pt1+pt2)/2.
-                if pt1 < ave/2:
-                    ave = 2*pt1
-                if pt2 < ave/2:
-                    ave = 2*pt2
-
-                if bestAve < ave: 
-                    bestAve = ave
-                    bestTag = t
-                    bestProbe = p
-
-        return bestAve
+        pt1, pt2 = getPairs(self, pt, eta, phi, isTag, isProbe, self.minDphi)
+        ave = (pt1+pt2)/2.
+        ave = numpy.where(pt1 < ave/2, 2*pt1, ave)
+        ave = numpy.where(pt2 < ave/2, 2*pt2, ave)
+        return max(0., ave.max()) if len(ave) else 0.
 
 
 class PTAveMessedTrigger(BaseTrigger):
     def getMaxThreshold(self, topologyFullfillyingObjects = None):
-        hltJets = self.objectsGetter.get()
-        tags = []
-        probes = []
-        
-        bestPTS = []
-        for j in hltJets:
-            if j.pt() < 10: continue
-            eta = abs(j.eta())
-            good = False
-            if eta < 1.4: 
-                tags.append(j)
-                bestPTS.append(j.pt())
-            elif eta > 2.7:
-                probes.append(j)
-                bestPTS.append(j.pt())
-
-        if not tags or not probes: # simply - require non empty lists
-            return 0
-
-        goodPairs = []
-        for t in tags:
-            phiT = t.phi()
-            #etaT = t.eta()
-            for p in probes:
-                phiP = p.phi()
-                if abs(self.dphi(phiT, phiP)) < 2.5:
-                    continue
-                #etaP = p.eta()
-                #if abs(etaT-etaP) < 1.3: continue
-                goodPairs.append([t, p])
-                
-        if not goodPairs: return 0
-
-        bestPTS = sorted(bestPTS, reverse=True)
-        ave = (bestPTS[0]+bestPTS[1])/2
-        bestAve = 0
-
-        for pair in goodPairs:
-            pt1 = pair[0].pt()
-            pt2 = pair[1].pt()
-            aveCand = ave
-            if pt1 < aveCand/2:
-                aveCand = 2*pt1
-            if pt2 < aveCand/2:
-                aveCand = 2*pt2
-            if bestAve < aveCand:
-               bestAve =  aveCand
-
-        return bestAve
-
+        pt, eta, phi = self.objectsGetter.getArrays()
+        absEta = numpy.abs(eta)
+        good = pt >= 10
+        isTag = good & (absEta < 1.4)
+        isProbe = good & ~isTag & (absEta > 2.7)
 
+        if not isTag.any() or not isProbe.any(): # simply - require non empty lists
+            return 0
 
+        pt1, pt2 = getPairs(self, pt, eta, phi, isTag, isProbe, 2.5)
+        if not len(pt1): return 0
 
+        bestPTS = pt[isTag | isProbe] # sorted by pt
+        ave = (bestPTS[0]+bestPTS[1])/2
+        aveCand = numpy.where(pt1 < ave/2, 2*pt1, ave)
+        aveCand = numpy.where(pt2 < aveCand/2, 2*pt2, aveCand)
+        return max(0, aveCand.max())
@@ -16,6 +16,7 @@ from array import *
 # you have to run this file from directory where it is saved
 
 import CommonFSQFramework.Core.ExampleProofReader 
+from CommonFSQFramework.Core.RateAccumulator import RateAccumulator
 
 import BaseTrigger
 
@@ -97,23 +98,17 @@ class HLTRate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
             self.histos[t][1].Sumw2()
             self.GetOutputList().Add(self.histos[t][1])
 
+        self.rateAccumulators = {}
+        for t in self.histos:
+            self.rateAccumulators[self.histos[t][1].GetName()] = RateAccumulator(self.histos[t][1])
+
     def genWeight(self):
         #print "ASDFASD", self.fChain.genWeight
         return self.fChain.genWeight*self.normFactor
 
+    # histogram is converted to rate in finalizeWhenMerged
     def fillRate(self, hist, maxThr, weight):
-        nbins = hist.GetNbinsX()
-        getBinCenter = hist.GetXaxis().GetBinCenter
-        for i in xrange(1,nbins+1):
-            #binCenter = int(getBinCenter(i))
-            binCenter = getBinCenter(i)
-
-            # As always "<=" is a tricky thing...
-            if binCenter < maxThr or abs(binCenter-maxThr) < 0.1:
-                hist.Fill(binCenter, weight)
-            else:
-                break
-        del getBinCenter
+        self.rateAccumulators[hist.GetName()].fill(maxThr, weight)
 
 
     def analyze(self):
@@ -140,6 +135,13 @@ class HLTRate(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
         for h in self.histos:
             self.histos[h][1].Scale(1/self.avgW)
 
+    def finalizeWhenMerged(self):
+        olist =  self.GetOutputList()
+        for o in olist:
+            if not "TH1" in o.ClassName(): continue
+            if o.GetName().endswith("_rate"):
+                RateAccumulator.integrate(o)
+
 if __name__ == "__main__":
     sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
     ROOT.gSystem.Load("libFWCoreFWLite.so")
@@ -16,6 +16,8 @@ from array import *
 # you have to run this file from directory where it is saved
 
 import CommonFSQFramework.Core.ExampleProofReader 
+from CommonFSQFramework.Core.PUWeights import PUWeights
+from CommonFSQFramework.Core.RateAccumulator import RateAccumulator
 
 import BaseTrigger
 
@@ -34,16 +36,16 @@ class RateSimple(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
         puFile = edm.FileInPath("CommonFSQFramework.Core/test/mnTrgAnalyzer/PUhists.root").fullPath()
         self.newlumiWeighters = {}
         '''
-        self.newlumiWeighters["flat2050toPU40"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU40/pileup")
-        self.newlumiWeighters["flat2050toPU30"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU30/pileup")
-        #self.newlumiWeighters["flat2050toPU25"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU25/pileup")
-        self.newlumiWeighters["flat2050toPU20"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU20/pileup")
-        self.newlumiWeighters["flat2050toPU15"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU15/pileup")
-        self.newlumiWeighters["flat2050toPU10"] = edm.LumiReWeighting(puFile, puFile, "Flat20to50/pileup", "PU10/pileup")
+        self.newlumiWeighters["flat2050toPU40"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU40/pileup")
+        self.newlumiWeighters["flat2050toPU30"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU30/pileup")
+        #self.newlumiWeighters["flat2050toPU25"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU25/pileup")
+        self.newlumiWeighters["flat2050toPU20"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU20/pileup")
+        self.newlumiWeighters["flat2050toPU15"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU15/pileup")
+        self.newlumiWeighters["flat2050toPU10"] = PUWeights.get(puFile, puFile, "Flat20to50/pileup", "PU10/pileup")
         #'''
-        #self.newlumiWeighters["flat010toPU10"] = edm.LumiReWeighting(puFile, puFile, "Flat0to10/pileup", "PU10/pileup")
-        #self.newlumiWeighters["flat010toPU1"] = edm.LumiReWeighting(puFile, puFile, "Flat0to10/pileup", "PU1/pileup")
-        #self.newlumiWeighters["PU20toPU20"] = edm.LumiReWeighting(puFile, puFile, "PU20/pileup", "PU20/pileup")
+        #self.newlumiWeighters["flat010toPU10"] = PUWeights.get(puFile, puFile, "Flat0to10/pileup", "PU10/pileup")
+        #self.newlumiWeighters["flat010toPU1"] = PUWeights.get(puFile, puFile, "Flat0to10/pileup", "PU1/pileup")
+        #self.newlumiWeighters["PU20toPU20"] = PUWeights.get(puFile, puFile, "PU20/pileup", "PU20/pileup")
 
 
         self.dists = {}
@@ -54,24 +56,13 @@ class RateSimple(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
             self.GetOutputList().Add(dist)
 
 
-    def fillRate(self, hist, maxThr, weight):
-        nbins = hist.GetNbinsX()
-
-
+        self.rateAccumulators = {}
+        for h in [self.dist] + self.dists.values():
+            self.rateAccumulators[h.GetName()] = RateAccumulator(h)
 
+    # histogram is converted to rate in finalizeWhenMerged
     def fillRate(self, hist, maxThr, weight):
-        nbins = hist.GetNbinsX()
-        getBinCenter = hist.GetXaxis().GetBinCenter
-        for i in xrange(1,nbins+1):
-            #binCenter = int(getBinCenter(i))
-            binCenter = getBinCenter(i)
-
-            # As always "<=" is a tricky thing...
-            if binCenter < maxThr or abs(binCenter-maxThr) < 0.1:
-                hist.Fill(binCenter, weight)
-            else:
-                break
-        del getBinCenter
+        self.rateAccumulators[hist.GetName()].fill(maxThr, weight)
 
     def single(self, jets, etaMin = None, etaMax = None):
         #bestJet = max(jets, key=lambda j: j.pt())
@@ -243,6 +234,7 @@ class RateSimple(CommonFSQFramework.Core.ExampleProofReader.ExampleProofReader):
 
         res = {}
         for t in todo:
+            RateAccumulator.integrate(histos[t])
             name =  histos[t].GetName()
             eff = histos[t].Clone(name+"_eff")
             eff.Scale(1./(eff.GetBinContent(1)))
@@ -7,6 +7,7 @@ from ROOT import *
 import os,re,sys,math
 
 import CommonFSQFramework.Core.Util
+import CommonFSQFramework.Core.DatasetLoader
 
 from array import array
 import resource
@@ -56,97 +57,39 @@ def main():
 
     sampleList=CommonFSQFramework.Core.Util.getAnaDefinition("sam")
 
-    f = ROOT.TFile(infile, "r")
-    lst = f.GetListOfKeys()
-    trees = {}
-    trees["MC_jet15"] = []
-    trees["data_jet15"] = []
-
     treeName = "dataFit"
+    loader = CommonFSQFramework.Core.DatasetLoader.DatasetLoader(infile, treeName, cacheSelections=True)
+    samples = {}
+    samples["MC_jet15"] = []
 
-    for l in lst:
-        print "Going through", l.GetName(), l.ClassName()
-        currentDir = l.ReadObj()
-
-        if not currentDir:
-            print "Problem reading", l.GetName(), " - skipping"
-            continue
-
-        if type(currentDir) != ROOT.TDirectoryFile:
-            print "Expected TDirectoryFile,", type(currentDir), "found"
-            continue
-
-        sampleName = l.GetName()
+    for sampleName in loader.getSamples():
         if sampleName not in sampleList:
             raise Exception("Thats confusing...")
-        tree = currentDir.Get(treeName)
-        trees["MC_jet15"].append(tree)
-
-        print sampleName, tree.GetEntries()
-
-        #print d
-
+        samples["MC_jet15"].append(sampleName)
 
-    dummyFile = ROOT.TFile("/tmp/dummy.root", "recreate")
-    if len(trees["data_jet15"]) == 0:
-            print "Cleaning data (no sample found)"
-            del trees["data_jet15"]
+        print sampleName, loader.getEntries(sampleName)
 
-    for t in trees:
-        tlist = ROOT.TList()
-        if len(trees[t]) == 1 and False:
-            trees[t] = trees[t][0]
-        else:
-            for tree in trees[t]:
-                tlist.Add(tree)
-            trees[t] =  ROOT.TTree.MergeTrees(tlist)
-            print "data tree after merge: ", trees[t].GetEntries()
+    etas = [-0.2, 0.2]
 
+    # loose version of the cuts used in the fits below (all eta bins). Only
+    # entries passing it are loaded (entry lists cached between runs, see
+    # DatasetLoader)
+    preselection = "ptRaw > 15 && ptRaw < 1000 && eta >"+str(etas[0])+" && eta <"+str(etas[-1])
 
     vars = {} # note: we whave to save the variables outside the loop, otherwise they get
               #       garbage collected by python leading to a crash
 
     ds = {}
 
-    variations = set()
-
-
-    for t in trees:
+    for t in samples:
         print "RooDataset:",t
-        vars[t] = {}
-        tree = trees[t]
-        observables = ROOT.RooArgSet()
-        print "  min/max"
-        for b in tree.GetListOfBranches():
-            name =  b.GetName()
-            #print "YYY", name
-            if name != "weight":
-                spl = name.split("_")
-                if len(spl) > 1:
-                    variation = name.split("_")[-1]
-                    variations.add(variation)
-                else:
-                    print "Not a variation, skip:", name
-
-            rmin = tree.GetMinimum(name)
-            rmax = tree.GetMaximum(name)
-            rmin = rmin-abs(rmin/100.)
-            rmax = rmax+abs(rmin/100.)
-            #print name, rmin, rmax
-            roovar = ROOT.RooRealVar( name, name, rmin, rmax, "")
-            vars[t][name] = roovar
-            #print "Creating variable", name, type(roovar)
-            sys.stdout.flush()
-            observables.add(roovar)
-        #importCMD = RooFit.Import(tree)
-        #cutCMD = RooFit.Cut(preselectionString)
         print "  create dataset..."
         if weight:
             print "     ...weight", weight
-            ds[t] = ROOT.RooDataSet(t, t, tree, observables, "", weight)
+            ds[t], vars[t] = loader.getDataset(t, samples[t], weight, preselection)
         else:
             print "     ...no weight"
-            ds[t] = ROOT.RooDataSet(t, t, tree, observables)
+            ds[t], vars[t] = loader.getDataset(t, samples[t], cut=preselection)
         print "        ...done"
 
         print "Dataset:", t, ds[t].numEntries()
@@ -168,8 +111,6 @@ def main():
     ROOT.gROOT.ProcessLine(".L fit.cxx+")
     # http://root.cern.ch/root/html/tutorials/roofit/rf609_xychi2fit.C.html
 
-    etas = [-0.2, 0.2]
-
     for t in ds:
         if t == "data_jet15": continue
         for i in xrange(len(etas)-1):
@@ -7,6 +7,7 @@ from ROOT import *
 import os,re,sys,math
 
 import CommonFSQFramework.Core.Util
+import CommonFSQFramework.Core.DatasetLoader
 
 from array import array
 import resource
@@ -144,76 +145,32 @@ def main():
 
     sampleList=CommonFSQFramework.Core.Util.getAnaDefinition("sam")
 
-    f = ROOT.TFile(infile, "r")
-    lst = f.GetListOfKeys()
-    trees = {}
-    trees["MC_jet15"] = []
-    trees["data_jet15"] = []
+    loader = CommonFSQFramework.Core.DatasetLoader.DatasetLoader(infile, cacheSelections=True)
+    samples = {}
+    samples["MC_jet15"] = []
+    samples["data_jet15"] = []
 
     samplesData = ["Jet-Run2010B-Apr21ReReco-v1", "JetMETTau-Run2010A-Apr21ReReco-v1", "JetMET-Run2010A-Apr21ReReco-v1"]
 
-    for l in lst:
-        #print "Going through", l.GetName(), l.ClassName()
-        currentDir = l.ReadObj()
-
-        if not currentDir:
-            print "Problem reading", l.GetName(), " - skipping"
-            continue
-
-        if type(currentDir) != ROOT.TDirectoryFile:
-            print "Expected TDirectoryFile,", type(currentDir), "found"
-            continue
-
-        sampleName = l.GetName()
+    for sampleName in loader.getSamples():
         if sampleName not in sampleList:
             raise Exception("Thats confusing...")
-        tree = currentDir.Get("data")
         isData = sampleList[sampleName]["isData"]
         if isData:
             if sampleName in samplesData:
-                #tree.SetDirectory(0)
-                trees["data_jet15"].append(tree)
-                
+                samples["data_jet15"].append(sampleName)
         else:
-            #tree.SetDirectory(0)
-            trees["MC_jet15"].append(tree)
-
-        print sampleName, tree.GetEntries()
+            samples["MC_jet15"].append(sampleName)
 
-        #print d
+        print sampleName, loader.getEntries(sampleName)
 
-    dummyFile = ROOT.TFile("/tmp/dummy.root", "recreate")
-    if len(trees["data_jet15"]) == 0:
+    if len(samples["data_jet15"]) == 0:
             print "Cleaning data (no sample found)"
-            del trees["data_jet15"]
-
-    for t in trees:
-        tlist = ROOT.TList()
-        if len(trees[t]) == 1 and False:
-            trees[t] = trees[t][0]
-        else:
-            for tree in trees[t]:
-                tlist.Add(tree)
-            trees[t] =  ROOT.TTree.MergeTrees(tlist)
-            print "data tree after merge: ", trees[t].GetEntries()
-
-
-    vars = {} # note: we whave to save the variables outside the loop, otherwise they get
-              #       garbage collected by python leading to a crash
-
-    ds = {}
+            del samples["data_jet15"]
 
     variations = set()
-
-
-    for t in trees:
-        print "RooDataset:",t
-        vars[t] = {}
-        tree = trees[t]
-        observables = ROOT.RooArgSet()
-        print "  min/max"
-        for b in tree.GetListOfBranches():
-            name =  b.GetName()
+    for t in samples:
+        for name in loader.getBranches(samples[t]):
             if name != "weight":
                 spl = name.split("_")
                 if len(spl) > 1:
@@ -222,34 +179,15 @@ def main():
                 else:
                     print "Not a variation, skip:", name
 
-            rmin = tree.GetMinimum(name)
-            rmax = tree.GetMaximum(name)
-            rmin = rmin-abs(rmin/100.)
-            rmax = rmax+abs(rmin/100.)
-            #print name, rmin, rmax
-            roovar = ROOT.RooRealVar( name, name, rmin, rmax, "")
-            vars[t][name] = roovar
-            print "Creating variable", name, type(roovar)
-            sys.stdout.flush()
-            observables.add(roovar)
-        #importCMD = RooFit.Import(tree)
-        #cutCMD = RooFit.Cut(preselectionString)
-        print "  create dataset...", weight
-        #ds[t] = ROOT.RooDataSet(t, t, tree, observables, "weight < 100", weight)
-        ds[t] = ROOT.RooDataSet(t, t, tree, observables,  "", weight)
-        print "        ...done"
-
-        print "Dataset:", t, ds[t].numEntries()
-
     if "central" not in variations:
         raise Exception("Central value not found!")
 
-
     #etaRanges = []
     #etaRanges.extend([0.001, 0.201, 0.401, 0.601, 0.801, 1.001, 1.201])
     #etaRanges.extend([1.401, 1.701, 2.001, 2.322, 2.411, 2.601, 2.801, 3.001, 3.201, 3.501, 3.801, 4.101, 4.701])
     #etaRanges.extend([2.801, 3.001, 3.201, 3.501, 3.801, 4.101, 4.401, 4.701, 5.001])
     #etaRanges.extend([4.101, 4.701])
+
     #minPt = 60
     #maxPt = 70
     #maxPt = 100
@@ -264,6 +202,54 @@ def main():
     #minPt = 30
     #maxPt = 40
 
+    cutsBase = {}
+    for v in variations:
+        def vary(x, v=v):
+            return x + "_" + v
+
+        cutBase =  vary("ptRec") + " > " + str(minPt)
+        cutBase =  vary("ptRec") + " < " + str(maxPt)
+        #cutBase += " && " + vary("jetType") +  " < 4.5 "
+        cutBase += " && " + vary("jetType") +  " < -3.5 "
+        cutBase += " && " + vary("jetType") +  " > -4.5 "
+        #cutBase += " && " + " PU < 10.5"
+        #cutBase += " && " + " PU > 9.5"
+        #cutBase += " && " + " PU < 0.5"
+        #cut += " && " + vary("balance") + " > " + str(-1)
+        #cut += " && " + vary("balance") + " < " + str(1)
+        cutBase += "&&" + vary("hlt2recRatio") + " < 2."
+        cutBase += "&&" + vary("hlt2recRatio") + " > 0.01"
+        if options.cutExtra != None:
+            cutBase += " && " +  options.cutExtra
+        cutsBase[v] = cutBase
+
+    vars = {} # note: we whave to save the variables outside the loop, otherwise they get
+              #       garbage collected by python leading to a crash
+
+    ds = {}
+
+    for t in samples:
+        # only entries passing cutBase of any of the variations are loaded
+        # (entry lists cached between runs, see DatasetLoader)
+        if t == "data_jet15":
+            preselection = cutsBase["central"]
+        else:
+            preselection = " || ".join(["(" + cutsBase[v] + ")" for v in sorted(variations)])
+        print "RooDataset:",t
+        print "  create dataset...", weight
+        #ds[t] = ROOT.RooDataSet(t, t, tree, observables, "weight < 100", weight)
+        ds[t], vars[t] = loader.getDataset(t, samples[t], weight, preselection)
+        print "        ...done"
+
+        print "Dataset:", t, ds[t].numEntries()
+
+
+    #etaRanges = []
+    #etaRanges.extend([0.001, 0.201, 0.401, 0.601, 0.801, 1.001, 1.201])
+    #etaRanges.extend([1.401, 1.701, 2.001, 2.322, 2.411, 2.601, 2.801, 3.001, 3.201, 3.501, 3.801, 4.101, 4.701])
+    #etaRanges.extend([2.801, 3.001, 3.201, 3.501, 3.801, 4.101, 4.401, 4.701, 5.001])
+    #etaRanges.extend([4.101, 4.701])
+
     curPath = ROOT.gDirectory.GetPath()
     of = ROOT.TFile(odir+"mcresHistos.root","RECREATE")
     outputHistos = {}
@@ -283,22 +269,7 @@ def main():
 
             myThreads = []
             results = []
-            cutBase =  vary("ptRec") + " > " + str(minPt)
-            cutBase =  vary("ptRec") + " < " + str(maxPt)
-            #cutBase += " && " + vary("jetType") +  " < 4.5 "
-            cutBase += " && " + vary("jetType") +  " < -3.5 "
-            cutBase += " && " + vary("jetType") +  " > -4.5 "
-            #cutBase += " && " + " PU < 10.5"
-            #cutBase += " && " + " PU > 9.5"
-            #cutBase += " && " + " PU < 0.5"
-            #cut += " && " + vary("balance") + " > " + str(-1)
-            #cut += " && " + vary("balance") + " < " + str(1)
-            cutBase += "&&" + vary("hlt2recRatio") + " < 2."
-            cutBase += "&&" + vary("hlt2recRatio") + " > 0.01"
-            if options.cutExtra != None:
-                cutBase += " && " +  options.cutExtra
-            
-
+            cutBase = cutsBase[v]
 
             cutFor2d = cutBase + " && " + vary("hlt2recRatio") + " < 2."
             print "XXXA"
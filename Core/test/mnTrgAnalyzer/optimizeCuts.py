@@ -7,6 +7,9 @@ from ROOT import *
 import os,re,sys,math
 
 import CommonFSQFramework.Core.Util
+import CommonFSQFramework.Core.DatasetLoader
+
+import numpy
 
 from array import array
 import resource
@@ -17,6 +20,79 @@ from optparse import OptionParser
 import CommonFSQFramework.Core.Style
 
 
+# Efficiency vs threshold for cut templates of the form used below, i.e.
+# terms "variable > YYY" or "variable > YYY/N" joined with && or || (no
+# parentheses). For such a template every event has a "maximum passing
+# threshold" (score): event passes the cut with YYY=x if x < score
+#   && - minimum of the terms, || - maximum of the terms
+# Scores of all events are calculated once from arrays read column-wise from
+# the trees (DatasetLoader.getArrays, same samples and preselection as the
+# dataset), the whole efficiency curve is then obtained from the
+# cumulative sum of weights of events ordered by score.
+class ThresholdScan:
+    termRe = re.compile(r"^\s*(\w+)\s*>\s*YYY\s*(?:/\s*([0-9.]+))?\s*$")
+
+    def __init__(self, loader, samples, templates, weight, cut = ""):
+        self.parsed = {}
+        names = set()
+        for t in templates:
+            p = self.parse(t)
+            if p == None:
+                continue
+            self.parsed[t] = p
+            for orTerm in p:
+                for name, factor in orTerm:
+                    names.add(name)
+        if weight != None:
+            names.add(weight)
+        self.arrays = loader.getArrays(samples, sorted(names), cut)
+        self.weight = weight
+
+    # returns list (||) of lists (&&) of (variable, factor) or None if
+    # template is not of the supported form
+    @classmethod
+    def parse(cls, template):
+        ret = []
+        for orPart in template.split("||"):
+            andTerms = []
+            for term in orPart.split("&&"):
+                m = cls.termRe.match(term)
+                if not m:
+                    return None
+                factor = 1.
+                if m.group(2) != None:
+                    factor = float(m.group(2))
+                andTerms.append((m.group(1), factor))
+            ret.append(andTerms)
+        return ret
+
+    def canScan(self, template):
+        return template in self.parsed
+
+    def score(self, template):
+        orScores = []
+        for andTerms in self.parsed[template]:
+            andScores = [self.arrays[name]*factor for name, factor in andTerms]
+            orScores.append(numpy.minimum.reduce(andScores))
+        return numpy.maximum.reduce(orScores)
+
+    # efficiency of candidate cut (for each of the points) wrt signal cut
+    def efficiencies(self, signalTemplate, signalPoint, candidateTemplate, points):
+        signal = self.score(signalTemplate) > signalPoint
+        candidate = self.score(candidateTemplate)[signal]
+        if self.weight != None:
+            w = self.arrays[self.weight][signal]
+        else:
+            w = numpy.ones(len(candidate))
+        numSignal = w.sum()
+
+        order = numpy.argsort(candidate, kind="mergesort")
+        sortedScores = candidate[order]
+        cumulative = numpy.concatenate(([0.], numpy.cumsum(w[order])))
+        # events with score <= x are rejected
+        rejected = cumulative[numpy.searchsorted(sortedScores, points, side="right")]
+        return numSignal, [float(numSignal-r)/numSignal for r in rejected]
+
 def main():
     CommonFSQFramework.Core.Style.setStyle()
 
@@ -110,59 +186,28 @@ def main():
 
     sampleList=CommonFSQFramework.Core.Util.getAnaDefinition("sam")
 
-    f = ROOT.TFile(infile, "r")
-    lst = f.GetListOfKeys()
-    trees = {}
-    trees["MC_jet15"] = []
-    trees["data_jet15"] = []
+    loader = CommonFSQFramework.Core.DatasetLoader.DatasetLoader(infile, cacheSelections=True)
+    samples = {}
+    samples["MC_jet15"] = []
+    samples["data_jet15"] = []
 
     samplesData = ["Jet-Run2010B-Apr21ReReco-v1", "JetMETTau-Run2010A-Apr21ReReco-v1", "JetMET-Run2010A-Apr21ReReco-v1"]
 
-    for l in lst:
-        #print "Going through", l.GetName(), l.ClassName()
-        currentDir = l.ReadObj()
-
-        if not currentDir:
-            print "Problem reading", l.GetName(), " - skipping"
-            continue
-
-        if type(currentDir) != ROOT.TDirectoryFile:
-            print "Expected TDirectoryFile,", type(currentDir), "found"
-            continue
-
-        sampleName = l.GetName()
+    for sampleName in loader.getSamples():
         if sampleName not in sampleList:
             raise Exception("Thats confusing...")
-        tree = currentDir.Get("data")
         isData = sampleList[sampleName]["isData"]
         if isData:
             if sampleName in samplesData:
-                #tree.SetDirectory(0)
-                trees["data_jet15"].append(tree)
-                
+                samples["data_jet15"].append(sampleName)
         else:
-            #tree.SetDirectory(0)
-            trees["MC_jet15"].append(tree)
-
-        print sampleName, tree.GetEntries()
+            samples["MC_jet15"].append(sampleName)
 
-        #print d
+        print sampleName, loader.getEntries(sampleName)
 
-    dummyFile = ROOT.TFile("/tmp/dummy.root", "recreate")
-    if len(trees["data_jet15"]) == 0:
+    if len(samples["data_jet15"]) == 0:
             print "Cleaning data (no sample found)"
-            del trees["data_jet15"]
-
-    for t in trees:
-        tlist = ROOT.TList()
-        if len(trees[t]) == 1 and False:
-            trees[t] = trees[t][0]
-        else:
-            for tree in trees[t]:
-                tlist.Add(tree)
-            trees[t] =  ROOT.TTree.MergeTrees(tlist)
-            print "data tree after merge: ", trees[t].GetEntries()
-
+            del samples["data_jet15"]
 
     vars = {} # note: we whave to save the variables outside the loop, otherwise they get
               #       garbage collected by python leading to a crash
@@ -172,15 +217,22 @@ def main():
     variations = set()
 
 
-    for t in trees:
+    # efficiencies are calculated wrt signal cuts - only entries passing any of
+    # those are needed (entry lists cached between runs, see DatasetLoader)
+    signalCuts = set()
+    for signalPointName in todo:
+        signalCuts.add(todo[signalPointName][2].replace("YYY", str(todo[signalPointName][0])))
+    preselection = " || ".join(["(" + c + ")" for c in sorted(signalCuts)])
+
+    for t in samples:
         print "RooDataset:",t
-        vars[t] = {}
-        tree = trees[t]
-        observables = ROOT.RooArgSet()
-        print "  min/max"
-        for b in tree.GetListOfBranches():
-            name =  b.GetName()
-            #print "YYY", name
+        print "  create dataset..."
+        ds[t], vars[t] = loader.getDataset(t, samples[t], weight, preselection)
+        print "        ...done"
+
+        print "Dataset:", t, ds[t].numEntries()
+
+        for name in vars[t]:
             if name != "weight":
                 spl = name.split("_")
                 if len(spl) > 1:
@@ -189,24 +241,6 @@ def main():
                 else:
                     print "Not a variation, skip:", name
 
-            rmin = tree.GetMinimum(name)
-            rmax = tree.GetMaximum(name)
-            rmin = rmin-abs(rmin/100.)
-            rmax = rmax+abs(rmin/100.)
-            #print name, rmin, rmax
-            roovar = ROOT.RooRealVar( name, name, rmin, rmax, "")
-            vars[t][name] = roovar
-            #print "Creating variable", name, type(roovar)
-            sys.stdout.flush()
-            observables.add(roovar)
-        #importCMD = RooFit.Import(tree)
-        #cutCMD = RooFit.Cut(preselectionString)
-        print "  create dataset..."
-        ds[t] = ROOT.RooDataSet(t, t, tree, observables, "", weight)
-        print "        ...done"
-
-        print "Dataset:", t, ds[t].numEntries()
-
     if "central" not in variations:
         raise Exception("Central value not found!")
 
@@ -218,6 +252,14 @@ def main():
     ROOT.gDirectory.cd(curPath)
 
     
+    templates = set()
+    for signalPointName in todo:
+        templates.add(todo[signalPointName][2])
+        templates.add(todo[signalPointName][3])
+    scans = {}
+    for t in ds:
+        scans[t] = ThresholdScan(loader, samples[t], templates, weight, preselection)
+
     for t in ds:
         for signalPointName in todo:
             signalPoint = todo[signalPointName][0]
@@ -228,24 +270,32 @@ def main():
 
             plotMinimum = todo[signalPointName][4]
 
-            signalCut = cutSignal.replace("YYY", str(signalPoint))
-            dsSignal = ds[t].reduce(signalCut)
-            numSignal =  dsSignal.sumEntries()
             print "-"*10
             print "Signal point", signalPointName
-            print " Entries", numSignal
 
             xVals = []
             yVals = []
-            for candidatePoint in pointsToTest:
-                candidateCut = cutToOptimize.replace("YYY",str(candidatePoint))
-                numAfterCandCut = dsSignal.sumEntries(candidateCut)
-                eff = float(numAfterCandCut)/numSignal
-                print "  cp:",candidatePoint, eff
-                xVals.append(candidatePoint)
-                yVals.append(eff)
-
-            del dsSignal
+            if scans[t].canScan(cutSignal) and scans[t].canScan(cutToOptimize):
+                numSignal, yVals = scans[t].efficiencies(cutSignal, signalPoint, cutToOptimize, pointsToTest)
+                xVals = list(pointsToTest)
+                print " Entries", numSignal
+                for candidatePoint, eff in zip(xVals, yVals):
+                    print "  cp:",candidatePoint, eff
+            else:
+                signalCut = cutSignal.replace("YYY", str(signalPoint))
+                dsSignal = ds[t].reduce(signalCut)
+                numSignal =  dsSignal.sumEntries()
+                print " Entries", numSignal
+
+                for candidatePoint in pointsToTest:
+                    candidateCut = cutToOptimize.replace("YYY",str(candidatePoint))
+                    numAfterCandCut = dsSignal.sumEntries(candidateCut)
+                    eff = float(numAfterCandCut)/numSignal
+                    print "  cp:",candidatePoint, eff
+                    xVals.append(candidatePoint)
+                    yVals.append(eff)
+
+                del dsSignal
 
             xArray = array('d', xVals)
             yArray = array('d', yVals)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+import itertools
+import unittest
+import numpy
+
+from JetMatcher import JetMatcher, deltaRMatrix
+
+# Compares JetMatcher (closest, greedy, optimal matching and matchPairs) with
+# plain loop references on random events. The optimal method needs scipy.
+#
+# Run with: python test_JetMatcher.py (or pytest)
+
+def closestLoop(dr, maxDR):
+    ret = []
+    for iReco in xrange(dr.shape[0]):
+        best = -1
+        for iGen in xrange(dr.shape[1]):
+            if best < 0 or dr[iReco, iGen] < dr[iReco, best]:
+                best = iGen
+        if best >= 0 and dr[iReco, best] >= maxDR:
+            best = -1
+        ret.append(best)
+    return ret
+
+# pairs taken one by one, smallest deltaR of still unused jets first
+def greedyLoop(dr, maxDR):
+    ret = [-1]*dr.shape[0]
+    usedGen = set()
+    while True:
+        best = None
+        for iReco in xrange(dr.shape[0]):
+            if ret[iReco] >= 0: continue
+            for iGen in xrange(dr.shape[1]):
+                if iGen in usedGen or dr[iReco, iGen] >= maxDR: continue
+                if best == None or dr[iReco, iGen] < dr[best]:
+                    best = (iReco, iGen)
+        if best == None:
+            return ret
+        ret[best[0]] = best[1]
+        usedGen.add(best[1])
+
+# (number of matches, sum of deltaR) of the best unique matching: as many
+# matches as possible, then smallest sum
+def optimalLoop(dr, maxDR):
+    nReco, nGen = dr.shape
+    best = (0, 0.)
+    for gens in itertools.permutations(range(nGen) + [-1]*nReco, nReco):
+        matched = [(r, g) for r, g in enumerate(gens) if g >= 0 and dr[r, g] < maxDR]
+        cand = (len(matched), sum(dr[r, g] for r, g in matched))
+        if cand[0] > best[0] or (cand[0] == best[0] and cand[1] < best[1]):
+            best = cand
+    return best
+
+# response filling of MNxsAnalyzerClean.analyze before matchPairs was used
+def responseLoop(recoToGen, recoPairs, genPairs, accept):
+    used = set()
+    fills, fakes = [], []
+    for p in recoPairs:
+        g1, g2 = recoToGen[p[0]], recoToGen[p[1]]
+        cand = (min(g1, g2), max(g1, g2))
+        if g1 >= 0 and g2 >= 0 and g1 != g2 and cand in genPairs and accept(p, cand) and cand not in used:
+            used.add(cand)
+            fills.append((p, cand))
+        else:
+            fakes.append(p)
+    misses = [p for p in genPairs if p not in used]
+    return fills, fakes, misses
+
+def randomEvent(rnd, nReco, nGen):
+    genEta = rnd.uniform(-2., 2., nGen)
+    genPhi = rnd.uniform(-numpy.pi, numpy.pi, nGen)
+    # reco jets close to some gen jets (also across phi = +-pi), some unmatched
+    recoEta = rnd.uniform(-2., 2., nReco)
+    recoPhi = rnd.uniform(-numpy.pi, numpy.pi, nReco)
+    for i in xrange(nReco):
+        if nGen and rnd.uniform() < 0.7:
+            g = rnd.randint(nGen)
+            recoEta[i] = genEta[g] + rnd.normal(0., 0.15)
+            recoPhi[i] = (genPhi[g] + rnd.normal(0., 0.15) + numpy.pi) % (2*numpy.pi) - numpy.pi
+    return recoEta, recoPhi, genEta, genPhi
+
+def haveScipy():
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        return False
+    return linear_sum_assignment != None
+
+class TestJetMatcher(unittest.TestCase):
+    def events(self, n, maxJets):
+        rnd = numpy.random.RandomState(3)
+        for i in xrange(n):
+            yield randomEvent(rnd, rnd.randint(0, maxJets+1), rnd.randint(0, maxJets+1))
+
+    def testDeltaR(self):
+        dr = deltaRMatrix([0., 1.], [3.1, 0.], [0.], [-3.1])
+        numpy.testing.assert_allclose(dr[:, 0], [2*numpy.pi - 6.2, numpy.hypot(1., 3.1)])
+
+    def testClosest(self):
+        matcher = JetMatcher(0.3, "closest")
+        for ev in self.events(300, 6):
+            self.assertEqual(matcher.match(*ev).tolist(), closestLoop(deltaRMatrix(*ev), 0.3))
+
+    def testGreedy(self):
+        matcher = JetMatcher(0.3, "greedy")
+        for ev in self.events(300, 6):
+            self.assertEqual(matcher.match(*ev).tolist(), greedyLoop(deltaRMatrix(*ev), 0.3))
+
+    @unittest.skipIf(not haveScipy(), "scipy not available")
+    def testOptimal(self):
+        matcher = JetMatcher(0.3, "optimal")
+        for ev in self.events(300, 4):
+            recoToGen = matcher.match(*ev)
+            dr = matcher.dr
+            matched = [(r, g) for r, g in enumerate(recoToGen.tolist()) if g >= 0]
+            self.assertTrue(all(dr[r, g] < 0.3 for r, g in matched))
+            self.assertEqual(len(set(g for r, g in matched)), len(matched))
+            expected = optimalLoop(dr, 0.3)
+            self.assertEqual(len(matched), expected[0])
+            self.assertAlmostEqual(sum(dr[r, g] for r, g in matched), expected[1])
+
+    def testUnknownMethod(self):
+        self.assertRaises(Exception, JetMatcher, 0.3, "best")
+
+    def testMatchPairs(self):
+        matcher = JetMatcher()
+        recoToGen = [1, 0, 0, -1, 2]
+        fills, fakes, misses = matcher.matchPairs(recoToGen,
+                                                  [(0, 1), (0, 2), (1, 2), (0, 3), (2, 4)],
+                                                  [(1, 0), (0, 1), (0, 2), (1, 2)])
+        # (0, 2) - gen pair already used, (1, 2) - same gen jet, (0, 3) - no match
+        self.assertEqual(fills, [((0, 1), (0, 1)), ((2, 4), (0, 2))])
+        self.assertEqual(fakes, [(0, 2), (1, 2), (0, 3)])
+        self.assertEqual(misses, [(1, 2)])
+
+        fills, fakes, misses = matcher.matchPairs(recoToGen, [(0, 1), (2, 4)], [(0, 1), (0, 2)],
+                                                  lambda recoPair, genPair: genPair != (0, 1))
+        self.assertEqual(fills, [((2, 4), (0, 2))])
+        self.assertEqual(fakes, [(0, 1)])
+        self.assertEqual(misses, [(0, 1)])
+
+    def testMatchPairsRandom(self):
+        rnd = numpy.random.RandomState(5)
+        for method in ("closest", "greedy"):
+            matcher = JetMatcher(0.3, method)
+            for ev in self.events(300, 6):
+                recoToGen = matcher.match(*ev).tolist()
+                nReco, nGen = len(ev[0]), len(ev[2])
+                recoPairs = [p for p in itertools.combinations(range(nReco), 2) if rnd.uniform() < 0.8]
+                genPairs = [p for p in itertools.combinations(range(nGen), 2) if rnd.uniform() < 0.8]
+                rejected = set(p for p in genPairs if rnd.uniform() < 0.2)
+                accept = lambda recoPair, genPair: genPair not in rejected
+                self.assertEqual(matcher.matchPairs(recoToGen, recoPairs, genPairs, accept),
+                                 responseLoop(recoToGen, recoPairs, genPairs, accept))
+
+if __name__ == "__main__":
+    unittest.main()